@@ -34,6 +34,8 @@ config.read(config_path)
 scripts_dir = os.path.join(script_dir, 'scripts')
 sys.path.append(scripts_dir)
 
+from db import close_thread_connections
+
 def get_absolute_path(path):
     if not os.path.isabs(path):
         return os.path.normpath(os.path.join(script_dir, path))
@@ -44,9 +46,12 @@ SLEEP_GET_CHANNELS = int(config.get('Automation', 'sleep_get_channels'))
 SLEEP_AUTOFEE = int(config.get('Automation', 'sleep_autofee'))
 SLEEP_GET_CLOSED_CHANNELS = int(config.get('Automation', 'sleep_get_closed_channels'))
 SLEEP_REBALANCER = int(config.get('Automation', 'sleep_rebalancer'))
-SLEEP_CLOSECHANNEL = int(config.get('Automation', 'sleep_closechannel'))
+SLEEP_CLOSE_FEE_WINDOW = int(config.get('Automation', 'sleep_close_fee_window', fallback=900))
 SLEEP_MAGMAFLOW = int(config.get('Automation', 'sleep_magmaflow'))
 SLEEP_HTLC_SCAN = int(config.get('Automation', 'sleep_htlc_scan'))
+SLEEP_EXPORT = int(config.get('Automation', 'sleep_export', fallback=3600))
+SLEEP_LNDG_MIRROR = int(config.get('Automation', 'sleep_lndg_mirror', fallback=300))
+SLEEP_LND_SOURCE = int(config.get('Automation', 'sleep_lnd_source', fallback=300))
 
 GET_CHANNELS_SCRIPT = get_absolute_path(config.get('Paths', 'get_channels_script'))
 AUTO_FEE_SCRIPT = get_absolute_path(config.get('Paths', 'autofee_script'))
@@ -57,6 +62,9 @@ CLOSE_CHANNEL_SCRIPT = get_absolute_path(config.get('Paths', 'close_channel_scri
 SWAP_OUT_SCRIPT = get_absolute_path(config.get('Paths', 'swap_out_script'))
 MAGMAFLOW_SCRIPT = get_absolute_path(config.get('Paths', 'magmaflow_script'))
 HTLC_SCAN_SCRIPT = get_absolute_path(config.get('Paths', 'htlc_scan_script'))
+EXPORT_SCRIPT = get_absolute_path(config.get('Paths', 'export_script', fallback='scripts/export.py'))
+LNDG_MIRROR_SCRIPT = get_absolute_path(config.get('Paths', 'lndg_mirror_script', fallback='scripts/lndg_mirror.py'))
+LND_SOURCE_SCRIPT = get_absolute_path(config.get('Paths', 'lnd_source_script', fallback='scripts/lnd_source.py'))
 
 ENABLE_AUTOFEE = config.getboolean('Control', 'enable_autofee')
 ENABLE_AUTOFEE_V2 = config.getboolean('Control', 'enable_autofee_v2')
@@ -66,6 +74,9 @@ ENABLE_CLOSE_CHANNEL = config.getboolean('Control', 'enable_close_channel')
 ENABLE_SWAP_OUT = config.getboolean('Control', 'enable_swap_out')
 ENABLE_MAGMAFLOW = config.getboolean('Control', 'enable_magmaflow')
 ENABLE_HTLC_SCAN = config.getboolean('Control', 'enable_htlc_scan')
+ENABLE_EXPORT = config.getboolean('Control', 'enable_export', fallback=False)
+ENABLE_LNDG_MIRROR = config.getboolean('Control', 'enable_lndg_mirror', fallback=False)
+DATA_SOURCE = config.get('Data_source', 'backend', fallback='lndg')
 
 db_lock = threading.Lock()
 
@@ -79,15 +90,19 @@ def import_main_function(script_path):
         raise
 
 def run_script_independently(main_function, sleep_time, script):
-    while True:
-        try:
-            with db_lock:
-                logging.info(f"Running {main_function.__name__} from {script}")
-                main_function()
-                logging.info(f"{main_function.__name__} executed successfully")
-        except Exception as e:
-            logging.error(f"Error executing {main_function.__name__}: {e}")
-        time.sleep(sleep_time)
+    # The pooled database connections are kept across runs of a job and closed when its thread exits.
+    try:
+        while True:
+            try:
+                with db_lock:
+                    logging.info(f"Running {main_function.__name__} from {script}")
+                    main_function()
+                    logging.info(f"{main_function.__name__} executed successfully")
+            except Exception as e:
+                logging.error(f"Error executing {main_function.__name__}: {e}")
+            time.sleep(sleep_time)
+    finally:
+        close_thread_connections()
 
 def run_swap_out(swap_out_main):
     try:
@@ -96,11 +111,27 @@ def run_swap_out(swap_out_main):
         logging.info(f"{swap_out_main.__name__} executed successfully")
     except Exception as e:
         logging.error(f"Error executing {swap_out_main.__name__}: {e}")
+    finally:
+        close_thread_connections()
 
 def main():
     threads = []
 
     try:
+        # The data source jobs start first so their initial sync takes db_lock before the jobs that read it.
+        if DATA_SOURCE == 'lnd':
+            logging.info("Starting lnd_source")
+            lnd_source_main = import_main_function(LND_SOURCE_SCRIPT)
+            thread11 = threading.Thread(target=run_script_independently, args=(lnd_source_main, SLEEP_LND_SOURCE, LND_SOURCE_SCRIPT))
+            threads.append(thread11)
+            thread11.start()
+        elif ENABLE_LNDG_MIRROR:
+            logging.info("Starting lndg_mirror")
+            lndg_mirror_main = import_main_function(LNDG_MIRROR_SCRIPT)
+            thread10 = threading.Thread(target=run_script_independently, args=(lndg_mirror_main, SLEEP_LNDG_MIRROR, LNDG_MIRROR_SCRIPT))
+            threads.append(thread10)
+            thread10.start()
+
         logging.info("Starting get_channels")
         get_channels_main = import_main_function(GET_CHANNELS_SCRIPT)
         thread1 = threading.Thread(target=run_script_independently, args=(get_channels_main, SLEEP_GET_CHANNELS, GET_CHANNELS_SCRIPT))
@@ -138,7 +169,7 @@ def main():
         if ENABLE_CLOSE_CHANNEL:
             logging.info("Starting close_channel")
             close_channel_main = import_main_function(CLOSE_CHANNEL_SCRIPT)
-            thread5 = threading.Thread(target=run_script_independently, args=(close_channel_main, SLEEP_CLOSECHANNEL, CLOSE_CHANNEL_SCRIPT))
+            thread5 = threading.Thread(target=run_script_independently, args=(close_channel_main, SLEEP_CLOSE_FEE_WINDOW, CLOSE_CHANNEL_SCRIPT))
             threads.append(thread5)
             thread5.start()
 
@@ -163,6 +194,13 @@ def main():
             threads.append(thread8)
             thread8.start()
 
+        if ENABLE_EXPORT:
+            logging.info("Starting export")
+            export_main = import_main_function(EXPORT_SCRIPT)
+            thread9 = threading.Thread(target=run_script_independently, args=(export_main, SLEEP_EXPORT, EXPORT_SCRIPT))
+            threads.append(thread9)
+            thread9.start()
+
         for thread in threads:
             thread.join()
 
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import base64
+import sqlite3
+import threading
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from generate import block_time
+
+class FakeBackend:
+    """Answers the LND REST and mempool.space calls the benchmarked jobs make, from a generated dataset."""
+
+    def __init__(self, lndg_path, params, latency=0.0):
+        self.anchor = params['anchor']
+        self.tip_height = params['tip_height']
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+        conn = sqlite3.connect(f"file:{lndg_path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        self.closures = [dict(row) for row in conn.execute("SELECT * FROM gui_closures")]
+        # The chan_id encodes the funding block, and gui_closures has the closing block: both map to a block time.
+        self.tx_times = {row[0]: block_time(self.anchor, int(row[1]) >> 40)
+                         for row in conn.execute("SELECT funding_txid, chan_id FROM gui_channels")}
+        self.tx_times.update({row['closing_tx']: block_time(self.anchor, row['close_height']) for row in self.closures})
+        conn.close()
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+    def take_calls(self):
+        with self.lock:
+            calls, self.calls = dict(self.calls), Counter()
+        return calls
+
+    def get_info(self, query):
+        return {'alias': 'benchmark', 'identity_pubkey': '02' + '00' * 32, 'block_height': self.tip_height, 'synced_to_chain': True}
+
+    def closed_channels(self, query):
+        return {'channels': [{
+            'chan_id': row['chan_id'], 'channel_point': f"{row['funding_txid']}:{row['funding_index']}",
+            'closing_tx_hash': row['closing_tx'], 'remote_pubkey': row['remote_pubkey'], 'capacity': str(row['capacity']),
+            'close_height': row['close_height'], 'settled_balance': str(row['settled_balance']), 'time_locked_balance': '0',
+            'close_type': 'COOPERATIVE_CLOSE', 'open_initiator': 'INITIATOR_LOCAL', 'close_initiator': 'INITIATOR_REMOTE',
+        } for row in self.closures]}
+
+    def block_hash(self, query):
+        return {'block_hash': f"{int(query['block_height']):064x}"}
+
+    def block_header(self, query):
+        height = int(query['block_hash'], 16)
+        # Only the timestamp (little-endian uint32 at offset 68 of the 80-byte header) is read by the jobs.
+        header = bytes(68) + block_time(self.anchor, height).to_bytes(4, 'little') + bytes(8)
+        return {'raw_block_header': base64.b64encode(header).decode()}
+
+    def mempool_tx(self, tx):
+        block = self.tx_times.get(tx)
+        if block is None:
+            return None
+        return {'txid': tx, 'status': {'confirmed': True, 'block_time': block}}
+
+    def handle(self, path, query):
+        routes = {
+            '/v1/getinfo': self.get_info,
+            '/v1/channels/closed': self.closed_channels,
+            '/v2/chainkit/blockhash': self.block_hash,
+            '/v2/chainkit/blockheader': self.block_header,
+        }
+        if path in routes:
+            self.count(path)
+            return routes[path](query)
+        # mempool_api_url_base ends in a slash and get_tx_time adds another one.
+        parts = [part for part in path.split('/') if part]
+        if parts[:2] == ['api', 'tx'] and len(parts) == 3:
+            self.count('/api/tx')
+            return self.mempool_tx(parts[2])
+        self.count(f"unhandled {path}")
+        return None
+
+def make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out as separate writes; without this every keep-alive response waits on a delayed ACK.
+        disable_nagle_algorithm = True
+
+        def reply(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            if backend.latency:
+                time.sleep(backend.latency)
+            result = backend.handle(url.path, query)
+            status = 200 if result is not None else 404
+            body = json.dumps(result if result is not None else {'error': {'message': 'not found', 'code': 5}}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = reply
+        do_POST = reply
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def start_server(backend):
+    """Serves backend on a free local port from a daemon thread; returns the server, whose base URL is server.url."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(backend))
+    server.daemon_threads = True
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+BOS_SCRIPT = """#!/bin/sh
+echo "$@" >> "{log}"
+"""
+
+def write_fake_bos(directory):
+    """Writes a bos stand-in that only logs its arguments; returns its path and the path of the log."""
+    path = os.path.join(directory, 'bos')
+    log = os.path.join(directory, 'bos_calls.log')
+    with open(path, 'w') as f:
+        f.write(BOS_SCRIPT.format(log=log))
+    os.chmod(path, 0o755)
+    return path, log
+
+def take_bos_calls(log):
+    try:
+        with open(log) as f:
+            count = sum(1 for _ in f)
+    except FileNotFoundError:
+        return 0
+    os.remove(log)
+    return count
@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+
+# The LNDg tables the jobs read, as LNDg (Django) creates them: no indexes beyond the primary keys.
+SCHEMA = """
+CREATE TABLE gui_channels (
+    chan_id varchar(20) NOT NULL PRIMARY KEY, remote_pubkey varchar(66) NOT NULL, funding_txid varchar(64) NOT NULL,
+    output_index integer NOT NULL, capacity bigint NOT NULL, local_balance bigint NOT NULL, remote_balance bigint NOT NULL,
+    unsettled_balance bigint NOT NULL, local_commit bigint NOT NULL, local_chan_reserve bigint NOT NULL, initiator bool NOT NULL,
+    alias varchar(32) NOT NULL, total_sent bigint NOT NULL, total_received bigint NOT NULL, private bool NOT NULL,
+    pending_outbound bigint NOT NULL, pending_inbound bigint NOT NULL, htlc_count integer NOT NULL,
+    local_base_fee integer NOT NULL, local_fee_rate integer NOT NULL, local_disabled bool NOT NULL, local_cltv integer NOT NULL,
+    local_min_htlc_msat bigint NOT NULL, local_max_htlc_msat bigint NOT NULL, remote_base_fee integer NOT NULL,
+    remote_fee_rate integer NOT NULL, remote_disabled bool NOT NULL, remote_cltv integer NOT NULL,
+    local_inbound_base_fee integer NOT NULL, local_inbound_fee_rate integer NOT NULL,
+    remote_inbound_base_fee integer NOT NULL, remote_inbound_fee_rate integer NOT NULL,
+    is_active bool NOT NULL, is_open bool NOT NULL, last_update datetime NOT NULL, short_chan_id varchar(20) NOT NULL,
+    push_amt bigint NOT NULL, close_address varchar(100) NOT NULL, notes text NOT NULL,
+    auto_rebalance bool NOT NULL, auto_fees bool NOT NULL
+);
+CREATE TABLE gui_forwards (
+    id integer NOT NULL PRIMARY KEY AUTOINCREMENT, forward_date datetime NOT NULL, chan_id_in varchar(20) NOT NULL,
+    chan_id_out varchar(20) NOT NULL, chan_in_alias varchar(32) NULL, chan_out_alias varchar(32) NULL,
+    amt_in_msat bigint NOT NULL, amt_out_msat bigint NOT NULL, fee real NOT NULL, inbound_fee real NOT NULL
+);
+CREATE TABLE gui_payments (
+    payment_hash varchar(64) NOT NULL PRIMARY KEY, creation_date datetime NOT NULL, value real NOT NULL, fee real NOT NULL,
+    status integer NOT NULL, "index" integer NOT NULL, chan_out varchar(20) NULL, chan_out_alias varchar(32) NULL,
+    keysend_preimage varchar(64) NULL, message varchar(255) NULL, cleaned bool NOT NULL, rebal_chan varchar(20) NULL
+);
+CREATE TABLE gui_closures (
+    id integer NOT NULL PRIMARY KEY AUTOINCREMENT, chan_id varchar(20) NOT NULL, funding_txid varchar(64) NOT NULL,
+    funding_index integer NOT NULL, closing_tx varchar(64) NOT NULL, remote_pubkey varchar(66) NOT NULL,
+    capacity bigint NOT NULL, close_height integer NOT NULL, settled_balance bigint NOT NULL,
+    time_locked_balance bigint NOT NULL, close_type integer NOT NULL, open_initiator integer NOT NULL,
+    close_initiator integer NOT NULL, resolution_count integer NOT NULL, closing_costs integer NOT NULL
+);
+CREATE TABLE gui_pendinghtlcs (
+    id integer NOT NULL PRIMARY KEY AUTOINCREMENT, chan_id varchar(20) NOT NULL, alias varchar(32) NOT NULL,
+    incoming bool NOT NULL, amount bigint NOT NULL, hash_lock varchar(64) NOT NULL, expiration_height integer NOT NULL,
+    forwarding_channel varchar(20) NOT NULL, forwarding_alias varchar(32) NOT NULL
+);
+CREATE TABLE gui_autofees (
+    id integer NOT NULL PRIMARY KEY AUTOINCREMENT, timestamp datetime NOT NULL, chan_id varchar(20) NOT NULL,
+    peer_alias varchar(32) NOT NULL, setting varchar(20) NOT NULL, old_value integer NOT NULL, new_value integer NOT NULL
+);
+"""
+
+# The chain tip at generation time. Block heights and times are tied together (one block every 600 seconds
+# before the tip), so the fake LND and mempool answer with the same dates the chan_ids encode.
+TIP_HEIGHT = 900000
+BLOCK_INTERVAL = 600
+BATCH_SIZE = 100000
+SPREAD = 365 * 86400
+
+def block_height(anchor, ts):
+    return TIP_HEIGHT - (anchor - ts) // BLOCK_INTERVAL
+
+def block_time(anchor, height):
+    return anchor - (TIP_HEIGHT - height) * BLOCK_INTERVAL
+
+def txid(seed, kind, number):
+    return hashlib.sha256(f"{seed}:{kind}:{number}".encode()).hexdigest()
+
+class DateFormatter:
+    # LNDg stores naive local datetimes with microseconds. Timestamps arrive in order, so each second is formatted once.
+    def __init__(self):
+        self.second = None
+        self.prefix = None
+
+    def __call__(self, ts):
+        second = int(ts)
+        if second != self.second:
+            self.second = second
+            self.prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+        return f"{self.prefix}.{int((ts - second) * 1000000):06d}"
+
+def make_channels(rng, seed, anchor, start, channels, closures):
+    result = []
+    for number in range(channels + closures):
+        closed = number >= channels
+        if closed:
+            opened = rng.randint(start - SPREAD, anchor - 30 * 86400)
+            closed_at = rng.randint(opened + 7 * 86400, anchor - 86400)
+        else:
+            # About one channel in twenty is younger than a week, so the new_channel tag is exercised too.
+            recent = rng.random() < 0.05
+            opened = rng.randint(anchor - 7 * 86400, anchor - 3600) if recent else rng.randint(start - SPREAD, anchor - 7 * 86400)
+            closed_at = None
+        height = block_height(anchor, opened)
+        capacity = rng.choice([1, 2, 3, 5, 10, 16]) * 1000000
+        local_balance = rng.randint(0, capacity)
+        result.append({
+            'chan_id': str((height << 40) | ((number + 1) << 16)),
+            'pubkey': '02' + hashlib.sha256(f"{seed}:peer:{number}".encode()).hexdigest(),
+            'funding_txid': txid(seed, 'funding', number),
+            'closing_tx': txid(seed, 'closing', number) if closed else None,
+            'alias': f"peer-{number}",
+            'capacity': capacity,
+            'local_balance': local_balance,
+            'fee_rate': rng.choice([0, 10, 50, 100, 250, 500, 800, 1200, 2000]),
+            'remote_fee_rate': rng.choice([0, 1, 10, 100, 500, 1000]),
+            'opened': opened,
+            'closed': closed_at,
+            # Heavy-tailed popularity: a few channels carry most of the forwards, as on real routing nodes.
+            'weight': rng.paretovariate(1.2),
+        })
+    return result
+
+def channel_rows(channels, anchor):
+    last_update = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(anchor))
+    for channel in channels:
+        capacity, local_balance = channel['capacity'], channel['local_balance']
+        yield (channel['chan_id'], channel['pubkey'], channel['funding_txid'], 0, capacity, local_balance,
+               max(capacity - local_balance - 1000, 0), 0, local_balance, capacity // 100, 1, channel['alias'], 0, 0, 0, 0, 0, 0,
+               1000, channel['fee_rate'], 0, 144, 1000, capacity * 990, 1000, channel['remote_fee_rate'], 0, 144,
+               0, 0, 0, 0, 1, int(channel['closed'] is None), last_update, '', 0, '', '', 0, 0)
+
+def closure_rows(channels, anchor):
+    for channel in channels:
+        if channel['closed'] is None:
+            continue
+        yield (channel['chan_id'], channel['funding_txid'], 0, channel['closing_tx'], channel['pubkey'], channel['capacity'],
+               block_height(anchor, channel['closed']), channel['local_balance'], 0, 1, 1, 2, 0, 0)
+
+def open_channels(channels, ts):
+    return [channel for channel in channels if channel['opened'] <= ts and (channel['closed'] is None or channel['closed'] > ts)]
+
+def forward_rows(rng, channels, start, days, forwards_per_day):
+    format_date = DateFormatter()
+    for day in range(days):
+        day_start = start + day * 86400
+        eligible = open_channels(channels, day_start + 43200)
+        if len(eligible) < 2:
+            continue
+        cum_weights = []
+        total = 0.0
+        for channel in eligible:
+            total += channel['weight']
+            cum_weights.append(total)
+        incoming = rng.choices(eligible, cum_weights=cum_weights, k=forwards_per_day)
+        outgoing = rng.choices(eligible, cum_weights=cum_weights, k=forwards_per_day)
+        offsets = sorted(rng.random() * 86400 for _ in range(forwards_per_day))
+        for position in range(forwards_per_day):
+            chan_in, chan_out = incoming[position], outgoing[position]
+            while chan_out is chan_in:
+                chan_out = rng.choice(eligible)
+            amt_out_msat = int(rng.lognormvariate(17.0, 1.6))
+            fee_msat = 1000 + amt_out_msat * chan_out['fee_rate'] // 1000000
+            yield (format_date(day_start + offsets[position]), chan_in['chan_id'], chan_out['chan_id'], chan_in['alias'],
+                   chan_out['alias'], amt_out_msat + fee_msat, amt_out_msat, fee_msat / 1000, 0.0)
+
+def payment_rows(rng, seed, channels, start, anchor, payments):
+    format_date = DateFormatter()
+    times = sorted(rng.uniform(start, anchor) for _ in range(payments))
+    eligible, eligible_day = None, None
+    for number, ts in enumerate(times):
+        day = int(ts - start) // 86400
+        if day != eligible_day:
+            eligible, eligible_day = open_channels(channels, ts), day
+        if len(eligible) < 2:
+            continue
+        chan_out, rebal_chan = rng.sample(eligible, 2)
+        # Most payments on a routing node are circular rebalances; the rest are plain payments.
+        rebalance = rng.random() < 0.7
+        if anchor - ts < 3600 and rng.random() < 0.2:
+            status = 1
+        else:
+            status = 2 if rng.random() < 0.85 else 3
+        value = rng.randint(10000, 2000000) if rebalance else rng.randint(100, 200000)
+        fee = value * rng.randint(10, 1500) / 1000000 if status == 2 else 0.0
+        yield (txid(seed, 'payment', number), format_date(ts), float(value), fee, status, number + 1, chan_out['chan_id'],
+               chan_out['alias'], None, None, 0, rebal_chan['chan_id'] if rebalance else None)
+
+def autofee_rows(rng, channels, start, anchor):
+    format_date = DateFormatter()
+    rows = []
+    for channel in channels:
+        if channel['closed'] is not None:
+            continue
+        for _ in range(rng.randint(0, 6)):
+            rows.append((rng.uniform(max(start, channel['opened']), anchor), channel))
+    rows.sort(key=lambda row: row[0])
+    for ts, channel in rows:
+        old_value = channel['fee_rate']
+        yield (format_date(ts), channel['chan_id'], channel['alias'], 'rate', old_value, max(old_value + rng.randint(-50, 50), 0))
+
+def pendinghtlc_rows(rng, seed, channels, anchor):
+    open_list = [channel for channel in channels if channel['closed'] is None]
+    for number in range(min(len(open_list), max(len(open_list) // 10, 1))):
+        channel = rng.choice(open_list)
+        yield (channel['chan_id'], channel['alias'], rng.random() < 0.5, rng.randint(1000, 500000),
+               txid(seed, 'htlc', number), TIP_HEIGHT + rng.randint(40, 2016), '', '')
+
+def insert(conn, table, columns, rows):
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    batch = []
+    count = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    conn.executemany(sql, batch)
+    return count + len(batch)
+
+CHANNEL_COLUMNS = ('chan_id', 'remote_pubkey', 'funding_txid', 'output_index', 'capacity', 'local_balance', 'remote_balance',
+                   'unsettled_balance', 'local_commit', 'local_chan_reserve', 'initiator', 'alias', 'total_sent',
+                   'total_received', 'private', 'pending_outbound', 'pending_inbound', 'htlc_count', 'local_base_fee',
+                   'local_fee_rate', 'local_disabled', 'local_cltv', 'local_min_htlc_msat', 'local_max_htlc_msat',
+                   'remote_base_fee', 'remote_fee_rate', 'remote_disabled', 'remote_cltv', 'local_inbound_base_fee',
+                   'local_inbound_fee_rate', 'remote_inbound_base_fee', 'remote_inbound_fee_rate', 'is_active', 'is_open',
+                   'last_update', 'short_chan_id', 'push_amt', 'close_address', 'notes', 'auto_rebalance', 'auto_fees')
+CLOSURE_COLUMNS = ('chan_id', 'funding_txid', 'funding_index', 'closing_tx', 'remote_pubkey', 'capacity', 'close_height',
+                   'settled_balance', 'time_locked_balance', 'close_type', 'open_initiator', 'close_initiator',
+                   'resolution_count', 'closing_costs')
+FORWARD_COLUMNS = ('forward_date', 'chan_id_in', 'chan_id_out', 'chan_in_alias', 'chan_out_alias', 'amt_in_msat',
+                   'amt_out_msat', 'fee', 'inbound_fee')
+PAYMENT_COLUMNS = ('payment_hash', 'creation_date', 'value', 'fee', 'status', '"index"', 'chan_out', 'chan_out_alias',
+                   'keysend_preimage', 'message', 'cleaned', 'rebal_chan')
+AUTOFEE_COLUMNS = ('timestamp', 'chan_id', 'peer_alias', 'setting', 'old_value', 'new_value')
+PENDINGHTLC_COLUMNS = ('chan_id', 'alias', 'incoming', 'amount', 'hash_lock', 'expiration_height', 'forwarding_channel',
+                       'forwarding_alias')
+
+def generate(path, channels=50, forwards_per_day=500, days=365, payments=20000, closures=10, seed=1):
+    """Writes a synthetic LNDg db.sqlite3 to path and its parameters to path + '.json'; returns those parameters."""
+    for suffix in ('', '-wal', '-shm', '.json'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    rng = random.Random(seed)
+    anchor = int(time.time())
+    start = anchor - days * 86400
+    channel_list = make_channels(rng, seed, anchor, start, channels, closures)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(path)
+    # A throwaway file: no journal and no fsync, the build is simply rerun if it fails.
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(SCHEMA)
+    counts = {
+        'gui_channels': insert(conn, 'gui_channels', CHANNEL_COLUMNS, channel_rows(channel_list, anchor)),
+        'gui_closures': insert(conn, 'gui_closures', CLOSURE_COLUMNS, closure_rows(channel_list, anchor)),
+        'gui_forwards': insert(conn, 'gui_forwards', FORWARD_COLUMNS, forward_rows(rng, channel_list, start, days, forwards_per_day)),
+        'gui_payments': insert(conn, 'gui_payments', PAYMENT_COLUMNS, payment_rows(rng, seed, channel_list, start, anchor, payments)),
+        'gui_autofees': insert(conn, 'gui_autofees', AUTOFEE_COLUMNS, autofee_rows(rng, channel_list, start, anchor)),
+        'gui_pendinghtlcs': insert(conn, 'gui_pendinghtlcs', PENDINGHTLC_COLUMNS, pendinghtlc_rows(rng, seed, channel_list, anchor)),
+    }
+    conn.commit()
+    # LNDg runs its database in WAL mode; the jobs open it read-only and expect the same.
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+    params = {
+        'channels': channels, 'forwards_per_day': forwards_per_day, 'days': days, 'payments': payments,
+        'closures': closures, 'seed': seed, 'anchor': anchor, 'tip_height': TIP_HEIGHT, 'rows': counts,
+        'build_seconds': round(time.perf_counter() - started, 3),
+    }
+    with open(path + '.json', 'w') as f:
+        json.dump(params, f, indent=2)
+    return params
+
+def load_params(path):
+    try:
+        with open(path + '.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic LNDg db.sqlite3 for the benchmarks.")
+    parser.add_argument('path', help="Where to write the database")
+    parser.add_argument('--channels', type=int, default=50, help="Open channels")
+    parser.add_argument('--closures', type=int, default=10, help="Closed channels, on top of the open ones")
+    parser.add_argument('--forwards-per-day', type=int, default=500)
+    parser.add_argument('--days', type=int, default=365, help="Days of forwarding and payment history")
+    parser.add_argument('--payments', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    params = generate(args.path, args.channels, args.forwards_per_day, args.days, args.payments, args.closures, args.seed)
+    print(json.dumps(params, indent=2))
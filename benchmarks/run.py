@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import resource
+import tempfile
+import functools
+import importlib
+import subprocess
+import configparser
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+# Scale points: 50, 500 and 5,000 open channels over a year of history; large is 10M forwards.
+PRESETS = {
+    'small': {'channels': 50, 'forwards_per_day': 500, 'days': 365, 'payments': 20000, 'closures': 10},
+    'medium': {'channels': 500, 'forwards_per_day': 5000, 'days': 365, 'payments': 100000, 'closures': 100},
+    'large': {'channels': 5000, 'forwards_per_day': 27400, 'days': 365, 'payments': 500000, 'closures': 1000},
+}
+# In the order automator.py runs them: autofee reads the tables get_channels_data writes.
+JOBS = ['get_channels_data', 'autofee_v2', 'get_closed_channels_data']
+# Plumbing, not stages: wrapping these would only add noise to every query.
+UNTIMED_MODULES = {'db', 'migrations', 'lnd_client'}
+
+def dataset_name(params):
+    return (f"{params['channels']}ch-{params['forwards_per_day']}fpd-{params['days']}d-"
+            f"{params['payments']}p-{params['closures']}c-s{params['seed']}")
+
+def ensure_dataset(data_dir, params, regenerate=False):
+    from generate import generate, load_params
+
+    path = os.path.join(data_dir, dataset_name(params), 'db.sqlite3')
+    existing = load_params(path)
+    if not regenerate and existing and os.path.exists(path):
+        return path, existing
+    print(f"Generating {dataset_name(params)} ...", flush=True)
+    generated = generate(path, params['channels'], params['forwards_per_day'], params['days'], params['payments'],
+                         params['closures'], params['seed'])
+    print(f"Generated {generated['rows']['gui_forwards']} forwards in {generated['build_seconds']}s.", flush=True)
+    return path, generated
+
+def git_revision(source):
+    def git(*args):
+        result = subprocess.run(['git', '-C', source, *args], capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    commit = git('rev-parse', '--short', 'HEAD')
+    dirty = bool(git('status', '--porcelain', '--', 'scripts'))
+    return commit, dirty
+
+def write_config(source, workdir, lndg_path, server_url, bos_path, mirror, settings):
+    config = configparser.ConfigParser(interpolation=None)
+    config.optionxform = str
+    config.read(os.path.join(source, 'automator.conf'))
+    data_dir = os.path.join(workdir, 'data')
+    overrides = {
+        'Paths': {
+            'lndg_db_path': lndg_path,
+            'db_path': os.path.join(data_dir, 'database.db'),
+            'lndg_mirror_path': os.path.join(data_dir, 'lndg_mirror.db'),
+            'lnd_store_path': os.path.join(data_dir, 'lnd_store.db'),
+            'export_dir': os.path.join(data_dir, 'export'),
+            'bos_path': bos_path,
+            'excluded_peers_path': os.path.join(workdir, 'excluded_peers.json'),
+        },
+        'lnd': {
+            'LND_REST_URL': server_url,
+            'LND_MACAROON_PATH': os.path.join(workdir, 'admin.macaroon'),
+            'LND_CERT_PATH': os.path.join(workdir, 'tls.cert'),
+        },
+        'API': {'mempool_api_url_base': f"{server_url}/api/tx/"},
+        'Telegram': {'bot_token': '', 'chat_id': ''},
+        'Control': {'enable_lndg_mirror': 'true' if mirror else 'false'},
+        'Data_source': {'backend': 'lndg'},
+    }
+    for setting in settings:
+        key, value = setting.split('=', 1)
+        section, option = key.split('.', 1)
+        overrides.setdefault(section, {})[option] = value
+    for section, values in overrides.items():
+        if not config.has_section(section):
+            config.add_section(section)
+        for option, value in values.items():
+            config.set(section, option, value)
+    with open(os.path.join(workdir, 'automator.conf'), 'w') as f:
+        config.write(f)
+
+def prepare_workdir(source, lndg_path, server_url, mirror, settings):
+    from fakes import write_fake_bos
+
+    # The modules find automator.conf next to their scripts/ directory, so each session gets its own copy of both.
+    workdir = tempfile.mkdtemp(prefix='automator-bench-')
+    shutil.copytree(os.path.join(source, 'scripts'), os.path.join(workdir, 'scripts'),
+                    ignore=shutil.ignore_patterns('__pycache__'))
+    os.makedirs(os.path.join(workdir, 'data'))
+    exclusions = os.path.join(source, 'excluded_peers.json')
+    if os.path.exists(exclusions):
+        shutil.copy(exclusions, workdir)
+    with open(os.path.join(workdir, 'admin.macaroon'), 'wb') as f:
+        f.write(b'benchmark')
+    open(os.path.join(workdir, 'tls.cert'), 'w').close()
+    bos_path, bos_log = write_fake_bos(workdir)
+    write_config(source, workdir, lndg_path, server_url, bos_path, mirror, settings)
+    return workdir, bos_log
+
+class StageTimer:
+    """Wraps every function of the job's own modules to count its calls and inclusive time."""
+
+    def __init__(self, scripts_dir):
+        self.scripts_dir = os.path.realpath(scripts_dir)
+        self.stats = {}
+
+    def modules(self):
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, '__file__', None)
+            if path and name not in UNTIMED_MODULES and os.path.dirname(os.path.realpath(path)) == self.scripts_dir:
+                yield module
+
+    def wrap(self, key, func):
+        stat = self.stats[key] = [0, 0.0]
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stat[0] += 1
+                stat[1] += time.perf_counter() - started
+        return timed
+
+    def install(self):
+        wrappers = {}
+        modules = list(self.modules())
+        for module in modules:
+            for name, value in vars(module).items():
+                if callable(value) and getattr(value, '__module__', None) == module.__name__ and hasattr(value, '__code__'):
+                    wrappers[value] = self.wrap(f"{module.__name__}.{name}", value)
+        # `from x import f` copies the function into other modules too; those references are swapped as well.
+        for module in modules:
+            for name, value in list(vars(module).items()):
+                try:
+                    wrapper = wrappers.get(value)
+                except TypeError:
+                    continue
+                if wrapper is not None:
+                    setattr(module, name, wrapper)
+
+    def report(self):
+        stages = {key: {'calls': calls, 'seconds': round(seconds, 4)} for key, (calls, seconds) in self.stats.items() if calls}
+        return dict(sorted(stages.items(), key=lambda item: -item[1]['seconds']))
+
+def run_child(workdir, job, stages, result_path):
+    # Runs inside the subprocess: the job gets a fresh interpreter, and its peak RSS is its own.
+    scripts_dir = os.path.join(workdir, 'scripts')
+    sys.path.insert(0, scripts_dir)
+    os.chdir(workdir)
+    started = time.perf_counter()
+    module = importlib.import_module(job)
+    imported = time.perf_counter()
+    timer = StageTimer(scripts_dir)
+    if stages:
+        timer.install()
+    main_started = time.perf_counter()
+    module.main()
+    finished = time.perf_counter()
+    result = {
+        'import_seconds': round(imported - started, 4),
+        'main_seconds': round(finished - main_started, 4),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stages': timer.report(),
+    }
+    with open(result_path, 'w') as f:
+        json.dump(result, f)
+
+def run_job(workdir, job, stages, timeout):
+    result_path = os.path.join(workdir, f"{job}.result.json")
+    log_path = os.path.join(workdir, f"{job}.log")
+    command = [sys.executable, os.path.abspath(__file__), '--child', workdir, job]
+    if not stages:
+        command.append('--no-stages')
+    started = time.perf_counter()
+    with open(log_path, 'a') as log:
+        try:
+            process = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, timeout=timeout)
+            status = 'ok' if process.returncode == 0 else f"exit {process.returncode}"
+        except subprocess.TimeoutExpired:
+            status = 'timeout'
+    wall = time.perf_counter() - started
+    result = {'status': status, 'wall_seconds': round(wall, 4)}
+    if status == 'ok':
+        with open(result_path) as f:
+            result.update(json.load(f))
+        os.remove(result_path)
+    else:
+        result['log'] = log_path
+    return result
+
+def print_result(record, top):
+    label = f"{record['dataset']} {record['job']} run {record['run']}"
+    if record['status'] != 'ok':
+        print(f"{label}: {record['status']} after {record['wall_seconds']}s, see {record['log']}", flush=True)
+        return
+    print(f"{label}: {record['wall_seconds']}s wall, {record['main_seconds']}s main, {record['peak_rss_mb']} MB peak RSS, "
+          f"HTTP {sum(record['http_calls'].values())}, bos {record['bos_calls']}", flush=True)
+    for key, stat in list(record['stages'].items())[:top]:
+        print(f"    {stat['seconds']:>10.4f}s {stat['calls']:>8} x {key}", flush=True)
+
+def run_session(args, params, source, commit, dirty):
+    from fakes import FakeBackend, start_server, take_bos_calls
+
+    lndg_path, dataset = ensure_dataset(args.data_dir, params, args.regenerate)
+    backend = FakeBackend(lndg_path, dataset, args.latency / 1000)
+    server = start_server(backend)
+    workdir, bos_log = prepare_workdir(source, lndg_path, server.url, args.mirror, args.set)
+    jobs = (['lndg_mirror'] if args.mirror else []) + args.jobs
+    try:
+        # database.db is kept between runs: run 1 starts empty, later runs see the state the earlier ones left.
+        for run in range(1, args.runs + 1):
+            for job in jobs:
+                backend.take_calls()
+                result = run_job(workdir, job, not args.no_stages, args.timeout)
+                record = {
+                    'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                    'commit': commit, 'dirty': dirty, 'source': source,
+                    'dataset': dataset_name(params), 'params': {key: dataset[key] for key in ('channels', 'forwards_per_day', 'days', 'payments', 'closures', 'seed', 'rows')},
+                    'dataset_anchor': dataset['anchor'], 'data_source': 'mirror' if args.mirror else 'lndg',
+                    'latency_ms': args.latency, 'settings': args.set, 'job': job, 'run': run,
+                    'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform(),
+                    'http_calls': backend.take_calls(), 'bos_calls': take_bos_calls(bos_log),
+                    **result,
+                }
+                print_result(record, args.top)
+                with open(args.results, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+                if record['status'] != 'ok':
+                    return
+    finally:
+        server.shutdown()
+        if args.keep:
+            print(f"Work directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def report(path, limit):
+    # One row per dataset/job/run, one column per commit, in the order the commits were first benchmarked.
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    commits = []
+    rows = {}
+    for record in records:
+        if record['status'] != 'ok':
+            continue
+        commit = f"{record['commit']}{'+' if record['dirty'] else ''}"
+        if commit not in commits:
+            commits.append(commit)
+        key = (record['dataset'], record['data_source'], record['job'], record['run'])
+        rows.setdefault(key, {})[commit] = record['wall_seconds']
+    commits = commits[-limit:]
+    width = max([len(f"{key[0]} {key[1]} {key[2]} run {key[3]}") for key in rows] + [10])
+    print(f"{'':<{width}}" + ''.join(f"{commit:>14}" for commit in commits))
+    for key, timings in rows.items():
+        label = f"{key[0]} {key[1]} {key[2]} run {key[3]}"
+        print(f"{label:<{width}}" + ''.join(f"{timings[commit]:>14.3f}" if commit in timings else f"{'-':>14}" for commit in commits))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the collector jobs against a synthetic LNDg database and local fakes of LND, mempool.space and bos.")
+    parser.add_argument('--preset', nargs='+', choices=sorted(PRESETS), default=[], help="Scale points to run")
+    parser.add_argument('--channels', type=int, help="Custom dataset: open channels")
+    parser.add_argument('--forwards-per-day', type=int, default=500)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--payments', type=int, default=20000)
+    parser.add_argument('--closures', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--jobs', nargs='+', choices=JOBS, default=JOBS)
+    parser.add_argument('--runs', type=int, default=2, help="Runs per job; run 1 starts from an empty database.db")
+    parser.add_argument('--mirror', action='store_true', help="Read LNDg through lndg_mirror.py, which is run and timed first")
+    parser.add_argument('--latency', type=float, default=0, help="Milliseconds the fakes wait before each response")
+    parser.add_argument('--set', action='append', default=[], metavar='SECTION.key=value', help="Override an automator.conf setting")
+    parser.add_argument('--source', default=REPO_DIR, help="Tree whose scripts/ and automator.conf are benchmarked")
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARKS_DIR, 'data'), help="Where generated datasets are kept")
+    parser.add_argument('--results', default=os.path.join(BENCHMARKS_DIR, 'results.jsonl'))
+    parser.add_argument('--regenerate', action='store_true', help="Build the datasets again even if they exist")
+    parser.add_argument('--timeout', type=float, help="Seconds before a job is stopped")
+    parser.add_argument('--no-stages', action='store_true', help="Only time jobs end to end, without the per-function wrappers")
+    parser.add_argument('--top', type=int, default=8, help="Stages printed per job")
+    parser.add_argument('--keep', action='store_true', help="Keep the work directory for inspection")
+    parser.add_argument('--report', type=int, nargs='?', const=6, metavar='COMMITS', help="Compare the recorded results of the last commits")
+    parser.add_argument('--child', nargs=2, metavar=('WORKDIR', 'JOB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], not args.no_stages, os.path.join(args.child[0], f"{args.child[1]}.result.json"))
+        return
+    if args.report is not None:
+        report(args.results, args.report)
+        return
+
+    sessions = [dict(PRESETS[name], seed=args.seed) for name in args.preset]
+    if args.channels:
+        sessions.append({'channels': args.channels, 'forwards_per_day': args.forwards_per_day, 'days': args.days,
+                         'payments': args.payments, 'closures': args.closures, 'seed': args.seed})
+    if not sessions:
+        parser.error("choose --preset and/or --channels")
+
+    source = os.path.abspath(args.source)
+    commit, dirty = git_revision(source)
+    print(f"Benchmarking {source} at {commit}{' (uncommitted changes in scripts/)' if dirty else ''}", flush=True)
+    for params in sessions:
+        run_session(args, params, source, commit, dirty)
+
+if __name__ == "__main__":
+    main()
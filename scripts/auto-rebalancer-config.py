@@ -2,7 +2,9 @@ import json
 import subprocess
 import configparser
 import os
-import sqlite3 
+
+from db import get_db
+from exclusions import load_exclusions
 
 config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
 config = configparser.ConfigParser()
@@ -14,7 +16,6 @@ def expand_path(path):
     return os.path.expanduser(path)
 
 REGOLANCER_JSON_PATH = expand_path(config['Paths']['regolancer_json_path'])
-DB_PATH = expand_path(config['Paths']['db_path'])
 EXCLUDED_PEERS_PATH = expand_path(config['Paths']['excluded_peers_path'])
 SERVICE_NAME = config['AutoRebalancer']['regolancer-controller_service']
 
@@ -42,8 +43,7 @@ def has_list_changed(old_list, new_list):
     return set(map(str, old_list)) != set(map(str, new_list))
 
 def connect_db():
-    conn = sqlite3.connect(DB_PATH)
-    return conn
+    return get_db()
 
 def get_channels_data(conn):
     cursor = conn.cursor()
@@ -68,8 +68,7 @@ def main():
     conn = connect_db()
     channels_data = get_active_channels(conn)
     conn.close()
-    excluded_peers = load_json(EXCLUDED_PEERS_PATH)
-    excluded_peers_list = [str(entry['pubkey']) for entry in excluded_peers['EXCLUSION_LIST']]
+    excluded_peers = load_exclusions(EXCLUDED_PEERS_PATH)
     exclude_from = set(map(str, regolancer_config.get("exclude_from", [])))
     to = set(map(str, regolancer_config.get("to", [])))
     updated_exclude_from = exclude_from.copy()
@@ -90,7 +89,7 @@ def main():
         chan_id, pubkey, tag = channel
         chan_id = str(chan_id)
 
-        if pubkey in excluded_peers_list:
+        if excluded_peers.is_excluded(pubkey, chan_id, tag, 'rebalance'):
             print(f"Channel {chan_id} is in the exclusion list of pubkeys, skipping...")
             continue
 
@@ -0,0 +1,314 @@
+import os
+import time
+import hashlib
+import configparser
+import sqlite3
+import logging
+import requests
+from datetime import datetime, timedelta
+from telebot import TeleBot
+from pathlib import Path
+
+import fee_strategies
+from db import get_db, get_lndg_db
+from migrations import to_epoch
+from fee_strategies import TAGS, INPUT_FIELDS, ACTIVITY_EPOCH_FIELDS, get_strategy, next_threshold_crossing
+from exclusions import load_exclusions
+from inbound_fees import (
+    ENABLE_INBOUND_FEE, INBOUND_MAX_STEP, INBOUND_MIN_INTERVAL, calculate_inbound_discount,
+    create_inbound_fee_history_table, current_inbound_discount, limit_inbound_discount,
+    load_last_inbound_changes, record_inbound_changes,
+)
+
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+def expand_path(path):
+    if not os.path.isabs(path):
+        return os.path.join(os.path.expanduser("~"), path)
+    return os.path.expanduser(path)
+
+def get_expanded_path(key):
+    relative_path = config['lnd'][key]
+    return os.path.expanduser(os.path.join("~", relative_path))
+
+BOS_PATH = expand_path(config['Paths']['bos_path'])
+EXCLUSION_FILE_PATH = expand_path(config['Paths']['excluded_peers_path'])
+SLEEP_AUTOFEE = int(config['Automation']['sleep_autofee'])
+PERIOD = config['Autofee']['table_period']
+INCREMENTAL = config.getboolean('Autofee', 'incremental', fallback=True)
+MAX_SKIP_SECONDS = 86400
+BOT_TOKEN = config['Telegram']['bot_token']
+CHAT_ID = config['Telegram']['chat_id']
+TELEGRAM_ENABLED = bool(BOT_TOKEN and CHAT_ID)
+lnd_rest_url = config["lnd"]["LND_REST_URL"]
+lnd_macaroon_path = get_expanded_path('LND_MACAROON_PATH')
+lnd_cert_path = get_expanded_path(('LND_CERT_PATH'))
+
+bot = TeleBot(BOT_TOKEN) if TELEGRAM_ENABLED else None
+
+def print_with_timestamp(message):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
+
+def issue_bos_command(peer_pubkey, update_fee=None, inbound_discount=None):
+    command = f"{BOS_PATH} fees"
+    if update_fee is not None:
+        command += f" --set-fee-rate {update_fee}"
+    if inbound_discount is not None:
+        command += f" --set-inbound-rate-discount {inbound_discount}"
+    command += f" --to {peer_pubkey}"
+    print_with_timestamp(f"Executing: {command}")
+    os.system(command)
+
+def get_alias(lnd_rest_url, lnd_macaroon_path, lnd_cert_path):
+    try:
+        macaroon = Path(lnd_macaroon_path).read_bytes().hex()
+        headers = {"Grpc-Metadata-macaroon": macaroon}
+        response = requests.get(f"{lnd_rest_url}/v1/getinfo", headers=headers, verify=lnd_cert_path)
+
+        if response.status_code == 200:
+            data = response.json()
+            self_alias = data.get("alias", "Unknown")
+            return self_alias
+        else:
+            return f"Error: {response.status_code} - {response.text}"
+
+    except Exception as e:
+        return f"Unexpected error: {e}"
+
+def send_telegram_message(message):
+    if not TELEGRAM_ENABLED:
+        logging.info("Telegram bot is disabled. Skipping message.")
+        return
+
+    try:
+        bot.send_message(CHAT_ID, message)
+        logging.info(f"Telegram notification sent to chat {CHAT_ID}: {message}")
+    except Exception as e:
+        logging.error(f"Failed to send Telegram message to chat {CHAT_ID}: {e}")
+
+def get_recent_fee_changes():
+    conn_lndg = get_lndg_db()
+    cursor = conn_lndg.cursor()
+    time_limit = datetime.now() - timedelta(seconds=SLEEP_AUTOFEE)
+
+    cursor.execute("""
+        SELECT DISTINCT chan_id FROM gui_autofees
+        WHERE timestamp >= ?
+    """, (time_limit.strftime('%Y-%m-%d %H:%M:%S'),))
+
+    recent_changes = {str(row[0]) for row in cursor.fetchall()}
+    conn_lndg.close()
+
+    return recent_changes
+
+def get_routed_amounts_7_days(conn):
+    try:
+        rows = conn.execute("""
+            SELECT chan_id, COALESCE(total_routed_in, 0) + COALESCE(total_routed_out, 0)
+            FROM opened_channels_7d
+        """).fetchall()
+    except sqlite3.Error as e:
+        print_with_timestamp(f"Could not read 7 day routed amounts: {e}")
+        return {}
+    return {str(chan_id): routed_amount for chan_id, routed_amount in rows}
+
+def create_autofee_state_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS autofee_state (
+        engine TEXT,
+        chan_id TEXT,
+        fingerprint TEXT,
+        next_evaluation INTEGER,
+        evaluated_at INTEGER,
+        PRIMARY KEY (engine, chan_id)
+    )
+    """)
+    conn.commit()
+
+def load_autofee_state(conn, engine):
+    rows = conn.execute("SELECT chan_id, fingerprint, next_evaluation FROM autofee_state WHERE engine = ?", (engine,)).fetchall()
+    return {chan_id: (fingerprint, next_evaluation) for chan_id, fingerprint, next_evaluation in rows}
+
+def channel_fingerprint(channel, strategy):
+    inputs = tuple(channel.get(field) for field in INPUT_FIELDS)
+    parameters = (
+        strategy.__name__, fee_strategies.INCREASE_PPM, fee_strategies.DECREASE_PPM,
+        fee_strategies.MAX_FEE_THRESHOLD, fee_strategies.REBAL_MARGIN,
+    )
+    if ENABLE_INBOUND_FEE:
+        inputs += (channel.get('local_inbound_fee_rate'),)
+        parameters += (INBOUND_MAX_STEP, INBOUND_MIN_INTERVAL)
+    return hashlib.sha1(repr((inputs, parameters)).encode()).hexdigest()
+
+def is_unchanged(state, chan_id, fingerprint, now):
+    previous = state.get(chan_id)
+    if previous is None or previous[0] != fingerprint:
+        return False
+    return previous[1] is not None and now < previous[1]
+
+def resolve_activity_timestamps(channel_dict):
+    # Strategies read activity as epoch seconds. Rows written before the *_ts columns existed only have the TEXT date,
+    # and None means "never active" to a strategy, so a date that cannot be read skips the channel instead.
+    for field, epoch_field in ACTIVITY_EPOCH_FIELDS.items():
+        timestamp = channel_dict.get(epoch_field)
+        if timestamp is None and channel_dict.get(field):
+            try:
+                timestamp = to_epoch(channel_dict[field])
+            except ValueError:
+                logging.warning(f"Unreadable {field} '{channel_dict[field]}' for channel {channel_dict.get('chan_id')}, skipping.")
+                return False
+        channel_dict[field] = timestamp
+    return True
+
+def load_strategies(default_strategy):
+    default_strategy = config.get('Autofee', 'strategy', fallback='') or default_strategy
+    strategies = {}
+    for tag in TAGS:
+        name = config.get('Autofee', f'strategy_{tag}', fallback='') or default_strategy
+        strategies[tag] = get_strategy(tag, name)
+        logging.info(f"Using fee strategy '{name}' for {tag} channels.")
+    return strategies
+
+def run(default_strategy):
+
+    if TELEGRAM_ENABLED:
+        logging.info("Telegram bot is enabled.")
+    else:
+        logging.info("Telegram bot is disabled.")
+
+    strategies = load_strategies(default_strategy)
+
+    exclusions = load_exclusions(EXCLUSION_FILE_PATH)
+    recent_fee_changes = get_recent_fee_changes()
+    now = int(time.time())
+
+    conn = get_db()
+    if INCREMENTAL:
+        create_autofee_state_table(conn)
+        autofee_state = load_autofee_state(conn, default_strategy)
+    else:
+        autofee_state = {}
+    routed_amounts = get_routed_amounts_7_days(conn)
+    if ENABLE_INBOUND_FEE:
+        create_inbound_fee_history_table(conn)
+        last_inbound_changes = load_last_inbound_changes(conn)
+    inbound_changes = []
+    state_updates = []
+    state_deletes = []
+    skipped = 0
+
+    cursor = conn.cursor()
+    table_name = f'opened_channels_{PERIOD}d'
+
+    try:
+        cursor.execute(f"SELECT * FROM {table_name}")
+    except sqlite3.Error as e:
+        print_with_timestamp(f"Database error: {e}")
+        return
+    channels_data = cursor.fetchall()
+    column_names = [description[0] for description in cursor.description]
+
+    for channel in channels_data:
+        channel_dict = dict(zip(column_names, channel))
+        if not resolve_activity_timestamps(channel_dict):
+            continue
+
+        chan_id = channel_dict.get('chan_id', None)
+        pubkey = channel_dict.get('pubkey', None)
+        alias = channel_dict.get('alias', None)
+        tag = channel_dict.get('tag', None)
+        local_fee_rate = channel_dict.get('local_fee_rate', None)
+        rebal_rate = channel_dict.get('rebal_rate', 0)
+
+        if chan_id is None or pubkey is None or alias is None or tag is None:
+            print_with_timestamp(f"Missing required data for channel, skipping...")
+            continue
+
+        if exclusions.is_excluded(pubkey, chan_id, tag, 'autofee'):
+            print_with_timestamp(f"Channel {alias} ({pubkey}) is in the exclusion list, skipping...")
+            continue
+
+        if str(chan_id) in recent_fee_changes:
+            print_with_timestamp(f"Channel {alias} ({pubkey}) had a recent fee change, skipping...")
+            continue
+
+        strategy = strategies.get(tag)
+        if strategy is None:
+            print_with_timestamp(f"Unknown tag for {alias}, skipping...")
+            continue
+
+        channel_dict['routed_amount_7d'] = routed_amounts.get(str(chan_id), 0)
+
+        if INCREMENTAL:
+            fingerprint = channel_fingerprint(channel_dict, strategy)
+            if is_unchanged(autofee_state, str(chan_id), fingerprint, now):
+                skipped += 1
+                continue
+
+        new_fee = strategy(channel_dict)
+
+        inbound_discount = None
+        inbound_pending = False
+        if ENABLE_INBOUND_FEE and new_fee is not None and local_fee_rate is not None:
+            current_discount = current_inbound_discount(channel_dict)
+            target_discount = calculate_inbound_discount(channel_dict, new_fee)
+            limited_discount = limit_inbound_discount(str(chan_id), current_discount, target_discount, last_inbound_changes, now)
+            inbound_pending = limited_discount != target_discount
+            if limited_discount != current_discount:
+                inbound_discount = limited_discount
+                inbound_changes.append((str(chan_id), now, current_discount, limited_discount, new_fee - (rebal_rate or 0)))
+
+        if INCREMENTAL:
+            if new_fee == local_fee_rate and inbound_discount is None and not inbound_pending:
+                next_evaluation = next_threshold_crossing(strategy, channel_dict, now)
+                # Strategies that have not declared their thresholds are re-evaluated every pass.
+                if strategy.thresholds is None:
+                    next_evaluation = now
+                elif next_evaluation is None or next_evaluation > now + MAX_SKIP_SECONDS:
+                    next_evaluation = now + MAX_SKIP_SECONDS
+                state_updates.append((default_strategy, str(chan_id), fingerprint, next_evaluation, now))
+            else:
+                state_deletes.append((default_strategy, str(chan_id)))
+
+        if new_fee is not None and local_fee_rate is not None:
+            if new_fee == local_fee_rate and inbound_discount is None:
+                logging.warning(f"No changes will be made as the new fee is equal to the current fee of the {alias} peer.")
+
+            else:
+                self_alias = get_alias(lnd_rest_url, lnd_macaroon_path, lnd_cert_path)
+
+                if new_fee == local_fee_rate:
+                    message = f"Node: {self_alias} \nFee for channel {alias} unchanged at {local_fee_rate} ppm"
+                elif local_fee_rate > 0:
+                    variation = float(((new_fee - local_fee_rate) / local_fee_rate) * 100)
+                    message = (f"Node: {self_alias} \nFee for channel {alias} updated: {local_fee_rate} ppm ➡️ {new_fee} ppm | {variation:.2f}%")
+
+                else:
+                    message = (f"Node: {self_alias} \nFee for channel {alias} updated: {local_fee_rate} ppm ➡️ {new_fee} ppm (No percentage change due to zero local fee rate)")
+
+                if inbound_discount is not None:
+                    message += f"\nInbound discount: {current_inbound_discount(channel_dict)} ppm ➡️ {inbound_discount} ppm"
+
+                send_telegram_message(message)
+                issue_bos_command(pubkey, new_fee if new_fee != local_fee_rate else None, inbound_discount)
+
+        else:
+            logging.warning(f"Skipping fee update for {alias} due to missing fee rate data")
+
+    if inbound_changes:
+        record_inbound_changes(conn, inbound_changes)
+
+    if INCREMENTAL:
+        conn.executemany("""
+            INSERT OR REPLACE INTO autofee_state (engine, chan_id, fingerprint, next_evaluation, evaluated_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, state_updates)
+        conn.executemany("DELETE FROM autofee_state WHERE engine = ? AND chan_id = ?", state_deletes)
+        conn.commit()
+        logging.info(f"Evaluated {len(state_updates) + len(state_deletes)} channels, skipped {skipped} unchanged channels.")
+
+    conn.close()
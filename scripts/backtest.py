@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import itertools
+import configparser
+import concurrent.futures
+from collections import deque
+from datetime import datetime
+
+import fee_strategies
+from db import connect, get_lndg_db
+from fee_strategies import TAGS, get_strategy
+from exclusions import load_exclusions
+from get_channels_data import classify_channel, calculate_ppm, calculate_rebal_rate
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+def expand_path(path):
+    if not os.path.isabs(path):
+        return os.path.join(os.path.expanduser("~"), path)
+    return os.path.expanduser(path)
+
+DB_PATH = expand_path(config['Paths']['db_path'])
+EXCLUSION_FILE_PATH = expand_path(config['Paths']['excluded_peers_path'])
+SLEEP_AUTOFEE = int(config['Automation']['sleep_autofee'])
+PERIOD = int(config['Autofee']['table_period'])
+MAX_FEE_THRESHOLD = int(config['Autofee']['max_fee_threshold'])
+INCREASE_PPM = int(config['Autofee']['increase_ppm'])
+DECREASE_PPM = int(config['Autofee']['decrease_ppm'])
+REBAL_MARGIN = config.getfloat('Autofee', 'rebal_margin', fallback=0.9)
+
+FORWARD = 0
+REBALANCE = 1
+
+_history = None
+
+def print_with_timestamp(message):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
+
+class RollingWindow:
+    def __init__(self, span, width):
+        self.span = span
+        self.events = deque()
+        self.sums = [0] * width
+
+    def add(self, ts, *values):
+        self.events.append((ts, values))
+        for i, value in enumerate(values):
+            self.sums[i] += value
+
+    def evict(self, now):
+        limit = now - self.span
+        while self.events and self.events[0][0] < limit:
+            _, values = self.events.popleft()
+            for i, value in enumerate(values):
+                self.sums[i] -= value
+
+def to_db_date(ts):
+    # LNDg stores node-local wall-clock time, so the bounds are local too.
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def load_opening_dates():
+    try:
+        conn = connect(DB_PATH, read_only=True)
+        rows = conn.execute("SELECT chan_id, opening_ts FROM opened_channels_lifetime").fetchall()
+        conn.close()
+    except sqlite3.Error as e:
+        print_with_timestamp(f"Could not read opening dates from {DB_PATH}: {e}")
+        return {}
+
+    return {str(chan_id): opening_ts for chan_id, opening_ts in rows if opening_ts}
+
+def load_history(days):
+    end = int(time.time())
+    start = end - days * 86400
+    warmup_date = to_db_date(start - PERIOD * 86400)
+
+    conn = get_lndg_db()
+    channels = conn.execute("""
+        SELECT chan_id, remote_pubkey, alias, capacity, local_balance, local_fee_rate
+        FROM gui_channels
+        WHERE is_open = 1
+    """).fetchall()
+
+    forwards = conn.execute("""
+        SELECT CAST(strftime('%s', forward_date, 'utc') AS INTEGER), chan_id_in, chan_id_out,
+               amt_in_msat / 1000, amt_out_msat / 1000, fee
+        FROM gui_forwards
+        WHERE forward_date >= ?
+        ORDER BY forward_date
+    """, (warmup_date,)).fetchall()
+
+    rebalances = conn.execute("""
+        SELECT CAST(strftime('%s', creation_date, 'utc') AS INTEGER), rebal_chan, chan_out, value, fee
+        FROM gui_payments
+        WHERE rebal_chan IS NOT NULL
+        AND chan_out IS NOT NULL
+        AND creation_date >= ?
+        ORDER BY creation_date
+    """, (warmup_date,)).fetchall()
+    conn.close()
+
+    events = [(ts, FORWARD, str(chan_in), str(chan_out), amt_in or 0, amt_out or 0, fee or 0)
+              for ts, chan_in, chan_out, amt_in, amt_out, fee in forwards]
+    events += [(ts, REBALANCE, str(rebal_chan), str(chan_out), value or 0, fee or 0, 0)
+               for ts, rebal_chan, chan_out, value, fee in rebalances]
+    events.sort(key=lambda event: event[0])
+
+    # Walk the loaded events backwards from today's balances to get the balances at the start of the warmup.
+    balances = {str(row[0]): row[4] for row in channels}
+    for _, kind, a, b, c, d, e in events:
+        if kind == FORWARD:
+            if a in balances:
+                balances[a] -= c
+            if b in balances:
+                balances[b] += d
+        else:
+            if a in balances:
+                balances[a] -= c
+            if b in balances:
+                balances[b] += c + d
+
+    opening_dates = load_opening_dates()
+    channel_list = []
+    for chan_id, pubkey, alias, capacity, local_balance, local_fee_rate in channels:
+        chan_id = str(chan_id)
+        channel_list.append({
+            'chan_id': chan_id,
+            'pubkey': pubkey,
+            'alias': alias or "Unknown",
+            'capacity': capacity,
+            'balance': min(max(balances[chan_id], 0), capacity),
+            'fee': local_fee_rate or 0,
+            'opened': opening_dates.get(chan_id),
+        })
+
+    return {
+        'start': start,
+        'end': end,
+        'channels': channel_list,
+        'events': events,
+        'excluded': load_exclusions(EXCLUSION_FILE_PATH),
+    }
+
+def apply_policy(policy):
+    fee_strategies.INCREASE_PPM = policy['increase_ppm']
+    fee_strategies.DECREASE_PPM = policy['decrease_ppm']
+    fee_strategies.MAX_FEE_THRESHOLD = policy['max_fee_threshold']
+    fee_strategies.REBAL_MARGIN = policy['rebal_margin']
+    return {tag: get_strategy(tag, policy['strategy']) for tag in TAGS}
+
+def run_tick(states, now, strategies, excluded, result):
+    # adjust_* measure inactivity against the wall clock, so activity timestamps are shifted into the present.
+    offset = int(time.time()) - now
+
+    for state in states.values():
+        state['period'].evict(now)
+        state['week'].evict(now)
+        routed_in, routed_out, revenue, rebalanced_in, cost = state['period'].sums
+        routed_in, routed_out, revenue = int(routed_in), int(routed_out), int(revenue)
+        rebalanced_in, cost = int(rebalanced_in), int(cost)
+        days_open = (now - state['opened']) // 86400 if state['opened'] else PERIOD
+        capacity = state['capacity']
+
+        channel = {
+            'chan_id': state['chan_id'],
+            'alias': state['alias'],
+            'capacity': capacity,
+            'outbound_liquidity': round((state['balance'] / capacity) * 100, 1) if capacity > 0 else 0,
+            'days_open': days_open,
+            'local_fee_rate': state['fee'],
+            'cost_ppm': calculate_ppm(cost, rebalanced_in + routed_in),
+            'rebal_rate': calculate_rebal_rate(cost, rebalanced_in),
+            'revenue_ppm': calculate_ppm(revenue, routed_out),
+            'total_routed_out': routed_out,
+            'routed_amount_7d': int(state['week'].sums[0]),
+            'last_outgoing_activity': state['last_outgoing'] + offset if state['last_outgoing'] else None,
+            'last_incoming_activity': state['last_incoming'] + offset if state['last_incoming'] else None,
+            'last_rebalance': state['last_rebalance'] + offset if state['last_rebalance'] else None,
+        }
+
+        tag = classify_channel(routed_in, routed_out, days_open)
+        if excluded.is_excluded(state['pubkey'], state['chan_id'], tag, 'autofee'):
+            continue
+
+        new_fee = strategies[tag](channel)
+
+        if new_fee is not None and new_fee != state['fee']:
+            result['fee_changes'] += 1
+            result['fee_churn_ppm'] += abs(new_fee - state['fee'])
+            state['fee'] = new_fee
+
+def simulate(history, policy):
+    strategies = apply_policy(policy)
+
+    states = {}
+    for channel in history['channels']:
+        state = dict(channel)
+        state['period'] = RollingWindow(PERIOD * 86400, 5)
+        state['week'] = RollingWindow(7 * 86400, 1)
+        state['last_outgoing'] = None
+        state['last_incoming'] = None
+        state['last_rebalance'] = None
+        states[channel['chan_id']] = state
+
+    result = {
+        'policy': policy,
+        'revenue': 0,
+        'historical_revenue': 0,
+        'rebalance_cost': 0,
+        'forwards_kept': 0,
+        'forwards_lost': 0,
+        'fee_changes': 0,
+        'fee_churn_ppm': 0,
+    }
+
+    start = history['start']
+    end = history['end']
+    excluded = history['excluded']
+    next_tick = start
+
+    for ts, kind, a, b, c, d, e in history['events']:
+        while next_tick <= ts and next_tick <= end:
+            run_tick(states, next_tick, strategies, excluded, result)
+            next_tick += SLEEP_AUTOFEE
+
+        simulated = ts >= start
+
+        if kind == FORWARD:
+            incoming = states.get(a)
+            outgoing = states.get(b)
+
+            if incoming is not None:
+                incoming['balance'] += c
+                incoming['last_incoming'] = ts
+                incoming['period'].add(ts, c, 0, 0, 0, 0)
+                incoming['week'].add(ts, c)
+
+            revenue = e
+            if simulated:
+                result['historical_revenue'] += e
+                if outgoing is not None and d > 0:
+                    # The sender accepted the historical fee rate; anything above it is assumed to lose the forward.
+                    historical_ppm = e * 1_000_000 / d
+                    if outgoing['fee'] <= historical_ppm:
+                        revenue = d * outgoing['fee'] / 1_000_000
+                        result['forwards_kept'] += 1
+                    else:
+                        revenue = 0
+                        result['forwards_lost'] += 1
+                result['revenue'] += revenue
+
+            if outgoing is not None:
+                outgoing['balance'] -= d
+                outgoing['last_outgoing'] = ts
+                outgoing['period'].add(ts, 0, d, revenue, 0, 0)
+                outgoing['week'].add(ts, d)
+
+        else:
+            rebalanced = states.get(a)
+            source = states.get(b)
+
+            if rebalanced is not None:
+                rebalanced['balance'] += c
+                rebalanced['last_rebalance'] = ts
+                rebalanced['period'].add(ts, 0, 0, 0, c, d)
+            if source is not None:
+                source['balance'] -= c + d
+            if simulated:
+                result['rebalance_cost'] += d
+
+    while next_tick <= end:
+        run_tick(states, next_tick, strategies, excluded, result)
+        next_tick += SLEEP_AUTOFEE
+
+    result['revenue'] = int(result['revenue'])
+    result['historical_revenue'] = int(result['historical_revenue'])
+    result['rebalance_cost'] = int(result['rebalance_cost'])
+    result['profit'] = result['revenue'] - result['rebalance_cost']
+    return result
+
+def init_worker(history):
+    global _history
+    _history = history
+    logging.getLogger().setLevel(logging.WARNING)
+
+def run_policy(policy):
+    return simulate(_history, policy)
+
+def parse_values(value, cast):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+def build_policies(args):
+    grid = itertools.product(
+        parse_values(args.strategy, str),
+        parse_values(args.increase_ppm, int),
+        parse_values(args.decrease_ppm, int),
+        parse_values(args.max_fee_threshold, int),
+        parse_values(args.rebal_margin, float),
+    )
+    return [
+        {'strategy': strategy, 'increase_ppm': inc, 'decrease_ppm': dec, 'max_fee_threshold': max_fee, 'rebal_margin': margin}
+        for strategy, inc, dec, max_fee, margin in grid
+    ]
+
+def print_results(results):
+    print(f"{'strategy':>8} {'increase':>8} {'decrease':>8} {'max_fee':>8} {'margin':>6} {'revenue':>10} {'profit':>10} "
+          f"{'kept':>7} {'lost':>7} {'changes':>8} {'churn_ppm':>10}")
+    for result in results:
+        policy = result['policy']
+        print(f"{policy['strategy']:>8} {policy['increase_ppm']:>8} {policy['decrease_ppm']:>8} {policy['max_fee_threshold']:>8} "
+              f"{policy['rebal_margin']:>6} {result['revenue']:>10} {result['profit']:>10} "
+              f"{result['forwards_kept']:>7} {result['forwards_lost']:>7} {result['fee_changes']:>8} "
+              f"{result['fee_churn_ppm']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay LNDg history against registered autofee strategies.")
+    parser.add_argument('--strategy', default='v2', help="Comma-separated fee strategy names")
+    parser.add_argument('--days', type=int, default=PERIOD, help="Number of days of history to simulate")
+    parser.add_argument('--increase-ppm', default=str(INCREASE_PPM), help="Comma-separated INCREASE_PPM values")
+    parser.add_argument('--decrease-ppm', default=str(DECREASE_PPM), help="Comma-separated DECREASE_PPM values")
+    parser.add_argument('--max-fee-threshold', default=str(MAX_FEE_THRESHOLD), help="Comma-separated MAX_FEE_THRESHOLD values")
+    parser.add_argument('--rebal-margin', default=str(REBAL_MARGIN), help="Comma-separated rebal_rate margins")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    started = time.time()
+    history = load_history(args.days)
+    print_with_timestamp(f"Loaded {len(history['events'])} events for {len(history['channels'])} channels "
+                         f"in {time.time() - started:.1f}s")
+
+    policies = build_policies(args)
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(history,)) as executor:
+        for result in executor.map(run_policy, policies):
+            results.append(result)
+
+    results.sort(key=lambda result: result['profit'], reverse=True)
+    print_with_timestamp(f"Simulated {len(policies)} policies over {args.days} days in {time.time() - started:.1f}s")
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
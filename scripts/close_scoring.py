@@ -0,0 +1,153 @@
+import os
+import time
+import configparser
+
+from migrations import to_epoch
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+MOVEMENT_THRESHOLD_PERC = int(config['Closechannel']['movement_threshold_perc'])
+CAPITAL_COST_RATE = config.getfloat('Closechannel', 'capital_cost_rate', fallback=0.05)
+MIN_LOCAL_TURNOVER = config.getfloat('Closechannel', 'min_local_turnover', fallback=0)
+DAYS_INACTIVE = {
+    'source': int(config['Closechannel']['days_inactive_source']),
+    'sink': int(config['Closechannel']['days_inactive_sink']),
+    'router': int(config['Closechannel']['days_inactive_router']),
+}
+
+def create_close_candidates_table(conn):
+    # The table is rebuilt every pass, so an older layout is simply dropped.
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(close_candidates)")}
+    if columns and 'local_turnover' not in columns:
+        conn.execute("DROP TABLE close_candidates")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS close_candidates (
+        chan_id TEXT PRIMARY KEY,
+        pubkey TEXT,
+        alias TEXT,
+        tag TEXT,
+        capacity INTEGER,
+        inactive_days INTEGER,
+        movement_percentage REAL,
+        local_turnover REAL,
+        annual_profit INTEGER,
+        lockup_cost INTEGER,
+        efficiency_gain INTEGER,
+        score REAL,
+        eligible INTEGER,
+        reason TEXT,
+        rank INTEGER,
+        updated_at INTEGER
+    )
+    """)
+    conn.commit()
+
+def days_since(activity_ts, now):
+    if activity_ts is None:
+        return None
+    return (now - activity_ts) // 86400
+
+def activity_days(channel, field, epoch_field, now):
+    # A NULL epoch next to a TEXT date (older rows, or a date the backfill could not read) falls back to the TEXT date;
+    # a date that still cannot be read raises ValueError.
+    activity_ts = channel[epoch_field]
+    if activity_ts is None and channel[field]:
+        activity_ts = to_epoch(channel[field])
+    return days_since(activity_ts, now)
+
+def inactive_days(channel, now):
+    # The activity that matters depends on the role: sources must receive, sinks must send, routers do both.
+    # Returns None when one of those dates cannot be read: unknown activity is not the same as never active.
+    incoming = ('last_incoming_activity', 'last_incoming_ts')
+    outgoing = ('last_outgoing_activity', 'last_outgoing_ts')
+    fields = {'source': (incoming,), 'sink': (outgoing,)}.get(channel['tag'], (incoming, outgoing))
+    try:
+        known = [days for days in (activity_days(channel, field, epoch_field, now) for field, epoch_field in fields) if days is not None]
+    except ValueError:
+        return None
+    days_open = channel['days_open'] or 0
+    if not known:
+        return days_open
+    days = min(known)
+    return min(days, days_open) if days_open else days
+
+def movement_percentage(channel):
+    capacity = channel['capacity']
+    total_movement = channel['total_routed_in'] + channel['total_routed_out']
+    return (total_movement / capacity) * 100 if capacity > 0 else 0
+
+def score_channel(channel, excluded, liquidity, now):
+    # Score is the yearly gain, in ppm of capacity, from freeing the local balance instead of keeping the channel.
+    tag = channel['tag']
+    capacity = channel['capacity'] or 0
+    days_open = max(channel['days_open'] or 0, 1)
+    local_balance = capacity * (channel['outbound_liquidity'] or 0) / 100
+    annual_profit = (channel['profit'] or 0) * 365 / days_open
+    lockup_cost = local_balance * CAPITAL_COST_RATE
+    efficiency_gain = lockup_cost - annual_profit
+    score = efficiency_gain / capacity * 1_000_000 if capacity > 0 else 0
+    days = inactive_days(channel, now)
+    movement = movement_percentage(channel)
+    usage = liquidity.get(str(channel['chan_id']), {})
+    local_turnover = usage.get('local_turnover')
+    # Lifetime movement can hide liquidity that sat idle for months; a low local turnover over a long enough window overrides it.
+    idle = (local_turnover is not None and local_turnover < MIN_LOCAL_TURNOVER
+            and usage['tracked_days'] >= DAYS_INACTIVE.get(tag, float('inf')))
+
+    if excluded.is_excluded(channel['pubkey'], channel['chan_id'], tag, 'close'):
+        reason = 'excluded'
+    elif tag not in DAYS_INACTIVE:
+        reason = tag
+    elif days is None:
+        reason = 'activity date unreadable'
+    elif days <= DAYS_INACTIVE[tag]:
+        reason = f"active within {DAYS_INACTIVE[tag]} days"
+    elif movement >= MOVEMENT_THRESHOLD_PERC and not idle:
+        reason = f"movement above {MOVEMENT_THRESHOLD_PERC}%"
+    else:
+        reason = None
+
+    return {
+        'chan_id': str(channel['chan_id']),
+        'pubkey': channel['pubkey'],
+        'alias': channel['alias'],
+        'tag': tag,
+        'capacity': capacity,
+        'inactive_days': days,
+        'movement_percentage': round(movement, 2),
+        'local_turnover': local_turnover,
+        'annual_profit': int(annual_profit),
+        'lockup_cost': int(lockup_cost),
+        'efficiency_gain': int(efficiency_gain),
+        'score': round(score, 2),
+        'eligible': reason is None,
+        'reason': reason or 'eligible',
+    }
+
+def rank_candidates(channels, excluded, liquidity=None, now=None):
+    now = now or int(time.time())
+    liquidity = liquidity or {}
+    scored = [score_channel(channel, excluded, liquidity, now) for channel in channels]
+    scored.sort(key=lambda candidate: (not candidate['eligible'], -candidate['score']))
+    rank = 0
+    for candidate in scored:
+        if candidate['eligible']:
+            rank += 1
+            candidate['rank'] = rank
+        else:
+            candidate['rank'] = None
+    return scored
+
+def save_close_candidates(conn, candidates):
+    updated_at = int(time.time())
+    with conn:
+        conn.execute("DELETE FROM close_candidates")
+        conn.executemany("""
+            INSERT INTO close_candidates (chan_id, pubkey, alias, tag, capacity, inactive_days, movement_percentage, local_turnover,
+                annual_profit, lockup_cost, efficiency_gain, score, eligible, reason, rank, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(c['chan_id'], c['pubkey'], c['alias'], c['tag'], c['capacity'], c['inactive_days'], c['movement_percentage'],
+               c['local_turnover'], c['annual_profit'], c['lockup_cost'], c['efficiency_gain'], c['score'], int(c['eligible']), c['reason'],
+               c['rank'], updated_at) for c in candidates])
@@ -2,10 +2,17 @@ import subprocess
 import time
 import sqlite3
 import os
+import tempfile
 import requests
 import configparser
-import json 
-from datetime import datetime, timedelta
+from datetime import datetime
+
+from db import get_db
+from exclusions import load_exclusions
+from lnd_client import get_client, LndError
+from htlc_snapshot import get_snapshot
+from liquidity import create_liquidity_tables, get_liquidity
+from close_scoring import create_close_candidates_table, rank_candidates, save_close_candidates
 
 config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
 config = configparser.ConfigParser()
@@ -17,55 +24,58 @@ def expand_path(path):
     return os.path.expanduser(path)
 
 user_path = os.path.expanduser("~")
-db_path = expand_path(config['Paths']['db_path'])
 charge_lnd_config_dir = expand_path(config['Paths']['charge_lnd_config_dir'])
 excluded_peers_path = expand_path(config['Paths']['excluded_peers_path'])
-mempool_api_url_recomended_fees = config['API']['mempool_api_url_base']
+mempool_api_url_recomended_fees = config['API']['mempool_api_url_recomended_fees']
 
 charge_lnd_bin = config['Closechannel']['charge_lnd_bin']
 charge_lnd_interval = int(config['Closechannel']['charge_lnd_interval'])
-htlc_check_interval = int(config['Closechannel']['htlc_check_interval'])
-movement_threshold_perc = int(config['Closechannel']['movement_threshold_perc'])
+charge_lnd_config_name = config.get('Closechannel', 'charge_lnd_config_name', fallback='automator-disable.conf')
+disable_method = config.get('Closechannel', 'disable_method', fallback='charge-lnd')
 max_fee_rate = int(config['Closechannel']['max_fee_rate'])
-days_inactive_source = int(config['Closechannel']['days_inactive_source'])
-days_inactive_sink = int(config['Closechannel']['days_inactive_sink'])
-days_inactive_router = int(config['Closechannel']['days_inactive_router'])
+fee_history_days = config.getint('Closechannel', 'fee_history_days', fallback=14)
+max_wait_days = config.getint('Closechannel', 'max_wait_days', fallback=14)
+max_close_attempts = config.getint('Closechannel', 'max_close_attempts', fallback=5)
+# The queue and the fee window are checked on every run; the candidate scan only once per sleep_closechannel.
+candidate_scan_interval = config.getint('Automation', 'sleep_closechannel', fallback=86400)
+last_candidate_scan = 0
+
+STATE_DISABLED = 'disabled'
+STATE_WAITING_HTLCS = 'waiting_htlcs'
+STATE_WAITING_FEE = 'waiting_fee'
+STATE_CLOSING = 'closing'
+STATE_CLOSED = 'closed'
+STATE_CANCELLED = 'cancelled'
+STATE_FAILED = 'failed'
+DISABLED_STATES = (STATE_DISABLED, STATE_WAITING_HTLCS, STATE_WAITING_FEE)
+ACTIVE_STATES = DISABLED_STATES + (STATE_CLOSING,)
 
 def print_with_timestamp(message):
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
 
-def create_or_update_config(chan_id):
-    config_path = os.path.join(charge_lnd_config_dir, f"{chan_id}.conf")
-    config_lines = []
-
-    if os.path.exists(config_path):
-        with open(config_path, 'r') as f:
-            config_lines = f.readlines()
-
-    start_idx = None
-    end_idx = None
-    for i, line in enumerate(config_lines):
-        if line.strip().lower() == '[disable-channels]':
-            start_idx = i
-            for j in range(i + 1, len(config_lines)):
-                if config_lines[j].startswith('['):
-                    end_idx = j
-                    break
-            break
-    
-    if start_idx is not None:
-        config_lines[start_idx + 1:end_idx] = [
-            f"chan.id = {chan_id}\n",
-            "strategy = disable\n"
-        ]
-    else:
-        config_lines.append("\n[disable-channels]\n")
-        config_lines.append(f"chan.id = {chan_id}\n")
-        config_lines.append("strategy = disable\n")
-
-    with open(config_path, 'w') as f:
-        f.writelines(config_lines)
-
+def write_charge_lnd_config(chan_ids, enable_chan_ids=()):
+    # One file holds a disable section per queued channel; it is swapped in atomically so charge-lnd never reads it half written.
+    # Channels leaving the queue get a section for one pass with a strategy other than disable, which makes charge-lnd enable them again.
+    config_path = os.path.join(charge_lnd_config_dir, charge_lnd_config_name)
+    lines = []
+    for chan_id in sorted(chan_ids):
+        lines.append(f"[disable-{chan_id}]\n")
+        lines.append(f"chan.id = {chan_id}\n")
+        lines.append("strategy = disable\n\n")
+    for chan_id in sorted(enable_chan_ids):
+        lines.append(f"[enable-{chan_id}]\n")
+        lines.append(f"chan.id = {chan_id}\n")
+        lines.append("strategy = ignore_fees\n\n")
+
+    os.makedirs(charge_lnd_config_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=charge_lnd_config_dir, prefix=f".{charge_lnd_config_name}.")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, config_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
     return config_path
 
 def execute_charge_lnd(config_path):
@@ -79,180 +89,319 @@ def execute_charge_lnd(config_path):
     if result.stderr:
         print("charge-lnd errors:\n", result.stderr)
 
-def check_pending_htlcs(chan_id, db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM gui_pendinghtlcs WHERE chan_id = ?", (chan_id,))
-    pending_htlcs = cursor.fetchall()
-    conn.close()
-    if pending_htlcs:
-        print(f"Pending HTLC found for channel {chan_id}. Retrying in {htlc_check_interval} seconds...")
+def set_channel_status_via_lnd(conn, closure, action):
+    if not closure['chan_point']:
+        channel_info = get_channel_info(closure['chan_id'])
+        if not channel_info or "chan_point" not in channel_info:
+            return False
+        update_closure(conn, closure, chan_point=channel_info["chan_point"])
+    try:
+        get_client().update_chan_status(closure['chan_point'], action)
+    except LndError as e:
+        print_with_timestamp(f"Error setting channel {closure['chan_id']} to {action}: {e}")
+        return False
+    return True
+
+def set_channel_policies(conn, closures, released=()):
+    # Keeps the queued channels disabled and enables the released ones again; returns the released closures
+    # whose channel was enabled, so a failed enable leaves the closure queued and is retried on the next pass.
+    if not closures and not released:
+        return []
+    if disable_method == 'lnd':
+        disabled = sum(set_channel_status_via_lnd(conn, closure, 'DISABLE') for closure in closures)
+        if closures:
+            print_with_timestamp(f"Disabled {disabled} of {len(closures)} queued channels through LND.")
+        return [closure for closure in released if set_channel_status_via_lnd(conn, closure, 'ENABLE')]
+    config_path = write_charge_lnd_config((closure['chan_id'] for closure in closures),
+                                          (closure['chan_id'] for closure in released))
+    execute_charge_lnd(config_path)
+    return list(released)
+
+def channels_to_disable(closures, open_chan_ids):
+    # A channel whose close is already broadcast, or that is gone, has no policy left to set.
+    return [closure for closure in closures if closure['state'] in DISABLED_STATES and closure['chan_id'] in open_chan_ids]
+
+def check_pending_htlcs(chan_id, snapshot):
+    if snapshot.has_pending(chan_id):
+        print(f"Pending HTLC found for channel {chan_id}. Retrying on the next pass...")
         return True
     return False
 
-def get_high_priority_fee():
-    response = requests.get(mempool_api_url_recomended_fees)
+def create_pending_closures_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS pending_closures (
+        chan_id TEXT PRIMARY KEY,
+        pubkey TEXT,
+        chan_point TEXT,
+        state TEXT,
+        queued_at INTEGER,
+        updated_at INTEGER,
+        attempts INTEGER DEFAULT 0,
+        close_fee_rate INTEGER,
+        last_error TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_closures_state ON pending_closures (state, queued_at)")
+    conn.commit()
+
+def get_pending_closures(conn):
+    placeholders = ', '.join('?' for _ in ACTIVE_STATES)
+    cursor = conn.execute(f"SELECT * FROM pending_closures WHERE state IN ({placeholders}) ORDER BY queued_at, rowid", ACTIVE_STATES)
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_failed_chan_ids(conn):
+    return {row[0] for row in conn.execute("SELECT chan_id FROM pending_closures WHERE state = ?", (STATE_FAILED,))}
+
+def queue_closure(conn, chan_id, pubkey):
+    now = int(time.time())
+    conn.execute("""
+        INSERT OR REPLACE INTO pending_closures (chan_id, pubkey, state, queued_at, updated_at, attempts)
+        VALUES (?, ?, ?, ?, ?, 0)
+    """, (str(chan_id), pubkey, STATE_DISABLED, now, now))
+    conn.commit()
+
+def update_closure(conn, closure, **changes):
+    closure.update(changes)
+    closure['updated_at'] = int(time.time())
+    conn.execute("""
+        UPDATE pending_closures
+        SET chan_point = ?, state = ?, updated_at = ?, attempts = ?, close_fee_rate = ?, last_error = ?
+        WHERE chan_id = ?
+    """, (closure['chan_point'], closure['state'], closure['updated_at'], closure['attempts'],
+          closure['close_fee_rate'], closure['last_error'], closure['chan_id']))
+    conn.commit()
+
+def create_fee_rate_history_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fee_rate_history (
+        timestamp INTEGER PRIMARY KEY,
+        fastest_fee INTEGER,
+        half_hour_fee INTEGER,
+        hour_fee INTEGER,
+        economy_fee INTEGER,
+        minimum_fee INTEGER
+    )
+    """)
+    conn.commit()
+
+def record_fee_rates(conn, fees, now):
+    conn.execute("""
+        INSERT OR REPLACE INTO fee_rate_history (timestamp, fastest_fee, half_hour_fee, hour_fee, economy_fee, minimum_fee)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (now, fees.get('fastestFee'), fees.get('halfHourFee'), fees.get('hourFee'), fees.get('economyFee'), fees.get('minimumFee')))
+    conn.execute("DELETE FROM fee_rate_history WHERE timestamp < ?", (now - fee_history_days * 86400,))
+    conn.commit()
+
+def get_median_hour_fee(conn):
+    rows = conn.execute("SELECT hour_fee FROM fee_rate_history WHERE hour_fee IS NOT NULL ORDER BY hour_fee").fetchall()
+    if not rows:
+        return None
+    return rows[len(rows) // 2][0]
+
+def get_recommended_fees():
+    try:
+        response = requests.get(mempool_api_url_recomended_fees, timeout=30)
+    except requests.exceptions.RequestException as e:
+        print(f"Error accessing Mempool.Space API: {e}")
+        return None
     if response.status_code == 200:
         fees = response.json()
-        return fees.get("fastestFee", None)
+        if fees.get("hourFee") is None or fees.get("fastestFee") is None:
+            print("Mempool.Space API returned incomplete fee data.")
+            return None
+        return fees
     else:
         print(f"Error accessing Mempool.Space API: {response.status_code}")
         return None
 
-def days_since_activity(activity_date):
-    if activity_date is None:
-        return float('inf')
-    if isinstance(activity_date, int):
-        last_activity = datetime.fromtimestamp(activity_date)
-    else:
-        last_activity = datetime.strptime(activity_date, '%Y-%m-%d %H:%M:%S')
-    return (datetime.now() - last_activity).days
+def close_priority_fee(closure, fees, now):
+    # Channels that have waited longer bid closer to fastestFee so they are not left behind.
+    waited = now - closure['queued_at']
+    urgency = min(waited / (max_wait_days * 86400), 1) if max_wait_days > 0 else 1
+    hour_fee = fees['hourFee']
+    return hour_fee + round((max(fees['fastestFee'], hour_fee) - hour_fee) * urgency), urgency
 
-def load_excluded_peers():
-    if not os.path.exists(excluded_peers_path):
-        print(f"Excluded peers file not found: {excluded_peers_path}")
-        return []
+def plan_closures(closures, fees, median_hour_fee, now):
+    hour_fee = fees['hourFee']
+    window_open = hour_fee <= max_fee_rate
+    plan = []
+
+    for closure in closures:
+        fee_rate, urgency = close_priority_fee(closure, fees, now)
+        if window_open:
+            plan.append((closure, max(min(fee_rate, max_fee_rate), hour_fee)))
+        elif urgency >= 1 and median_hour_fee is not None and hour_fee <= median_hour_fee:
+            # Waited past max_wait_days and fees are no worse than usual: stop waiting for the target.
+            plan.append((closure, hour_fee))
+
+    return plan
 
-    with open(excluded_peers_path, 'r') as f:
-        excluded_data = json.load(f)    
-    return [peer['pubkey'] for peer in excluded_data.get('EXCLUSION_LIST', [])]
+def load_excluded_peers():
+    return load_exclusions(excluded_peers_path)
 
 def get_channel_info(chan_id):
-    command = ["lncli", "getchaninfo", str(chan_id)]
-    result = subprocess.run(command, capture_output=True, text=True)
-    if result.returncode == 0:
-        return json.loads(result.stdout)
-    else:
-        print(f"Error fetching channel info: {result.stderr}")
+    try:
+        return get_client().get_chan_info(chan_id)
+    except LndError as e:
+        print(f"Error fetching channel info: {e}")
         return None
 
 def close_channel(funding_txid, output_index, sat_per_vbyte):
-    command = [
-        "lncli", "closechannel", 
-        "--funding_txid", funding_txid, 
-        "--output_index", str(output_index), 
-        "--sat_per_vbyte", str(sat_per_vbyte)
-    ]
-    result = subprocess.run(command, capture_output=True, text=True)
-    if result.returncode == 0:
-        print(f"Channel closed successfully: {result.stdout}")
-        return True
-    else:
-        print(f"Error closing channel: {result.stderr}")
+    try:
+        closing_txid = get_client().close_channel(funding_txid, output_index, sat_per_vbyte)
+    except LndError as e:
+        print(f"Error closing channel: {e}")
         return False
+    print(f"Channel closed successfully: {closing_txid}")
+    return True
 
-def calculate_movement_percentage(channel):
-    capacity = channel['capacity']
-    total_routed_in = channel['total_routed_in']
-    total_routed_out = channel['total_routed_out']
-    total_movement = total_routed_in + total_routed_out
-    movement_percentage = (total_movement / capacity) * 100 if capacity > 0 else 0
-    
-    return movement_percentage
-
-def should_close_channel(channel, excluded_peers):
-    tag = channel['tag']
-    chan_id = channel['chan_id']
-    pubkey = channel['pubkey']
-    movement_percentage = calculate_movement_percentage(channel)
-
-    if pubkey in excluded_peers:
-        print_with_timestamp(f"Channel {chan_id} is in the excluded peers list, skipping.")
-        return False
+def advance_closure(conn, closure, open_chan_ids, htlc_snapshot):
+    chan_id = closure['chan_id']
 
-    if tag == 'new_channel':
-        print_with_timestamp(f"Channel {chan_id} is a new channel, skipping.")
-        return False
+    if closure['state'] != STATE_CLOSING and chan_id not in open_chan_ids:
+        print_with_timestamp(f"Channel {chan_id} is no longer open, removing it from the closure queue.")
+        update_closure(conn, closure, state=STATE_CLOSED)
+        return
 
-    if tag == 'source':
-        last_incoming_activity = channel['last_incoming_activity']
-        if days_since_activity(last_incoming_activity) > days_inactive_source:
-            if movement_percentage < movement_threshold_perc:
-                print_with_timestamp(f"Channel {chan_id} is a source channel and meets criteria for closure.")
-                return True
-            else:
-                print_with_timestamp(f"Channel {chan_id} movement percentage ({movement_percentage}%) is above threshold ({movement_threshold_perc}%), skipping.")
-        else:
-            print_with_timestamp(f"Channel {chan_id} has incoming activity within {days_inactive_source} days (Last activity: {last_incoming_activity}).")
-
-    if tag == 'sink':
-        last_outgoing_activity = channel['last_outgoing_activity']
-        if days_since_activity(last_outgoing_activity) > days_inactive_sink:
-            if movement_percentage < movement_threshold_perc:
-                print_with_timestamp(f"Channel {chan_id} is a sink channel and meets criteria for closure.")
-                return True
-            else:
-                print_with_timestamp(f"Channel {chan_id} movement percentage ({movement_percentage}%) is above threshold ({movement_threshold_perc}%), skipping.")
-        else:
-            print_with_timestamp(f"Channel {chan_id} has outgoing activity within {days_inactive_sink} days (Last activity: {last_outgoing_activity}).")
-
-    if tag == 'router':
-        last_incoming_activity = channel['last_incoming_activity']
-        last_outgoing_activity = channel['last_outgoing_activity']
-        if days_since_activity(last_incoming_activity) > days_inactive_router and days_since_activity(last_outgoing_activity) > days_inactive_router:
-            if movement_percentage < movement_threshold_perc:
-                print_with_timestamp(f"Channel {chan_id} is a router channel and meets criteria for closure.")
-                return True
-            else:
-                print_with_timestamp(f"Channel {chan_id} movement percentage ({movement_percentage}%) is above threshold ({movement_threshold_perc}%), skipping.")
-        else:
-            print_with_timestamp(f"Channel {chan_id} has recent activity within {days_inactive_router} days (Last incoming: {last_incoming_activity}, Last outgoing: {last_outgoing_activity}).")
+    if closure['state'] == STATE_DISABLED and closure['chan_point']:
+        update_closure(conn, closure, state=STATE_WAITING_HTLCS, last_error=None)
 
-    print_with_timestamp(f"Channel {chan_id} does not meet any criteria for closure.")
-    return False
+    if closure['state'] == STATE_DISABLED:
+        channel_info = get_channel_info(chan_id)
+        if not channel_info or "chan_point" not in channel_info:
+            print_with_timestamp(f"Error retrieving channel info for {chan_id}, retrying on the next pass.")
+            update_closure(conn, closure, last_error="channel info unavailable")
+            return
+        update_closure(conn, closure, state=STATE_WAITING_HTLCS, chan_point=channel_info["chan_point"], last_error=None)
 
-def monitor_and_close_channels():
+    if closure['state'] == STATE_WAITING_HTLCS:
+        if check_pending_htlcs(chan_id, htlc_snapshot):
+            return
+        update_closure(conn, closure, state=STATE_WAITING_FEE)
+
+    if closure['state'] == STATE_WAITING_FEE:
+        return
+
+    if closure['state'] == STATE_CLOSING and chan_id not in open_chan_ids:
+        print_with_timestamp(f"Channel {chan_id} closure confirmed.")
+        update_closure(conn, closure, state=STATE_CLOSED)
+
+def monitor_and_close_channels(scan_candidates=True):
     excluded_peers = load_excluded_peers()
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_db(row_factory=sqlite3.Row)
+    create_pending_closures_table(conn)
+    create_fee_rate_history_table(conn)
+    create_close_candidates_table(conn)
     cursor = conn.cursor()
 
     table_name = 'opened_channels_lifetime'
     cursor.execute(f"SELECT * FROM {table_name}")
     channels_data = cursor.fetchall()
+    open_chan_ids = {str(channel['chan_id']) for channel in channels_data}
+
+    if scan_candidates:
+        queue_candidates(conn, channels_data, excluded_peers)
+
+    # Exclusions are applied before the disable pass, so a channel whose closure is cancelled is not disabled again.
+    closures = []
+    cancelled = []
+    for closure in get_pending_closures(conn):
+        excluded = excluded_peers.is_excluded(closure['pubkey'], closure['chan_id'], None, 'close')
+        if excluded and closure['state'] != STATE_CLOSING and closure['chan_id'] in open_chan_ids:
+            print_with_timestamp(f"Channel {closure['chan_id']} was excluded after being queued, cancelling its closure and enabling it again.")
+            cancelled.append(closure)
+        else:
+            closures.append(closure)
+    for closure in set_channel_policies(conn, channels_to_disable(closures, open_chan_ids), cancelled):
+        update_closure(conn, closure, state=STATE_CANCELLED)
 
-    channels_closed = False
+    htlc_snapshot = get_snapshot() if closures else None
+    for closure in closures:
+        advance_closure(conn, closure, open_chan_ids, htlc_snapshot)
 
-    for channel in channels_data:
-        chan_id = channel['chan_id']
-        pubkey = channel['pubkey']
+    execute_closure_plan(conn, open_chan_ids)
+    conn.close()
 
-        if pubkey in excluded_peers:
-            print_with_timestamp(f"Channel {chan_id} is in the excluded peers list, skipping.")
-            continue
+def queue_candidates(conn, channels_data, excluded_peers):
+    create_liquidity_tables(conn)
+    candidates = rank_candidates(channels_data, excluded_peers, get_liquidity(conn))
+    save_close_candidates(conn, candidates)
 
-        if should_close_channel(channel, excluded_peers):
-            print_with_timestamp(f"Closing channel {chan_id}...")
-            config_path = create_or_update_config(chan_id)
-            execute_charge_lnd(config_path)
-
-            channel_info = get_channel_info(chan_id)
-            if channel_info and "chan_point" in channel_info:
-                funding_txid, output_index = channel_info["chan_point"].split(':')
-                if not check_pending_htlcs(chan_id, db_path):
-                    while True:
-                        high_priority_fee = get_high_priority_fee()
-                        if high_priority_fee is not None:
-                            if high_priority_fee <= max_fee_rate:
-                                print(f"Closing channel {chan_id} with high priority fee {high_priority_fee}.")
-                                close_channel(funding_txid, output_index, high_priority_fee)
-                                channels_closed = True
-                                break
-                            else:
-                                print(f"High priority fee {high_priority_fee} is too high. Waiting 1 hour to check again.")
-                                time.sleep(3600)
-                        else:
-                            print("Failed to retrieve high priority fee. Retrying in 1 hour...")
-                            time.sleep(3600)
-            else:
-                print(f"Error retrieving channel info for {chan_id}.")
-
-    if not channels_closed:
-        print_with_timestamp("No channels were closed. All channels are either excluded or do not meet the criteria.")
+    # Failed closures are not queued again automatically; deleting the pending_closures row allows it.
+    pending = {closure['chan_id'] for closure in get_pending_closures(conn)} | get_failed_chan_ids(conn)
+    channels_queued = False
 
-    conn.close()
+    for candidate in candidates:
+        if not candidate['eligible'] or candidate['chan_id'] in pending:
+            continue
+        print_with_timestamp(f"Channel {candidate['chan_id']} ({candidate['alias']}) ranked #{candidate['rank']} for closure: "
+                             f"{candidate['tag']}, inactive {candidate['inactive_days']} days, movement {candidate['movement_percentage']}%, "
+                             f"score {candidate['score']} ppm/year. Disabling and queueing it for closure...")
+        queue_closure(conn, candidate['chan_id'], candidate['pubkey'])
+        channels_queued = True
+
+    if not channels_queued:
+        print_with_timestamp("No new channels were queued for closure. All channels are either excluded or do not meet the criteria.")
+
+def release_failed_closures(conn, failed, open_chan_ids):
+    # Channels that cannot be closed leave the queue and are enabled again instead of staying disabled forever.
+    if not failed:
+        return
+    failed_ids = {closure['chan_id'] for closure in failed}
+    queued = [closure for closure in get_pending_closures(conn) if closure['chan_id'] not in failed_ids]
+    for closure in set_channel_policies(conn, channels_to_disable(queued, open_chan_ids), failed):
+        print_with_timestamp(f"Giving up on closing channel {closure['chan_id']} after {closure['attempts']} failed attempts, enabling it again.")
+        update_closure(conn, closure, state=STATE_FAILED)
+
+def execute_closure_plan(conn, open_chan_ids):
+    # Fees are sampled on every pass, queue or not, so the median is already there when the first channel is queued.
+    fees = get_recommended_fees()
+    now = int(time.time())
+    if fees is not None:
+        record_fee_rates(conn, fees, now)
+
+    waiting = [closure for closure in get_pending_closures(conn) if closure['state'] == STATE_WAITING_FEE]
+    exhausted = [closure for closure in waiting if closure['attempts'] >= max_close_attempts]
+    waiting = [closure for closure in waiting if closure['attempts'] < max_close_attempts]
+    if not waiting:
+        release_failed_closures(conn, exhausted, open_chan_ids)
+        return
+
+    if fees is None:
+        print_with_timestamp(f"Failed to retrieve recommended fees, {len(waiting)} channels stay queued.")
+        release_failed_closures(conn, exhausted, open_chan_ids)
+        return
+
+    median_hour_fee = get_median_hour_fee(conn)
+    plan = plan_closures(waiting, fees, median_hour_fee, now)
+
+    if not plan:
+        print_with_timestamp(f"Hour fee {fees['hourFee']} sat/vB is above the target of {max_fee_rate} sat/vB, {len(waiting)} channels stay queued.")
+        release_failed_closures(conn, exhausted, open_chan_ids)
+        return
+
+    print_with_timestamp(f"Hour fee is {fees['hourFee']} sat/vB, closing {len(plan)} of {len(waiting)} queued channels together.")
+    for closure, fee_rate in plan:
+        funding_txid, output_index = closure['chan_point'].split(':')
+        print_with_timestamp(f"Closing channel {closure['chan_id']} at {fee_rate} sat/vB.")
+        if close_channel(funding_txid, output_index, fee_rate):
+            update_closure(conn, closure, state=STATE_CLOSING, close_fee_rate=fee_rate, last_error=None)
+            continue
+        update_closure(conn, closure, attempts=closure['attempts'] + 1, last_error="close request failed")
+        if closure['attempts'] >= max_close_attempts:
+            exhausted.append(closure)
+    release_failed_closures(conn, exhausted, open_chan_ids)
+
+def main():
+    global last_candidate_scan
+    now = time.time()
+    scan_candidates = now - last_candidate_scan >= candidate_scan_interval
+    monitor_and_close_channels(scan_candidates)
+    if scan_candidates:
+        last_candidate_scan = now
 
 if __name__ == "__main__":
     while True:
-        monitor_and_close_channels()
+        main()
+        time.sleep(charge_lnd_interval)
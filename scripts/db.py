@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import threading
+import configparser
+from collections import namedtuple
+
+from migrations import migrate
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+def expand_path(path):
+    if not os.path.isabs(path):
+        return os.path.join(os.path.expanduser("~"), path)
+    return os.path.expanduser(path)
+
+DB_PATH = expand_path(config['Paths']['db_path'])
+LNDG_DB_PATH = expand_path(config['Paths']['lndg_db_path'])
+LNDG_MIRROR_PATH = expand_path(config.get('Paths', 'lndg_mirror_path', fallback='automator-lnd/data/lndg_mirror.db'))
+LNDG_MIRROR = config.getboolean('Control', 'enable_lndg_mirror', fallback=False)
+LND_STORE_PATH = expand_path(config.get('Paths', 'lnd_store_path', fallback='automator-lnd/data/lnd_store.db'))
+DATA_SOURCE = config.get('Data_source', 'backend', fallback='lndg')
+DB_TIMEOUT = config.getint('Database', 'timeout', fallback=30)
+SYNCHRONOUS = config.get('Database', 'synchronous', fallback='NORMAL')
+CACHE_SIZE_MB = config.getint('Database', 'cache_size_mb', fallback=64)
+MMAP_SIZE_MB = config.getint('Database', 'mmap_size_mb', fallback=256)
+
+_local = threading.local()
+_row_types = {}
+
+class PooledConnection(sqlite3.Connection):
+    # Callers keep their connect/close pairs; close() only ends the open transaction and the
+    # connection stays in the thread's pool for the next caller.
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def release(self):
+        super().close()
+
+def typed_row(cursor, row):
+    # Rows become namedtuples: channel.alias instead of channel[5], while unpacking and indexing keep working.
+    fields = tuple(column[0] for column in cursor.description)
+    row_type = _row_types.get(fields)
+    if row_type is None:
+        row_type = _row_types.setdefault(fields, namedtuple('Row', fields, rename=True))
+    return row_type(*row)
+
+def tune(conn):
+    conn.execute(f"PRAGMA cache_size = {-CACHE_SIZE_MB * 1024}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_MB * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+def connect(path=DB_PATH, read_only=False, factory=sqlite3.Connection):
+    # WAL lets the jobs read database.db while get_channels_data writes it; NORMAL sync is durable across crashes in WAL mode.
+    if read_only:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=DB_TIMEOUT, factory=factory)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=DB_TIMEOUT, factory=factory)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+    tune(conn)
+    return conn
+
+def connect_lndg(path=LNDG_DB_PATH, factory=sqlite3.Connection):
+    # LNDg owns its database: mode=ro means we never take a write lock on it, TEMP tables still work.
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=DB_TIMEOUT, factory=factory)
+    tune(conn)
+    return conn
+
+def _pooled(key, opener, row_factory):
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = {}
+    conn = pool.get((key, row_factory))
+    if conn is None:
+        conn = pool[(key, row_factory)] = opener(factory=PooledConnection)
+        conn.row_factory = row_factory
+    return conn
+
+def open_migrated(factory=sqlite3.Connection):
+    conn = connect(DB_PATH, factory=factory)
+    migrate(conn)
+    return conn
+
+def get_db(row_factory=None):
+    return _pooled(('db', DB_PATH), open_migrated, row_factory)
+
+def get_lndg_db(row_factory=None):
+    # The collectors query LNDg's gui_* tables. With the lnd backend, lnd_source.py fills the same tables from LND itself.
+    if DATA_SOURCE == 'lnd':
+        return _pooled(('lnd_store', LND_STORE_PATH), lambda factory: connect_lndg(LND_STORE_PATH, factory=factory), row_factory)
+    # With the mirror job enabled, analytics read its indexed copy of the LNDg tables once the first full sync
+    # has finished (lndg_mirror.py sets user_version), and LNDg's own database until then.
+    if LNDG_MIRROR and os.path.exists(LNDG_MIRROR_PATH):
+        conn = _pooled(('lndg_mirror', LNDG_MIRROR_PATH), lambda factory: connect_lndg(LNDG_MIRROR_PATH, factory=factory), row_factory)
+        if conn.execute("PRAGMA user_version").fetchone()[0] > 0:
+            return conn
+    return _pooled(('lndg', LNDG_DB_PATH), lambda factory: connect_lndg(LNDG_DB_PATH, factory=factory), row_factory)
+
+def close_thread_connections():
+    for conn in getattr(_local, 'pool', {}).values():
+        conn.release()
+    _local.pool = {}
@@ -0,0 +1,89 @@
+import os
+import json
+import logging
+import threading
+import configparser
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+def expand_path(path):
+    if not os.path.isabs(path):
+        return os.path.join(os.path.expanduser("~"), path)
+    return os.path.expanduser(path)
+
+EXCLUSION_FILE_PATH = expand_path(config['Paths']['excluded_peers_path'])
+FEATURES = ('autofee', 'close', 'rebalance', 'swap_out')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+class ExclusionIndex:
+    def __init__(self, pubkeys=frozenset(), chan_ids=frozenset(), tags=frozenset(), features=None):
+        self.pubkeys = pubkeys
+        self.chan_ids = chan_ids
+        self.tags = tags
+        self.features = features or {}
+
+    def __contains__(self, pubkey):
+        return pubkey in self.pubkeys
+
+    def is_excluded(self, pubkey=None, chan_id=None, tag=None, feature=None):
+        chan_id = str(chan_id) if chan_id is not None else None
+        if pubkey in self.pubkeys or chan_id in self.chan_ids or tag in self.tags:
+            return True
+
+        scoped = self.features.get(feature)
+        if scoped is None:
+            return False
+        pubkeys, chan_ids, tags = scoped
+        return pubkey in pubkeys or chan_id in chan_ids or tag in tags
+
+def build_index(exclusion_data):
+    # Entries without "features" are excluded from every job, otherwise only from the listed ones.
+    sections = (
+        ('EXCLUSION_LIST', 'pubkey', 0),
+        ('EXCLUDED_CHANNELS', 'chan_id', 1),
+        ('EXCLUDED_TAGS', 'tag', 2),
+    )
+    global_sets = (set(), set(), set())
+    feature_sets = {feature: (set(), set(), set()) for feature in FEATURES}
+
+    for section, key, position in sections:
+        for entry in exclusion_data.get(section, []):
+            value = str(entry[key])
+            features = entry.get('features')
+            if not features:
+                global_sets[position].add(value)
+                continue
+            for feature in features:
+                if feature not in feature_sets:
+                    logging.warning(f"Unknown exclusion feature '{feature}' for {key} {value}, ignoring.")
+                    continue
+                feature_sets[feature][position].add(value)
+
+    return ExclusionIndex(
+        frozenset(global_sets[0]),
+        frozenset(global_sets[1]),
+        frozenset(global_sets[2]),
+        {feature: tuple(frozenset(values) for values in sets) for feature, sets in feature_sets.items()},
+    )
+
+def load_exclusions(path=EXCLUSION_FILE_PATH):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        logging.warning(f"Excluded peers file not found: {path}")
+        return ExclusionIndex()
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(path, 'r') as exclusion_file:
+            index = build_index(json.load(exclusion_file))
+        _cache[path] = (signature, index)
+        return index
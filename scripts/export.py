@@ -0,0 +1,145 @@
+import os
+import json
+import sqlite3
+import hashlib
+import configparser
+from datetime import datetime, timezone
+
+from db import connect
+from snapshots import list_partitions
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+def expand_path(path):
+    if not os.path.isabs(path):
+        return os.path.join(os.path.expanduser("~"), path)
+    return os.path.expanduser(path)
+
+DB_PATH = expand_path(config['Paths']['db_path'])
+EXPORT_DIR = expand_path(config.get('Paths', 'export_dir', fallback='automator-lnd/data/export'))
+EXPORT_FORMAT = config.get('Export', 'format', fallback='parquet')
+MANIFEST_NAME = '_manifest.json'
+ARROW_TYPES = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string'}
+
+def connect_db():
+    # Read-only: the export never takes a write lock on the database the other jobs are using.
+    return connect(DB_PATH, read_only=True)
+
+def load_manifest():
+    try:
+        with open(os.path.join(EXPORT_DIR, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest):
+    path = os.path.join(EXPORT_DIR, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def declared_types(conn, table):
+    return {row[1]: ARROW_TYPES.get(row[2].upper()) for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def build_table(columns, rows, types):
+    arrays = []
+    for i, column in enumerate(columns):
+        array = pa.array([row[i] for row in rows])
+        # A column that is all NULL in one partition would otherwise get a null type and break the dataset schema.
+        if pa.types.is_null(array.type) and types.get(column):
+            array = array.cast(types[column])
+        arrays.append(array)
+    return pa.table(arrays, names=columns)
+
+def write_partition(dataset, partition, table):
+    # Hive-style layout (dataset/key=value/part.ext) so pyarrow.dataset discovers the partitions on its own.
+    directory = os.path.join(EXPORT_DIR, dataset, partition)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part.{'arrow' if EXPORT_FORMAT == 'arrow' else 'parquet'}")
+    # Written to a temp file first so a notebook never maps a half-written partition.
+    if EXPORT_FORMAT == 'arrow':
+        with pa.OSFile(path + '.tmp', 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def export_partition(conn, manifest, dataset, partition, fingerprint, table, query, params=()):
+    # A partition is only rewritten when its fingerprint changed, so closed months cost one cheap query per cycle.
+    key = f"{dataset}/{partition}"
+    if manifest.get(key) == fingerprint:
+        return False
+    cursor = conn.execute(query, params)
+    columns = [column[0] for column in cursor.description]
+    write_partition(dataset, partition, build_table(columns, cursor.fetchall(), declared_types(conn, table)))
+    manifest[key] = fingerprint
+    return True
+
+def export_daily_rollups(conn, manifest):
+    written = 0
+    for table in list_partitions(conn, 'daily'):
+        count, latest = conn.execute(f"SELECT COUNT(*), MAX(timestamp) FROM {table}").fetchone()
+        month = table.rsplit('_', 1)[1]
+        written += export_partition(conn, manifest, 'channel_snapshots_daily', f"month={month}", [count, latest], table,
+                                    f"SELECT * FROM {table} ORDER BY timestamp, chan_id")
+    return written
+
+def export_opened_channels(conn, manifest):
+    # opened_channels_* are overwritten every cycle; each day's partition holds the latest copy of that day and is
+    # rewritten whenever a refresh changed the table.
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'opened_channels_%'")]
+    written = 0
+    for table in sorted(tables):
+        query = f"SELECT * FROM {table} ORDER BY chan_id"
+        fingerprint = hashlib.sha256(repr(conn.execute(query).fetchall()).encode()).hexdigest()
+        written += export_partition(conn, manifest, table, f"date={today}", fingerprint, table, query)
+    return written
+
+def export_closed_channels(conn, manifest):
+    # Partitioned by closure month; a month is rewritten when a new closure lands in it or a reconcile changed a row.
+    months = {}
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    for row in cursor.execute("SELECT * FROM closed_channels ORDER BY chan_id"):
+        months.setdefault((row['closure_date'] or 'unknown')[:7].replace('-', ''), []).append(tuple(row))
+    written = 0
+    for month, rows in months.items():
+        fingerprint = hashlib.sha256(repr(rows).encode()).hexdigest()
+        written += export_partition(conn, manifest, 'closed_channels', f"month={month}", fingerprint, 'closed_channels',
+                                    "SELECT * FROM closed_channels WHERE COALESCE(SUBSTR(closure_date, 1, 7), 'unknown') = ? ORDER BY chan_id",
+                                    ('unknown' if month == 'unknown' else f"{month[:4]}-{month[4:]}",))
+    return written
+
+def main():
+    if pa is None:
+        print("pyarrow is not installed, skipping the export. Install it with: pip install pyarrow")
+        return
+    if not os.path.exists(DB_PATH):
+        print(f"Database {DB_PATH} not found, nothing to export.")
+        return
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    manifest = load_manifest()
+    conn = connect_db()
+    try:
+        written = export_daily_rollups(conn, manifest)
+        written += export_opened_channels(conn, manifest)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'closed_channels' in tables:
+            written += export_closed_channels(conn, manifest)
+    finally:
+        conn.close()
+        save_manifest(manifest)
+    print(f"Exported {written} partitions to {EXPORT_DIR}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import os
+import time
+import logging
+import configparser
+
+from db import get_db
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+MAX_FEE_THRESHOLD = int(config['Autofee']['max_fee_threshold'])
+INCREASE_PPM = int(config['Autofee']['increase_ppm'])
+DECREASE_PPM = int(config['Autofee']['decrease_ppm'])
+REBAL_MARGIN = config.getfloat('Autofee', 'rebal_margin', fallback=0.9)
+
+TAGS = ('new_channel', 'sink', 'router', 'source')
+INPUT_FIELDS = (
+    'tag', 'capacity', 'outbound_liquidity', 'days_open', 'local_fee_rate', 'cost_ppm', 'rebal_rate',
+    'revenue_ppm', 'total_routed_out', 'routed_amount_7d',
+    'last_outgoing_activity', 'last_incoming_activity', 'last_rebalance',
+)
+# Activity fields reach the strategies as epoch seconds, copied from these integer columns
+# (autofee_engine parses the TEXT date instead when the integer column is NULL).
+ACTIVITY_EPOCH_FIELDS = {
+    'last_outgoing_activity': 'last_outgoing_ts',
+    'last_incoming_activity': 'last_incoming_ts',
+    'last_rebalance': 'last_rebalance_ts',
+}
+STRATEGIES = {}
+
+# thresholds lists the (activity field, days) points where a strategy's decision can change with time alone.
+# None means the strategy has not declared them and has to be evaluated on every pass.
+def register_strategy(tag, name, thresholds=None):
+    if tag not in TAGS:
+        raise ValueError(f"Unknown channel tag '{tag}' for strategy '{name}'")
+
+    def decorator(function):
+        function.strategy_name = name
+        function.thresholds = thresholds
+        STRATEGIES[(tag, name)] = function
+        return function
+    return decorator
+
+def get_strategy(tag, name):
+    try:
+        return STRATEGIES[(tag, name)]
+    except KeyError:
+        available = ', '.join(sorted(n for t, n in STRATEGIES if t == tag))
+        raise KeyError(f"No '{name}' fee strategy registered for tag '{tag}' (available: {available})")
+
+def days_since_last_activity(last_activity):
+    if last_activity is None:
+        return float('inf')
+    return (time.time() - last_activity) / 86400
+
+def next_threshold_crossing(strategy, channel, now):
+    crossings = []
+    for field, days in strategy.thresholds or ():
+        timestamp = channel.get(field)
+        if timestamp is not None and timestamp + days * 86400 > now:
+            crossings.append(int(timestamp + days * 86400))
+    return min(crossings) if crossings else None
+
+def whole_days_since_last_activity(last_activity):
+    days = days_since_last_activity(last_activity)
+    return days if days == float('inf') else int(days)
+
+def get_routed_amount_7_days(channel):
+    if 'routed_amount_7d' in channel:
+        return channel['routed_amount_7d']
+
+    # The pooled connection is shared with the caller, which may be mid-transaction: read only, never close it here.
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT SUM(total_routed_in), SUM(total_routed_out)
+        FROM opened_channels_7d
+        WHERE chan_id = ?
+    """, (channel['chan_id'],))
+    
+    result = cursor.fetchone()
+    total_routed_in = result[0] if result[0] is not None else 0
+    total_routed_out = result[1] if result[1] is not None else 0
+    return total_routed_in + total_routed_out
+
+@register_strategy('new_channel', 'v1', thresholds=())
+def adjust_new_channel_fee_v1(channel):
+    outbound_ratio = channel['outbound_liquidity']
+    days_since_opening = channel['days_open']
+    local_fee_rate = channel['local_fee_rate']
+    last_outgoing = channel['last_outgoing_activity']
+    last_incoming = channel['last_incoming_activity']
+    last_rebalance = channel['last_rebalance']
+
+    if days_since_opening >= 1 and outbound_ratio == 0 and last_incoming is None and last_rebalance is None:
+        logging.info(f"Increasing fee by 10% for new channel {channel['alias']} due to no inbound or rebalance activity")
+        return int(local_fee_rate * 1.10)  # Fee Increase 10%
+    
+    if days_since_opening >=1 and 45 < outbound_ratio < 55:
+        if last_outgoing is None:
+            logging.info(f"Decreasing fee by 5% for new channel {channel['alias']} due to no outgoing activity")
+            return int(local_fee_rate * 0.95)  # Fee Decrease 5%
+        
+    if outbound_ratio >= 99 and days_since_opening >= 1 and last_outgoing is None:
+        logging.info(f"Decreasing fee by 5% for new channel {channel['alias']} due to high outbound liquidity and inactivity")
+        return int(local_fee_rate * 0.95)  # Fee Decrease 5%
+    
+    return local_fee_rate  # No Update
+
+@register_strategy('sink', 'v1', thresholds=(('last_rebalance', 2), ('last_rebalance', 22), ('last_outgoing_activity', 1)))
+def adjust_sink_fee_v1(channel):
+    outbound_ratio = channel['outbound_liquidity']
+    total_cost_ppm = channel['cost_ppm']
+    local_fee_rate = channel['local_fee_rate']
+    last_outgoing = channel['last_outgoing_activity']
+    last_rebalance = channel['last_rebalance']
+    rebal_rate = channel['rebal_rate']
+
+    if total_cost_ppm == 0 and whole_days_since_last_activity(last_rebalance) <= 21:
+        logging.info(f"Setting fee rate to 100 ppm for sink channel {channel['alias']} with recent rebalances and zero cost")
+        return 100
+    
+    elif rebal_rate > 0 and rebal_rate < 100 and whole_days_since_last_activity(last_rebalance) <= 21:
+        logging.info(f"Doubling fee rate for sink channel {channel['alias']} based on rebal_rate")
+        return int(rebal_rate * 2)
+
+    if outbound_ratio <= 10.0:
+        if whole_days_since_last_activity(last_rebalance) >= 2 and local_fee_rate < MAX_FEE_THRESHOLD:
+            logging.info(f"Increasing fee by 5% for sink channel {channel['alias']} due to low outbound liquidity and recent rebalances")
+            return int(local_fee_rate * 1.05)
+        
+        elif whole_days_since_last_activity(last_rebalance) > 1 and local_fee_rate < MAX_FEE_THRESHOLD:
+            logging.info(f"Increasing fee by 3% for sink channel {channel['alias']} due to recent rebalances")
+            return int(local_fee_rate * 1.03)
+        
+    elif 10.0 < outbound_ratio < 30.0:
+        if whole_days_since_last_activity(last_rebalance) >= 2:
+            logging.info(f"Increasing fee by 2% for sink channel {channel['alias']} with moderate outbound liquidity")
+            return int(local_fee_rate * 1.02)
+        
+        elif whole_days_since_last_activity(last_outgoing) >= 1:
+            new_fee = int(local_fee_rate * 0.98)
+            logging.info(f"Decreasing fee by 2% for sink channel {channel['alias']} due to recent outgoing activity")
+            return new_fee if new_fee > rebal_rate else local_fee_rate
+        
+    elif outbound_ratio >= 30.0 and whole_days_since_last_activity(last_outgoing) >= 1:
+        new_fee = int(local_fee_rate * 0.98)
+        logging.info(f"Decreasing fee by 2% for sink channel {channel['alias']} with high outbound liquidity")
+        return new_fee if new_fee > total_cost_ppm else local_fee_rate
+
+    if last_rebalance is not None and whole_days_since_last_activity(last_rebalance) > 21:
+        logging.info(f"Setting fee rate to 2500 ppm for sink channel {channel['alias']} due to inactivity in rebalances")
+        return 2500
+
+    return 500 if rebal_rate == 0 else int(rebal_rate / 0.9)
+
+@register_strategy('router', 'v1', thresholds=(('last_rebalance', 1), ('last_rebalance', 2), ('last_outgoing_activity', 1), ('last_outgoing_activity', 3)))
+def adjust_router_fee_v1(channel):
+    outbound_ratio = channel['outbound_liquidity']
+    total_cost_ppm = channel['cost_ppm']
+    local_fee_rate = channel['local_fee_rate']
+    last_outgoing = channel['last_outgoing_activity']
+    last_incoming = channel['last_incoming_activity']
+    last_rebalance = channel['last_rebalance']
+    rebal_rate = channel['rebal_rate']
+    channel_capacity = channel['capacity']
+    routed_amount = get_routed_amount_7_days(channel)
+
+    if whole_days_since_last_activity(last_rebalance) > 1 and routed_amount < (channel_capacity * 0.5) and outbound_ratio <= 10:
+        logging.info(f"Increasing fee by 50% for router channel {channel['alias']} due to low liquidity and inactivity")
+        return int(local_fee_rate * 1.5)
+    
+    elif total_cost_ppm == 0 and outbound_ratio <= 10:
+        logging.info(f"Increasing fee by 25% for router channel {channel['alias']} due to low liquidity")
+        return int(local_fee_rate * 1.25)
+    
+    elif total_cost_ppm == 0 and outbound_ratio > 10:
+        logging.info(f"Setting fee rate to 50 ppm for router channel {channel['alias']} due to zero cost and higher liquidity")
+        return 50
+    
+    elif routed_amount >= 2 * channel_capacity and local_fee_rate < 100:
+        logging.info(f"Setting fee rate to 100 ppm for router channel {channel['alias']} with high routing activity")
+        return 100
+    
+    elif 0 < total_cost_ppm < 100:
+        logging.info(f"Doubling fee rate for router channel {channel['alias']} due to low cost")
+        return int(total_cost_ppm * 2)
+    
+    elif outbound_ratio <= 10.0:
+        if whole_days_since_last_activity(last_rebalance) >= 1 and local_fee_rate < MAX_FEE_THRESHOLD:
+            logging.info(f"Increasing fee by 3% for low liquidity in router channel {channel['alias']}")
+            return int(local_fee_rate * 1.03)
+        
+        elif whole_days_since_last_activity(last_rebalance) < 1 and local_fee_rate < MAX_FEE_THRESHOLD:
+            logging.info(f"Increasing fee by 2% for recent activity in router channel {channel['alias']}")
+            return int(local_fee_rate * 1.02)
+        
+    elif 10.0 < outbound_ratio < 30.0:
+        if whole_days_since_last_activity(last_rebalance) >= 1:
+            logging.info(f"Increasing fee by 25 ppm for router channel {channel['alias']} with moderate liquidity")
+            return int(local_fee_rate + 25)
+        
+        elif whole_days_since_last_activity(last_outgoing) >= 1:
+            new_fee = int(local_fee_rate * 0.98)
+            logging.info(f"Decreasing fee by 2% for router channel {channel['alias']} due to recent outgoing activity")
+            return max(new_fee, rebal_rate)
+        
+    elif outbound_ratio >= 30.0 and whole_days_since_last_activity(last_outgoing) >= 3:
+        new_fee = int(local_fee_rate - 25)
+        logging.info(f"Decreasing fee by 25 ppm for router channel {channel['alias']} with high liquidity")
+        return max(new_fee, total_cost_ppm)
+    
+    elif outbound_ratio >= 30.0 and whole_days_since_last_activity(last_outgoing) >= 1:
+        new_fee = int(local_fee_rate * 0.98)
+        logging.info(f"Decreasing fee by 2% for router channel {channel['alias']} with recent activity and high liquidity")
+        return max(new_fee, total_cost_ppm)
+    
+    else:
+        logging.info(f"Setting minimum fee rate of 100 ppm for router channel {channel['alias']} with no other conditions met")
+        return 100 if total_cost_ppm == 0 else int(total_cost_ppm / 0.9)
+
+@register_strategy('source', 'v1', thresholds=())
+def adjust_source_fee_v1(channel):
+    total_routed_out = channel['total_routed_out']
+
+    if total_routed_out > 0:
+        logging.info(f"Setting fee rate to 10 ppm for source channel {channel['alias']} due to routed activity")
+        return 10
+    
+    else:
+        logging.info(f"Setting fee rate to 0 ppm for inactive source channel {channel['alias']}")
+        return 0
+
+@register_strategy('new_channel', 'v2', thresholds=())
+def adjust_new_channel_fee_v2(channel):
+    outbound_ratio = channel['outbound_liquidity']
+    days_since_opening = channel['days_open']
+    local_fee_rate = channel['local_fee_rate']
+    last_outgoing = channel['last_outgoing_activity']
+    last_incoming = channel['last_incoming_activity']
+    last_rebalance = channel['last_rebalance']
+
+    if days_since_opening >= 0.5 and outbound_ratio == 0 and last_incoming is None and last_rebalance is None:
+        logging.info(f"Increasing fee by 10% for new channel {channel['alias']} due to no inbound or rebalance activity")
+        return int(local_fee_rate * 1.10)  # Fee Increase 10%
+    
+    if days_since_opening >= 0.5 and 45 < outbound_ratio < 55:
+        if last_outgoing is None:
+            logging.info(f"Decreasing fee by 5% for new channel {channel['alias']} due to no outgoing activity")
+            return int(local_fee_rate * 0.95)  # Fee Decrease 5%
+        
+    if outbound_ratio >= 99 and days_since_opening >= 0.5 and last_outgoing is None:
+        logging.info(f"Decreasing fee by 5% for new channel {channel['alias']} due to high outbound liquidity and inactivity")
+        return int(local_fee_rate * 0.95)  # Fee Decrease 5%
+    
+    return local_fee_rate  # No Update
+
+@register_strategy('sink', 'v2', thresholds=(('last_rebalance', 0.5), ('last_rebalance', 21), ('last_outgoing_activity', 0.25), ('last_outgoing_activity', 0.5)))
+def adjust_sink_fee_v2(channel):
+    outbound_ratio = channel['outbound_liquidity']
+    total_cost_ppm = channel['cost_ppm']
+    local_fee_rate = channel['local_fee_rate']
+    last_outgoing = channel['last_outgoing_activity']
+    last_rebalance = channel['last_rebalance']
+    rebal_rate = channel['rebal_rate']
+
+    if last_rebalance is not None and days_since_last_activity(last_rebalance) > 21 and outbound_ratio < 10:
+        logging.info(f"Setting fee rate to 2500 ppm for sink channel {channel['alias']} due to inactivity in rebalances")
+        return 2500
+
+    # Increases: outbound < 10%
+    if outbound_ratio < 10.0:
+        if days_since_last_activity(last_rebalance) >= 0.50 and local_fee_rate < MAX_FEE_THRESHOLD:
+            new_fee = local_fee_rate + INCREASE_PPM
+            logging.info(f"Increasing fee by {INCREASE_PPM} ppm for sink channel {channel['alias']} due to low outbound liquidity and recent rebalances")
+            return min(new_fee, MAX_FEE_THRESHOLD)
+
+    # Decreases: outbound >= 10%
+    if outbound_ratio >= 10.0:
+        if days_since_last_activity(last_outgoing) >= 0.5 and local_fee_rate > (rebal_rate / REBAL_MARGIN) and rebal_rate != 0:
+            new_fee = int(rebal_rate / REBAL_MARGIN)
+            logging.info(f"Decreasing fee by {DECREASE_PPM} ppm for sink channel {channel['alias']} with sufficient outbound liquidity")
+            return new_fee
+        
+        if days_since_last_activity(last_outgoing) >= 0.5 and local_fee_rate > rebal_rate and rebal_rate == 0:
+            new_fee = local_fee_rate - DECREASE_PPM
+            logging.info(f"Decreasing fee by {DECREASE_PPM} ppm for sink channel {channel['alias']} with sufficient outbound liquidity")
+            return new_fee
+        
+        elif days_since_last_activity(last_outgoing) >= 0.25:
+            new_fee = max(local_fee_rate - DECREASE_PPM, rebal_rate)
+            logging.info(f"Decreasing fee by {DECREASE_PPM} ppm for sink channel {channel['alias']} with sufficient outbound liquidity")
+            return new_fee
+
+    return local_fee_rate
+
+@register_strategy('router', 'v2', thresholds=(('last_rebalance', 0.5), ('last_rebalance', 1.5), ('last_outgoing_activity', 0.5), ('last_outgoing_activity', 0.75)))
+def adjust_router_fee_v2(channel):
+    outbound_ratio = channel['outbound_liquidity']
+    total_cost_ppm = channel['cost_ppm']
+    local_fee_rate = channel['local_fee_rate']
+    last_outgoing = channel['last_outgoing_activity']
+    last_incoming = channel['last_incoming_activity']
+    last_rebalance = channel['last_rebalance']
+    rebal_rate = channel['rebal_rate']
+    revenue_ppm = channel['revenue_ppm']
+    channel_capacity = channel['capacity']
+    if 'routed_amount_7d' in channel:
+        routed_amount = channel['routed_amount_7d']
+    else:
+        routed_amount = get_routed_amount_7_days(channel)
+
+    if days_since_last_activity(last_rebalance) > 1.5 and outbound_ratio < 10:
+        new_fee = 1500
+        logging.info(f"Setting fee rate to 1500 ppm for router channel {channel['alias']} due to inactivity in rebalances")
+        return new_fee
+
+    # Increases: outbound < 10%
+    if outbound_ratio < 10.0:
+        if days_since_last_activity(last_rebalance) >= 0.50 and local_fee_rate < MAX_FEE_THRESHOLD:
+            new_fee = local_fee_rate + INCREASE_PPM
+            logging.info(f"Increasing fee by {INCREASE_PPM} ppm for router channel {channel['alias']} due to low outbound liquidity and recent rebalances")
+            return min(new_fee, MAX_FEE_THRESHOLD)
+   
+    # Decreases: outbound >= 10%
+    if outbound_ratio >= 10.0:
+        if days_since_last_activity(last_outgoing) >= 0.5 and local_fee_rate > (rebal_rate / REBAL_MARGIN) and rebal_rate != 0:
+            new_fee = int(rebal_rate / REBAL_MARGIN)
+            logging.info(f"Decreasing fee to {new_fee} ppm for router channel {channel['alias']} with sufficient outbound liquidity and few outgoing")
+            return new_fee
+        
+        elif days_since_last_activity(last_outgoing) >= 0.5 and local_fee_rate > rebal_rate and rebal_rate == 0:
+            new_fee = revenue_ppm
+            logging.info(f"Decreasing fee to {new_fee} ppm for router channel {channel['alias']} with sufficient outbound liquidity and few outgoing")
+            return new_fee
+
+        elif days_since_last_activity(last_outgoing) >= 0.5:
+            new_fee = max(local_fee_rate - DECREASE_PPM, rebal_rate)
+            logging.info(f"Decreasing fee by {DECREASE_PPM} ppm for router channel {channel['alias']} with sufficient outbound liquidity")
+            return new_fee
+
+        elif routed_amount < (channel_capacity * 0.5) and days_since_last_activity(last_outgoing) > 0.75:
+            logging.info(f"Increasing fee by 50% for router channel {channel['alias']} due to low routing activity and liquidity")
+            return int(local_fee_rate * 1.5)
+        
+        elif total_cost_ppm == 0:
+            new_fee = 100
+            logging.info(f"Setting minimum fee rate of 100 ppm for router channel {channel['alias']} with no other conditions met")
+            return new_fee
+        
+        elif outbound_ratio > 10 and total_cost_ppm != 0:
+            new_fee = int(total_cost_ppm / 0.9)
+            logging.info(f"Setting fee rate to {new_fee} ppm for router channel {channel['alias']} with outbound > 10% and total cost > 0")
+            return new_fee
+    
+    return local_fee_rate
+
+@register_strategy('source', 'v2', thresholds=())
+def adjust_source_fee_v2(channel):
+    total_routed_out = channel['total_routed_out']
+
+    if total_routed_out > 0:
+        logging.info(f"Setting fee rate to 10 ppm for source channel {channel['alias']} due to routed activity")
+        return 10
+    
+    else:
+        logging.info(f"Setting fee rate to 0 ppm for inactive source channel {channel['alias']}")
+        return 0
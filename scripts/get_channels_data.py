@@ -1,32 +1,27 @@
-import sqlite3
 import json
 import os
 import requests
 import configparser
 from datetime import datetime, timedelta, timezone
 
+from db import get_db, get_lndg_db, typed_row
+from migrations import backfill_epoch
+from liquidity import create_liquidity_tables, update_liquidity
+from snapshots import record_channel_snapshots, maintain_snapshots
+
 config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
 config = configparser.ConfigParser()
 config.read(config_file_path)
 
-def expand_path(path):
-    if not os.path.isabs(path):
-        return os.path.join(os.path.expanduser("~"), path)
-    return os.path.expanduser(path)
-
-LNDG_DB_PATH = expand_path(config['Paths']['lndg_db_path'])
-DB_PATH = expand_path(config['Paths']['db_path'])
 PERIOD = int(config['Get_channels_data']['period'])
 ROUTER_FACTOR = float(config['Get_channels_data']['router_factor'])
 MEMPOOL_API_URL_BASE = config['API']['mempool_api_url_base']
 
 def connect_db():
-    conn = sqlite3.connect(LNDG_DB_PATH, timeout=30)
-    return conn
+    return get_lndg_db(row_factory=typed_row)
 
 def connect_new_db():
-    conn = sqlite3.connect(DB_PATH, timeout=30)
-    return conn
+    return get_db()
 
 def create_personalized_table(conn, PERIOD):
     cursor = conn.cursor()
@@ -67,7 +62,11 @@ def create_personalized_table(conn, PERIOD):
         local_inbound_base_fee INTEGER,
         last_outgoing_activity TEXT,
         last_incoming_activity TEXT,
-        last_rebalance TEXT
+        last_rebalance TEXT,
+        opening_ts INTEGER,
+        last_outgoing_ts INTEGER,
+        last_incoming_ts INTEGER,
+        last_rebalance_ts INTEGER
     )
     """)
     conn.commit()
@@ -112,7 +111,11 @@ def create_tables(conn):
         local_inbound_base_fee INTEGER,
         last_outgoing_activity TEXT,
         last_incoming_activity TEXT,
-        last_rebalance TEXT
+        last_rebalance TEXT,
+        opening_ts INTEGER,
+        last_outgoing_ts INTEGER,
+        last_incoming_ts INTEGER,
+        last_rebalance_ts INTEGER
     )
     """)
 
@@ -153,7 +156,11 @@ def create_tables(conn):
         local_inbound_base_fee INTEGER,
         last_outgoing_activity TEXT,
         last_incoming_activity TEXT,
-        last_rebalance TEXT
+        last_rebalance TEXT,
+        opening_ts INTEGER,
+        last_outgoing_ts INTEGER,
+        last_incoming_ts INTEGER,
+        last_rebalance_ts INTEGER
     )
     """)
 
@@ -194,7 +201,11 @@ def create_tables(conn):
         local_inbound_base_fee INTEGER,
         last_outgoing_activity TEXT,
         last_incoming_activity TEXT,
-        last_rebalance TEXT
+        last_rebalance TEXT,
+        opening_ts INTEGER,
+        last_outgoing_ts INTEGER,
+        last_incoming_ts INTEGER,
+        last_rebalance_ts INTEGER
     )
     """)
 
@@ -235,7 +246,11 @@ def create_tables(conn):
         local_inbound_base_fee INTEGER,
         last_outgoing_activity TEXT,
         last_incoming_activity TEXT,
-        last_rebalance TEXT
+        last_rebalance TEXT,
+        opening_ts INTEGER,
+        last_outgoing_ts INTEGER,
+        last_incoming_ts INTEGER,
+        last_rebalance_ts INTEGER
     )
     """)
     
@@ -251,9 +266,10 @@ def upsert_channel_data(conn, data, table):
         assisted_revenue, assisted_revenue_ppm, profit, profit_ppm, profit_margin, sats_per_day_profit, sats_per_day_assisted, 
         apy, iapy, local_fee_rate, local_base_fee, remote_fee_rate, remote_base_fee, 
         local_inbound_fee_rate, local_inbound_base_fee,
-        last_outgoing_activity, last_incoming_activity, last_rebalance
+        last_outgoing_activity, last_incoming_activity, last_rebalance,
+        opening_ts, last_outgoing_ts, last_incoming_ts, last_rebalance_ts
     ) 
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ON CONFLICT(chan_id) DO UPDATE SET
         pubkey=excluded.pubkey,
         alias=excluded.alias,
@@ -288,7 +304,11 @@ def upsert_channel_data(conn, data, table):
         local_inbound_base_fee=excluded.local_inbound_base_fee,
         last_outgoing_activity=excluded.last_outgoing_activity,
         last_incoming_activity=excluded.last_incoming_activity,
-        last_rebalance=excluded.last_rebalance
+        last_rebalance=excluded.last_rebalance,
+        opening_ts=excluded.opening_ts,
+        last_outgoing_ts=excluded.last_outgoing_ts,
+        last_incoming_ts=excluded.last_incoming_ts,
+        last_rebalance_ts=excluded.last_rebalance_ts
     """, data)
     conn.commit()
 
@@ -370,6 +390,9 @@ def tag(conn, chan_id, total_routed_in, total_routed_out, days_open):
     if days_open is None:
         days_open = lifetime_days_open or 0
 
+    return classify_channel(total_routed_in, total_routed_out, days_open)
+
+def classify_channel(total_routed_in, total_routed_out, days_open):
     if days_open < 7:
         if total_routed_in == 0 and total_routed_out == 0:
             return 'new_channel'
@@ -406,28 +429,35 @@ def remove_closed_channels(conn, active_chan_ids, table):
     
     conn.commit()
 
-def get_opening_date(funding_txid):
+def get_opening_time(funding_txid):
     if funding_txid:
-        MEMPOOL_API_URL = f"https://mempool.space/api/tx/{funding_txid}"
+        MEMPOOL_API_URL = f"{MEMPOOL_API_URL_BASE}{funding_txid}"
         try:
             response = requests.get(MEMPOOL_API_URL)
             if response.status_code == 200:
                 tx_data = response.json()
                 block_time = tx_data.get('status', {}).get('block_time')
                 if block_time:
-                    return datetime.fromtimestamp(block_time, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                    return int(block_time)
         except Exception as e:
             print(f"Error while fetching transaction {funding_txid}: {str(e)}")
     return None
 
-def calculate_days_open(opening_date):
-    if opening_date:
-        opening_date_obj = datetime.strptime(opening_date, '%Y-%m-%d %H:%M:%S')
-        current_date = datetime.now()
-        days_open = (current_date - opening_date_obj).days
-        return days_open
+def format_date(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+
+def calculate_days_open(opening_ts, now):
+    if opening_ts:
+        return (now - opening_ts) // 86400
     return 0
 
+def activity_epoch(chan_id, field, value):
+    # One malformed LNDg date must not abort the refresh of every channel; its epoch is left NULL, as the migration backfill does.
+    activity_ts = backfill_epoch(value, False)
+    if activity_ts is None and value:
+        print(f"Unreadable {field} '{value}' for channel {chan_id}, leaving its epoch empty.")
+    return activity_ts
+
 def get_last_outgoing_activity(conn, chan_id):
     query = """
     SELECT MAX(forward_date) 
@@ -508,8 +538,22 @@ def get_assisted_revenue(conn, start_date):
     """
     return conn.execute(query, (start_date,)).fetchall()
 
+def build_snapshot_rows(conn, active_channels):
+    # Lifetime counters let any two snapshots be diffed into the activity between them.
+    lifetime = {row[0]: row[1:] for row in conn.execute("""
+        SELECT chan_id, total_revenue, total_cost, total_routed_in, total_routed_out, total_rebalanced_in, assisted_revenue
+        FROM opened_channels_lifetime
+    """).fetchall()}
+    rows = []
+    for channel in active_channels:
+        counters = lifetime.get(int(channel.chan_id), (0, 0, 0, 0, 0, 0))
+        rows.append((int(channel.chan_id), channel.capacity, channel.local_balance, channel.local_fee_rate, channel.local_base_fee,
+                     channel.remote_fee_rate, channel.local_inbound_fee_rate, *counters))
+    return rows
+
 def main():
     current_date = datetime.now()
+    now = int(current_date.timestamp())
     start_date_period = (current_date - timedelta(days=PERIOD)).strftime('%Y-%m-%d %H:%M:%S')
     start_date_1d = (current_date - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
     start_date_7d = (current_date - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
@@ -525,7 +569,7 @@ def main():
     create_tables(new_conn)
     
     active_channels = get_active_channels(conn)
-    active_chan_ids = [channel[0] for channel in active_channels]
+    active_chan_ids = [channel.chan_id for channel in active_channels]
 
     periods = {
         f'opened_channels_{PERIOD}d': start_date_period if PERIOD not in [1, 7, 30] else None,
@@ -551,16 +595,16 @@ def main():
         assisted_revenue_dict = {row[0]: row[1] for row in get_assisted_revenue(conn, start_date)}
 
         for channel in active_channels:
-            chan_id = channel[0]
-            pubkey = channel[1]
-            alias = channel[5] or "Unknown"
-            local_fee_rate = channel[6]
-            local_base_fee = channel[7]
-            remote_fee_rate = channel[8]
-            remote_base_fee = channel[9]
-            local_inbound_fee_rate = channel[10]
-            local_inbound_base_fee = channel[11]
-            funding_txid = channel[12]
+            chan_id = channel.chan_id
+            pubkey = channel.remote_pubkey
+            alias = channel.alias or "Unknown"
+            local_fee_rate = channel.local_fee_rate
+            local_base_fee = channel.local_base_fee
+            remote_fee_rate = channel.remote_fee_rate
+            remote_base_fee = channel.remote_base_fee
+            local_inbound_fee_rate = channel.local_inbound_fee_rate
+            local_inbound_base_fee = channel.local_inbound_base_fee
+            funding_txid = channel.funding_txid
 
             total_cost = int(rebalances_dict.get(chan_id, 0))
             total_rebalanced_in = int(rebalanced_in_dict.get(chan_id, 0))
@@ -579,8 +623,9 @@ def main():
 
             rebal_rate = calculate_rebal_rate(total_cost, total_rebalanced_in)
 
-            opening_date = get_opening_date(funding_txid)
-            days_open = calculate_days_open(opening_date)
+            opening_ts = get_opening_time(funding_txid)
+            opening_date = format_date(opening_ts)
+            days_open = calculate_days_open(opening_ts, now)
 
             apy = calculate_apy(profit, total_routed_out, PERIOD, days_open)
             iapy = calculate_iapy(assisted_revenue, total_routed_in, PERIOD, days_open)
@@ -592,8 +637,8 @@ def main():
             last_incoming_activity = get_last_incoming_activity(conn, chan_id)
             last_rebalance = get_last_rebalance(conn, chan_id)
 
-            capacity = channel[2]
-            local_balance = channel[3]
+            capacity = channel.capacity
+            local_balance = channel.local_balance
             outbound_liquidity = calculate_outbound_liquidity(local_balance, capacity)
             inbound_liquidity = calculate_inbound_liquidity(local_balance, capacity)
 
@@ -604,13 +649,21 @@ def main():
                 days_open, total_revenue, revenue_ppm, total_cost, ppm, rebal_rate, total_rebalanced_in, total_routed_out, 
                 total_routed_in, assisted_revenue, assisted_revenue_ppm, profit, profit_ppm, profit_margin, sats_per_day_profit, 
                 sats_per_day_assisted, apy, iapy, local_fee_rate, local_base_fee, remote_fee_rate, remote_base_fee, 
-                local_inbound_fee_rate, local_inbound_base_fee, last_outgoing_activity, last_incoming_activity, last_rebalance
+                local_inbound_fee_rate, local_inbound_base_fee, last_outgoing_activity, last_incoming_activity, last_rebalance,
+                opening_ts, activity_epoch(chan_id, 'last_outgoing_activity', last_outgoing_activity),
+                activity_epoch(chan_id, 'last_incoming_activity', last_incoming_activity),
+                activity_epoch(chan_id, 'last_rebalance', last_rebalance)
             )
 
             upsert_channel_data(new_conn, data, table_name)
             if PERIOD not in [1, 7, 30] and table_name != f"opened_channels_{PERIOD}d":
                 upsert_channel_data(new_conn, data, f"opened_channels_{PERIOD}d")
 
+    create_liquidity_tables(new_conn)
+    record_channel_snapshots(new_conn, build_snapshot_rows(new_conn, active_channels), now)
+    update_liquidity(new_conn, conn)
+    maintain_snapshots(new_conn)
+
     conn.close()
     new_conn.close()
 
@@ -1,28 +1,30 @@
-import sqlite3
+import json
+import time
 import requests
 import os
+import argparse
 import configparser
 
 from datetime import datetime, timezone
+from db import get_db, get_lndg_db, typed_row
+from lnd_client import get_client, LndError
 
 config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
 config = configparser.ConfigParser()
 config.read(config_file_path)
 
-def expand_path(path):
-    if not os.path.isabs(path):
-        return os.path.join(os.path.expanduser("~"), path)
-    return os.path.expanduser(path)
-
-LNDG_DB_PATH = expand_path(config['Paths']['lndg_db_path'])
-DB_PATH = expand_path(config['Paths']['db_path'])
 MEMPOOL_API_URL_BASE = config['API']['mempool_api_url_base']
+MEMPOOL_FALLBACK = config.getboolean('Get_closed_channels_data', 'mempool_fallback', fallback=True)
+MAX_DATE_ATTEMPTS = config.getint('Get_closed_channels_data', 'max_date_attempts', fallback=8)
+MAX_BLOCK_LOOKUPS = config.getint('Get_closed_channels_data', 'max_block_lookups', fallback=200)
+DATE_RETRY_BASE = 600
+DATE_RETRY_MAX = 86400
 
 def connect_db():
-    return sqlite3.connect(LNDG_DB_PATH, timeout=30)
+    return get_lndg_db(row_factory=typed_row)
 
 def connect_new_db():
-    return sqlite3.connect(DB_PATH, timeout=30)
+    return get_db()
 
 def create_closed_channels_table(conn):
     cursor = conn.cursor()
@@ -50,7 +52,29 @@ def create_closed_channels_table(conn):
         sats_per_day_assisted INTEGER,
         apy REAL,
         iapy REAL,
-        tag TEXT
+        tag TEXT,
+        opening_ts INTEGER,
+        closure_ts INTEGER
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_closed_channels_closure_ts ON closed_channels (closure_ts)")
+    conn.commit()
+
+def create_block_times_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS block_times (
+        height INTEGER PRIMARY KEY,
+        timestamp INTEGER
+    )
+    """)
+    conn.commit()
+
+def create_date_attempts_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS closed_channel_date_attempts (
+        chan_id INTEGER PRIMARY KEY,
+        attempts INTEGER,
+        next_attempt INTEGER
     )
     """)
     conn.commit()
@@ -111,7 +135,10 @@ def calculate_profit_per_day(profit, days_open):
     else:
         return 0
 
-def get_tx_date(txid):
+def format_block_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+
+def get_tx_time(txid):
     if txid:
         try:
             response = requests.get(f"{MEMPOOL_API_URL_BASE}/{txid}")
@@ -119,13 +146,78 @@ def get_tx_date(txid):
                 tx_data = response.json()
                 block_time = tx_data.get('status', {}).get('block_time')
                 if block_time:
-                    return datetime.fromtimestamp(block_time, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                    return int(block_time)
             else:
                 print(f"Error fetching transaction {txid}: {response.status_code}")
         except Exception as e:
             print(f"Error querying Mempool API: {str(e)}")
     return None
 
+def get_lnd_closed_heights():
+    # One ClosedChannels call gives the close height of every channel; the open height is the block encoded in the chan_id.
+    try:
+        channels = get_client().closed_channels()
+    except LndError as e:
+        print(f"Error fetching closed channels from LND: {e}")
+        return {}
+    heights = {}
+    for channel in channels:
+        chan_id = int(channel.get('chan_id') or 0)
+        close_height = int(channel.get('close_height') or 0) or None
+        open_height = chan_id >> 40
+        # Alias SCIDs of zero-conf channels do not encode the funding block.
+        if not open_height or (close_height and open_height > close_height):
+            open_height = None
+        heights[str(chan_id)] = (open_height, close_height)
+    return heights
+
+def get_block_times(conn_new, heights):
+    # Returns the known block times and the heights left for a later run: each lookup is two serial LND calls,
+    # so at most MAX_BLOCK_LOOKUPS uncached heights are fetched per run.
+    heights = set(heights)
+    block_times = dict(conn_new.execute("SELECT height, timestamp FROM block_times WHERE height IN (SELECT value FROM json_each(?))",
+                                        (json.dumps(sorted(heights)),)).fetchall())
+    missing = sorted(heights - set(block_times))
+    deferred = set(missing[MAX_BLOCK_LOOKUPS:])
+    fetched = []
+    try:
+        for height in missing[:MAX_BLOCK_LOOKUPS]:
+            try:
+                timestamp = get_client().get_block_time(height)
+            except LndError as e:
+                # Older LND builds lack ChainKit; stop here instead of failing once per block.
+                print(f"Error fetching block {height} from LND: {e}")
+                break
+            block_times[height] = timestamp
+            fetched.append((height, timestamp))
+    finally:
+        # Cache what was fetched even if the loop is interrupted, so the next run does not repeat it.
+        if fetched:
+            conn_new.executemany("INSERT OR IGNORE INTO block_times (height, timestamp) VALUES (?, ?)", fetched)
+            conn_new.commit()
+    if deferred:
+        print(f"{len(deferred)} block times left for the next run.")
+    return block_times, deferred
+
+def resolve_channel_dates(conn_new, closed_channels):
+    lnd_heights = get_lnd_closed_heights()
+    channel_heights = {str(channel.chan_id): lnd_heights.get(str(channel.chan_id), (None, None)) for channel in closed_channels}
+    block_times, deferred = get_block_times(conn_new, {height for pair in channel_heights.values() for height in pair if height})
+
+    # Channels waiting on a deferred block are left out: they are neither looked up on Mempool.Space nor counted as a failed attempt.
+    dates = {}
+    for channel in closed_channels:
+        open_height, close_height = channel_heights[str(channel.chan_id)]
+        if open_height in deferred or close_height in deferred:
+            continue
+        opening_ts = block_times.get(open_height)
+        closure_ts = block_times.get(close_height)
+        if MEMPOOL_FALLBACK:
+            opening_ts = opening_ts or get_tx_time(channel.funding_txid)
+            closure_ts = closure_ts or get_tx_time(channel.closing_tx)
+        dates[str(channel.chan_id)] = (opening_ts, closure_ts)
+    return dates
+
 def tag(total_routed_in, total_routed_out, days_open):
     if total_routed_in == 0 and total_routed_out == 0 and days_open < 7:
         return 'new_channel'
@@ -135,96 +227,183 @@ def tag(total_routed_in, total_routed_out, days_open):
         return 'sink'
     return 'router'
 
-def update_closed_channels_db(conn_lndg, conn_new, closed_channels):
-    cursor_lndg = conn_lndg.cursor()
-    cursor_new = conn_new.cursor()
+def get_recorded_chan_ids(conn_new):
+    return {str(row[0]) for row in conn_new.execute("SELECT chan_id FROM closed_channels").fetchall()}
 
-    for channel in closed_channels:
-        chan_id = channel[0]
-        pubkey = channel[1]
-        alias = channel[4] or "Unknown"
-        closing_tx = channel[5]
-        funding_txid = channel[6]
-
-        total_cost_result = cursor_lndg.execute("SELECT SUM(fee) FROM gui_payments WHERE rebal_chan = ?", (chan_id,)).fetchone()
-        total_cost = total_cost_result[0] if total_cost_result and total_cost_result[0] is not None else 0
-
-        total_routed_in_result = cursor_lndg.execute("SELECT SUM(amt_in_msat) / 1000 FROM gui_forwards WHERE chan_id_in = ?", (chan_id,)).fetchone()
-        total_routed_in = total_routed_in_result[0] if total_routed_in_result and total_routed_in_result[0] is not None else 0
-
-        total_rebalanced_in_result = cursor_lndg.execute("SELECT SUM(value) FROM gui_payments WHERE rebal_chan = ?", (chan_id,)).fetchone()
-        total_rebalanced_in = total_rebalanced_in_result[0] if total_rebalanced_in_result and total_rebalanced_in_result[0] is not None else 0
-
-        total_routed_out_result = cursor_lndg.execute("SELECT SUM(amt_out_msat) / 1000, SUM(fee) FROM gui_forwards WHERE chan_id_out = ?", (chan_id,)).fetchone()
-        if total_routed_out_result:
-            total_routed_out = total_routed_out_result[0] if total_routed_out_result[0] is not None else 0
-            total_revenue = total_routed_out_result[1] if total_routed_out_result[1] is not None else 0
-        else:
-            total_routed_out = 0
-            total_revenue = 0
-
-        assisted_revenue_result = cursor_lndg.execute("SELECT SUM(fee) FROM gui_forwards WHERE chan_id_in = ?", (chan_id,)).fetchone()
-        assisted_revenue = assisted_revenue_result[0] if assisted_revenue_result and assisted_revenue_result[0] is not None else 0
-
-        total_cost = float(total_cost)
-        total_routed_in = float(total_routed_in)
-        total_rebalanced_in = float(total_rebalanced_in)
-        total_routed_out = float(total_routed_out)
-        total_revenue = float(total_revenue)
-        assisted_revenue = float(assisted_revenue)
-
-        total_in = total_rebalanced_in + total_routed_in
-        cost_ppm = calculate_ppm(total_cost, total_in)
-        revenue_ppm = calculate_ppm(total_revenue, total_routed_out)
-        profit = calculate_profit(total_revenue, total_cost)
-        profit_ppm = calculate_profit_ppm(profit, total_routed_out)
-        profit_margin = calculate_profit_margin(profit, total_routed_out)
-        assisted_revenue_ppm = calculate_assisted_revenue_ppm(assisted_revenue, total_routed_in)
-
-        closure_date = get_tx_date(closing_tx)
-        opening_date = get_tx_date(funding_txid)
-        if closure_date and opening_date:
-            days_open = (datetime.strptime(closure_date, '%Y-%m-%d %H:%M:%S') - datetime.strptime(opening_date, '%Y-%m-%d %H:%M:%S')).days
-            days_open = max(days_open, 1)
-        else:
-            days_open = 1
-
-        apy = calculate_apy(profit, total_routed_out, days_open)
-        iapy = calculate_iapy(assisted_revenue, total_routed_in, days_open)
-
-        sats_per_day_profit = int(profit / days_open) if days_open > 0 else 0
-        sats_per_day_assisted = int(assisted_revenue / days_open) if days_open > 0 else 0
-
-        profit_per_day = calculate_profit_per_day(profit, days_open)
-
-        channel_tag = tag(total_routed_in, total_routed_out, days_open)
-
-        total_revenue = int(total_revenue)
-        total_cost = int(total_cost)
-        profit = int(profit)
-        assisted_revenue = int(assisted_revenue)
-        total_routed_in = int(total_routed_in)
-        total_rebalanced_in = int(total_rebalanced_in)
-        total_routed_out = int(total_routed_out)
-        profit_per_day = int(profit_per_day)
-
-        cursor_new.execute("""
-            INSERT OR REPLACE INTO closed_channels
-            (chan_id, pubkey, alias, opening_date, closure_date, total_routed_out, total_routed_in, total_rebalanced_in,
-             total_revenue, revenue_ppm, total_cost, cost_ppm, profit, profit_ppm,
-             profit_margin, assisted_revenue, assisted_revenue_ppm, days_open,
-             sats_per_day_profit, sats_per_day_assisted, apy, iapy, tag)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (chan_id, pubkey, alias, opening_date, closure_date, total_routed_out, total_routed_in, total_rebalanced_in, 
-              total_revenue, revenue_ppm, total_cost, cost_ppm, profit, profit_ppm,
-              profit_margin, assisted_revenue, assisted_revenue_ppm, days_open,
-              sats_per_day_profit, sats_per_day_assisted, apy, iapy, channel_tag))
+def get_recorded_dates(conn_new):
+    return {str(row[0]): (row[1], row[2]) for row in conn_new.execute(
+        "SELECT chan_id, opening_ts, closure_ts FROM closed_channels").fetchall()}
+
+def get_date_attempts(conn_new):
+    return {str(row[0]): (row[1], row[2]) for row in conn_new.execute(
+        "SELECT chan_id, attempts, next_attempt FROM closed_channel_date_attempts").fetchall()}
+
+def record_date_attempt(conn_new, chan_id, attempts, now):
+    # Backs off exponentially from DATE_RETRY_BASE up to DATE_RETRY_MAX between attempts.
+    next_attempt = now + min(DATE_RETRY_BASE * 2 ** attempts, DATE_RETRY_MAX)
+    conn_new.execute("INSERT OR REPLACE INTO closed_channel_date_attempts (chan_id, attempts, next_attempt) VALUES (?, ?, ?)",
+                     (chan_id, attempts, next_attempt))
+
+def get_forward_aggregates(conn_lndg, chan_ids):
+    # The ids are bound as one JSON array: the read-only LNDg connection runs no DML, so it holds no lock once the SELECT ends.
+    query = """
+    SELECT chan_id, SUM(routed_in_msat) / 1000, SUM(assisted_revenue), SUM(routed_out_msat) / 1000, SUM(revenue)
+    FROM (
+        SELECT chan_id_in AS chan_id, amt_in_msat AS routed_in_msat, fee AS assisted_revenue, 0 AS routed_out_msat, 0 AS revenue
+        FROM gui_forwards WHERE chan_id_in IN (SELECT value FROM json_each(:chan_ids))
+        UNION ALL
+        SELECT chan_id_out, 0, 0, amt_out_msat, fee
+        FROM gui_forwards WHERE chan_id_out IN (SELECT value FROM json_each(:chan_ids))
+    )
+    GROUP BY chan_id;
+    """
+    return {str(row[0]): row[1:] for row in conn_lndg.execute(query, {'chan_ids': chan_ids}).fetchall()}
 
+def get_payment_aggregates(conn_lndg, chan_ids):
+    query = """
+    SELECT rebal_chan, SUM(fee), SUM(value)
+    FROM gui_payments
+    WHERE rebal_chan IN (SELECT value FROM json_each(?))
+    GROUP BY rebal_chan;
+    """
+    return {str(row[0]): row[1:] for row in conn_lndg.execute(query, (chan_ids,)).fetchall()}
+
+def update_closed_channels_db(conn_lndg, conn_new, closed_channels, replace=False):
+    # closed_channels is an append-only ledger: a closed channel's numbers never change, so only channels
+    # not yet recorded are processed. replace=True rewrites the given rows and is only used by reconcile().
+    now = int(time.time())
+    attempts = {}
+    if not replace:
+        recorded = get_recorded_chan_ids(conn_new)
+        attempts = get_date_attempts(conn_new)
+        closed_channels = [channel for channel in closed_channels if str(channel.chan_id) not in recorded
+                           and attempts.get(str(channel.chan_id), (0, 0))[1] <= now]
+    print(f"{len(closed_channels)} closed channels to process.")
+    if not closed_channels:
+        return 0
+
+    # LNDg stores channel ids as text, so they are compared as strings.
+    chan_ids = json.dumps([str(channel.chan_id) for channel in closed_channels])
+    forwards = get_forward_aggregates(conn_lndg, chan_ids)
+    payments = get_payment_aggregates(conn_lndg, chan_ids)
+    dates = resolve_channel_dates(conn_new, closed_channels)
+    if replace:
+        # A date that cannot be resolved now (LND, ChainKit or Mempool.Space unreachable) keeps its recorded value.
+        recorded = get_recorded_dates(conn_new)
+        for chan_id, (opening_ts, closure_ts) in dates.items():
+            stored_opening_ts, stored_closure_ts = recorded.get(chan_id, (None, None))
+            dates[chan_id] = (opening_ts or stored_opening_ts, closure_ts or stored_closure_ts)
+
+    rows = []
+    for channel in closed_channels:
+        if str(channel.chan_id) not in dates:
+            print(f"Skipping channel {channel.chan_id}: waiting for block times.")
+            continue
+        row = build_closed_channel_row(channel, forwards, payments, dates)
+        if row is None and replace:
+            print(f"Skipping channel {channel.chan_id}: opening or closure date not resolved, recorded row left unchanged.")
+            continue
+        if row is None:
+            # Without both dates days_open, APY and the tag would be recorded wrong for good, so the channel is retried
+            # with backoff. Some can never be resolved (no closing tx, unknown to LND and Mempool.Space): after
+            # MAX_DATE_ATTEMPTS they are recorded with NULL dates, which reconcile() can correct later.
+            tries = attempts.get(str(channel.chan_id), (0, 0))[0] + 1
+            if tries < MAX_DATE_ATTEMPTS:
+                print(f"Skipping channel {channel.chan_id}: opening or closure date not resolved yet (attempt {tries} of {MAX_DATE_ATTEMPTS}).")
+                record_date_attempt(conn_new, channel.chan_id, tries, now)
+                continue
+            print(f"Recording channel {channel.chan_id} without dates after {tries} attempts.")
+            row = build_closed_channel_row(channel, forwards, payments, dates, require_dates=False)
+        rows.append(row)
+
+    conn_new.executemany(f"""
+        INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO closed_channels
+        (chan_id, pubkey, alias, opening_date, closure_date, total_routed_out, total_routed_in, total_rebalanced_in,
+         total_revenue, revenue_ppm, total_cost, cost_ppm, profit, profit_ppm,
+         profit_margin, assisted_revenue, assisted_revenue_ppm, days_open,
+         sats_per_day_profit, sats_per_day_assisted, apy, iapy, tag, opening_ts, closure_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn_new.executemany("DELETE FROM closed_channel_date_attempts WHERE chan_id = ?", [(row[0],) for row in rows])
     conn_new.commit()
+    return len(rows)
+
+def build_closed_channel_row(channel, forwards, payments, dates, require_dates=True):
+    chan_id = channel.chan_id
+    pubkey = channel.remote_pubkey
+    alias = channel.alias or "Unknown"
+
+    opening_ts, closure_ts = dates.get(str(chan_id), (None, None))
+    if require_dates and not (closure_ts and opening_ts):
+        return None
+
+    total_routed_in, assisted_revenue, total_routed_out, total_revenue = forwards.get(str(chan_id), (0, 0, 0, 0))
+    total_cost, total_rebalanced_in = payments.get(str(chan_id), (0, 0))
+
+    total_cost = float(total_cost or 0)
+    total_routed_in = float(total_routed_in or 0)
+    total_rebalanced_in = float(total_rebalanced_in or 0)
+    total_routed_out = float(total_routed_out or 0)
+    total_revenue = float(total_revenue or 0)
+    assisted_revenue = float(assisted_revenue or 0)
+    total_in = total_rebalanced_in + total_routed_in
+    cost_ppm = calculate_ppm(total_cost, total_in)
+    revenue_ppm = calculate_ppm(total_revenue, total_routed_out)
+    profit = calculate_profit(total_revenue, total_cost)
+    profit_ppm = calculate_profit_ppm(profit, total_routed_out)
+    profit_margin = calculate_profit_margin(profit, total_routed_out)
+    assisted_revenue_ppm = calculate_assisted_revenue_ppm(assisted_revenue, total_routed_in)
+
+    if closure_ts and opening_ts:
+        days_open = max((closure_ts - opening_ts) // 86400, 1)
+    else:
+        days_open = 1
+
+    apy = calculate_apy(profit, total_routed_out, days_open)
+    iapy = calculate_iapy(assisted_revenue, total_routed_in, days_open)
+
+    sats_per_day_profit = int(profit / days_open) if days_open > 0 else 0
+    sats_per_day_assisted = int(assisted_revenue / days_open) if days_open > 0 else 0
+
+    profit_per_day = calculate_profit_per_day(profit, days_open)
+
+    channel_tag = tag(total_routed_in, total_routed_out, days_open)
+
+    total_revenue = int(total_revenue)
+    total_cost = int(total_cost)
+    profit = int(profit)
+    assisted_revenue = int(assisted_revenue)
+    total_routed_in = int(total_routed_in)
+    total_rebalanced_in = int(total_rebalanced_in)
+    total_routed_out = int(total_routed_out)
+    profit_per_day = int(profit_per_day)
+
+    return (chan_id, pubkey, alias, format_block_time(opening_ts), format_block_time(closure_ts), total_routed_out, total_routed_in, total_rebalanced_in,
+            total_revenue, revenue_ppm, total_cost, cost_ppm, profit, profit_ppm,
+            profit_margin, assisted_revenue, assisted_revenue_ppm, days_open,
+            sats_per_day_profit, sats_per_day_assisted, apy, iapy, channel_tag, opening_ts, closure_ts)
+
+def reconcile(chan_ids=None):
+    # Recomputes and overwrites ledger rows, for corrections after LNDg data was fixed or a date came back wrong.
+    conn_new = connect_new_db()
+    create_closed_channels_table(conn_new)
+    create_block_times_table(conn_new)
+    create_date_attempts_table(conn_new)
+    conn_lndg = connect_db()
+    closed_channels = get_closed_channels(conn_lndg)
+    if chan_ids:
+        wanted = {str(chan_id) for chan_id in chan_ids}
+        closed_channels = [channel for channel in closed_channels if str(channel.chan_id) in wanted]
+    updated = update_closed_channels_db(conn_lndg, conn_new, closed_channels, replace=True)
+    print(f"Reconciled {updated} closed channels.")
+    conn_lndg.close()
+    conn_new.close()
 
 def main():
     conn_new = connect_new_db()
     create_closed_channels_table(conn_new)
+    create_block_times_table(conn_new)
+    create_date_attempts_table(conn_new)
     conn_lndg = connect_db()
     closed_channels = get_closed_channels(conn_lndg)
     update_closed_channels_db(conn_lndg, conn_new, closed_channels)
@@ -233,4 +412,11 @@ def main():
     conn_new.close()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Append newly closed channels to the closed_channels ledger.")
+    parser.add_argument('--reconcile', nargs='*', metavar='CHAN_ID',
+                        help="Recompute and overwrite recorded channels (all closed channels when no id is given)")
+    args = parser.parse_args()
+    if args.reconcile is not None:
+        reconcile(args.reconcile)
+    else:
+        main()
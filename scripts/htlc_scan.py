@@ -1,12 +1,19 @@
 import os
 import json
+import heapq
+import queue
+import asyncio
 import logging
 import requests
 import configparser
 import time
+import threading
 from datetime import datetime
 from pathlib import Path
 
+from lnd_client import get_client, LndError
+from htlc_snapshot import get_snapshot
+
 script_dir = os.path.dirname(os.path.abspath(__file__))
 logs_dir = os.path.abspath(os.path.join(script_dir, '..', 'logs'))
 
@@ -33,14 +40,19 @@ LND_CERT_PATH = get_expanded_path(('LND_CERT_PATH'))
 BOT_TOKEN = config['Telegram']['bot_token']
 CHAT_ID = config['Telegram']['chat_id']
 BLOCKS_TIL_EXPIRY = 18
+RECONNECT_WORKERS = config.getint('Htlc_scan', 'reconnect_workers', fallback=4)
+RECONNECT_WAIT = config.getint('Htlc_scan', 'reconnect_wait', fallback=30)
+RECONNECT_TIMEOUT = config.getint('Htlc_scan', 'reconnect_timeout', fallback=20)
+RECONNECT_COOLDOWN = config.getint('Htlc_scan', 'reconnect_cooldown', fallback=600)
+STREAMING = config.getboolean('Htlc_scan', 'streaming', fallback=True)
+STREAM_RETRY = config.getint('Htlc_scan', 'stream_retry', fallback=30)
+RESYNC_INTERVAL = config.getint('Htlc_scan', 'resync_interval', fallback=3600)
 
-def get_lnd_headers():
-    with open(LND_MACAROON_PATH, "rb") as f:
-        macaroon = f.read().hex()
-    return {
-        "Grpc-Metadata-macaroon": macaroon,
-        "Content-Type": "application/json",
-    }
+_last_reconnects = {}
+_reconnect_lock = threading.Lock()
+_reconnects = queue.Queue()
+_reconnect_worker = None
+_monitor = None
 
 def get_alias(lnd_rest_url, lnd_macaroon_path, lnd_cert_path):
     try:
@@ -76,84 +88,324 @@ def send_telegram_message(message):
     except requests.exceptions.RequestException as e:
         logging.error(f"Error sending Telegram message: {e}")
 
-def reconnect_peer(pubkey):
-    headers = get_lnd_headers()
-    disconnect_url = f"{LND_REST_URL}/v1/peers/{pubkey}"
-    try:
-        disconnect_response = requests.delete(disconnect_url, headers=headers, verify=LND_CERT_PATH)
-        if disconnect_response.status_code == 200:
+def lnd_call(method, *args):
+    # Runs in an executor thread, so it uses that thread's own LND client.
+    return getattr(get_client(), method)(*args)
+
+async def connect_address(pubkey, address):
+    await asyncio.to_thread(lnd_call, 'connect_peer', pubkey, address, RECONNECT_TIMEOUT)
+    return address
+
+async def reconnect_peer(pubkey, semaphore):
+    async with semaphore:
+        try:
+            await asyncio.to_thread(lnd_call, 'disconnect_peer', pubkey)
             send_telegram_message(f"Disconnected peer {pubkey}")
-        else:
-            send_telegram_message(f"Failed to disconnect peer {pubkey}: {disconnect_response.text}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error disconnecting peer {pubkey}: {e}")
+        except LndError as e:
+            send_telegram_message(f"Failed to disconnect peer {pubkey}: {e}")
 
-    time.sleep(30)
+        await asyncio.sleep(RECONNECT_WAIT)
 
-    get_node_info_url = f"{LND_REST_URL}/v1/graph/node/{pubkey}"
-    try:
-        node_info_response = requests.get(get_node_info_url, headers=headers, verify=LND_CERT_PATH)
-        node_info_response.raise_for_status()
-        addresses = node_info_response.json().get("node", {}).get("addresses", [])
-        if addresses:
-            address = addresses[0].get("addr")
-            connect_url = f"{LND_REST_URL}/v1/peers"
-            data = {"addr": {"pubkey": pubkey, "host": address}}
-            connect_response = requests.post(connect_url, headers=headers, json=data, verify=LND_CERT_PATH)
-            if connect_response.status_code == 200:
-                send_telegram_message(f"Reconnected peer {pubkey}")
-            else:
-                send_telegram_message(f"Failed to reconnect peer {pubkey}: {connect_response.text}")
-        else:
+        try:
+            node_info = await asyncio.to_thread(lnd_call, 'get_node_info', pubkey)
+        except LndError as e:
+            logging.error(f"Error reconnecting peer {pubkey}: {e}")
+            return
+        addresses = [address.get("addr") for address in node_info.get("node", {}).get("addresses", []) if address.get("addr")]
+        if not addresses:
             send_telegram_message(f"No address found for peer {pubkey}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error reconnecting peer {pubkey}: {e}")
+            return
 
-def main():
-    headers = get_lnd_headers()
-    get_info_url = f"{LND_REST_URL}/v1/getinfo"
-    try:
-        response = requests.get(get_info_url, headers=headers, verify=LND_CERT_PATH)
-        response.raise_for_status()
-        current_block_height = response.json().get("block_height")
-        max_expiry = current_block_height + BLOCKS_TIL_EXPIRY
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching block height: {e}")
-        return
+        # Every advertised address is tried at once; the first one that connects wins.
+        attempts = [asyncio.ensure_future(connect_address(pubkey, address)) for address in addresses]
+        errors = []
+        for attempt in asyncio.as_completed(attempts):
+            try:
+                address = await attempt
+            except LndError as e:
+                errors.append(str(e))
+                continue
+            for pending in attempts:
+                pending.cancel()
+            send_telegram_message(f"Reconnected peer {pubkey} via {address}")
+            return
+        send_telegram_message(f"Failed to reconnect peer {pubkey}: {'; '.join(errors)}")
+
+async def reconnect_peers(pubkeys):
+    semaphore = asyncio.Semaphore(RECONNECT_WORKERS)
+    await asyncio.gather(*(reconnect_peer(pubkey, semaphore) for pubkey in pubkeys))
+
+def reconnect_forever():
+    while True:
+        pubkeys = _reconnects.get()
+        try:
+            asyncio.run(reconnect_peers(pubkeys))
+        except Exception:
+            logging.exception(f"Failed to reconnect peers {', '.join(pubkeys)}")
+        finally:
+            _reconnects.task_done()
+
+def queue_reconnects(pubkeys):
+    # Reconnects wait RECONNECT_WAIT seconds per peer; a worker thread runs them so alerts and block events are not held up.
+    global _reconnect_worker
+    with _reconnect_lock:
+        if _reconnect_worker is None or not _reconnect_worker.is_alive():
+            _reconnect_worker = threading.Thread(target=reconnect_forever, daemon=True)
+            _reconnect_worker.start()
+    _reconnects.put(pubkeys)
+
+def select_peers_to_reconnect(pubkeys, now):
+    # One reconnect per peer, however many of its HTLCs are expiring, and not again within the cooldown.
+    selected = []
+    with _reconnect_lock:
+        for pubkey in dict.fromkeys(pubkeys):
+            last_reconnect = _last_reconnects.get(pubkey)
+            if last_reconnect is not None and now - last_reconnect < RECONNECT_COOLDOWN:
+                logging.info(f"Peer {pubkey} was reconnected {int(now - last_reconnect)}s ago, skipping.")
+                continue
+            _last_reconnects[pubkey] = now
+            selected.append(pubkey)
+    return selected
+
+def alert_expiring_htlcs(htlcs, current_block_height):
+    expiring_peers = []
+    for htlc in htlcs:
+        alias = htlc["alias"]
+        blocks_to_expire = htlc["expiration_height"] - current_block_height
+
+        if htlc["incoming"]:
+            message = f"⚠ Incoming HTLC from {alias} expires in {blocks_to_expire} blocks"
+        else:
+            message = f"⚠ Outgoing HTLC to {alias} expires in {blocks_to_expire} blocks"
+
+        send_telegram_message(message)
+        expiring_peers.append(htlc["remote_pubkey"])
+
+    peers = select_peers_to_reconnect(expiring_peers, time.time())
+    if peers:
+        queue_reconnects(peers)
+
+def htlc_key(htlc):
+    return (htlc["chan_id"], htlc["incoming"], htlc["htlc_index"])
+
+class ExpiryHeap:
+    """Min-heap of pending HTLCs by expiration height. Resolved HTLCs are dropped lazily when they surface."""
+
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.entries)
 
-    list_channels_url = f"{LND_REST_URL}/v1/channels"
+    def __contains__(self, key):
+        return key in self.entries
+
+    def push(self, key, htlc):
+        self.counter += 1
+        entry = (htlc["expiration_height"], self.counter, key, htlc)
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def pop_expiring(self, max_expiry):
+        expiring = []
+        while self.heap and self.heap[0][0] < max_expiry:
+            entry = heapq.heappop(self.heap)
+            if self.entries.get(entry[2]) is entry:
+                del self.entries[entry[2]]
+                expiring.append(entry[3])
+        return expiring
+
+    def rebuild(self, htlcs):
+        self.entries = {}
+        self.heap = []
+        for htlc in htlcs:
+            self.counter += 1
+            self.entries[htlc_key(htlc)] = (htlc["expiration_height"], self.counter, htlc_key(htlc), htlc)
+        self.heap = list(self.entries.values())
+        heapq.heapify(self.heap)
+
+class HtlcMonitor:
+    """Follows LND's HTLC event and block streams and alerts as soon as an HTLC enters the expiry window."""
+
+    def __init__(self):
+        self.block_height = None
+        self.heap = ExpiryHeap()
+        self.alerted = set()
+        self.channels = {}
+        self.last_resync = 0
+        self.connected = {'htlcs': False, 'blocks': False}
+        self.events = queue.Queue()
+        self.targets = [
+            (self.follow, ('htlcs', 'subscribe_htlc_events')),
+            (self.follow, ('blocks', 'subscribe_blocks')),
+            (self.evaluate_forever, ()),
+        ]
+        self.threads = []
+
+    def spawn(self, target, args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    def start(self):
+        self.threads = [self.spawn(target, args) for target, args in self.targets]
+        logging.info("HTLC monitor started, following LND HTLC events and blocks.")
+
+    def revive(self):
+        # Only a thread that died is started again; the others keep their subscriptions, so no stream is followed twice.
+        for position, thread in enumerate(self.threads):
+            if not thread.is_alive():
+                target, args = self.targets[position]
+                logging.warning(f"HTLC monitor thread {target.__name__}{args[:1]} stopped, starting it again.")
+                self.threads[position] = self.spawn(target, args)
+
+    def is_healthy(self):
+        return all(self.connected.values()) and all(thread.is_alive() for thread in self.threads)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def follow(self, name, subscribe):
+        while True:
+            try:
+                for message in getattr(get_client(), subscribe)():
+                    self.connected[name] = True
+                    self.events.put((name, message))
+            except LndError as e:
+                logging.error(f"HTLC monitor lost the {name} stream: {e}")
+            except Exception:
+                logging.exception(f"HTLC monitor failed while following the {name} stream")
+            self.connected[name] = False
+            time.sleep(STREAM_RETRY)
+
+    def evaluate_forever(self):
+        while True:
+            try:
+                name, message = self.events.get(timeout=RESYNC_INTERVAL)
+            except queue.Empty:
+                name, message = 'resync', None
+            try:
+                if name == 'blocks':
+                    self.on_block(message.get('height'))
+                elif name == 'htlcs':
+                    self.on_htlc_event(message)
+                if name == 'resync' or time.time() - self.last_resync >= RESYNC_INTERVAL:
+                    self.resync()
+            except LndError as e:
+                logging.error(f"HTLC monitor failed to evaluate pending HTLCs: {e}")
+            except Exception:
+                # A malformed event or a database error must not end the only thread that raises alerts.
+                logging.exception(f"HTLC monitor failed to handle a {name} message")
+
+    def resync(self):
+        # A full snapshot corrects anything the event stream missed, e.g. invoice HTLCs or a dropped subscription.
+        snapshot = get_snapshot(max_age=0, fallback_to_lndg=False)
+        self.last_resync = time.time()
+        self.channels = snapshot.channels
+        keys = {htlc_key(htlc) for htlc in snapshot.by_expiry}
+        self.alerted &= keys
+        self.heap.rebuild(htlc for htlc in snapshot.by_expiry if htlc_key(htlc) not in self.alerted)
+        if self.block_height is None or (snapshot.block_height or 0) > self.block_height:
+            self.block_height = snapshot.block_height
+        self.check()
+
+    def on_block(self, height):
+        # Expiry only gets closer when a block arrives, so this is the only regular re-check.
+        if height is None or (self.block_height is not None and height <= self.block_height):
+            return
+        self.block_height = height
+        self.check()
+
+    def on_htlc_event(self, event):
+        if 'subscribed_event' in event:
+            self.resync()
+            return
+
+        incoming = (str(event.get('incoming_channel_id', '0')), True, str(event.get('incoming_htlc_id', '0')))
+        outgoing = (str(event.get('outgoing_channel_id', '0')), False, str(event.get('outgoing_htlc_id', '0')))
+
+        if 'forward_event' in event:
+            info = event['forward_event'].get('info', {})
+            self.add(incoming, info.get('incoming_timelock'))
+            self.add(outgoing, info.get('outgoing_timelock'))
+            self.check()
+        elif 'settle_event' in event or 'forward_fail_event' in event or 'link_fail_event' in event:
+            self.resolve(incoming)
+            self.resolve(outgoing)
+        elif 'final_htlc_event' in event:
+            self.resolve(incoming)
+
+    def add(self, key, expiration_height):
+        chan_id, incoming, htlc_index = key
+        if chan_id == '0' or not expiration_height:
+            return
+        if chan_id not in self.channels:
+            self.events.put(('resync', None))
+            return
+        remote_pubkey, alias = self.channels[chan_id]
+        self.heap.push(key, {
+            'chan_id': chan_id,
+            'remote_pubkey': remote_pubkey,
+            'alias': alias,
+            'incoming': incoming,
+            'expiration_height': int(expiration_height),
+            'htlc_index': htlc_index,
+        })
+
+    def resolve(self, key):
+        self.heap.discard(key)
+        self.alerted.discard(key)
+
+    def check(self):
+        if self.block_height is None:
+            return
+        expiring = self.heap.pop_expiring(self.block_height + BLOCKS_TIL_EXPIRY)
+        if expiring:
+            self.alerted.update(htlc_key(htlc) for htlc in expiring)
+            alert_expiring_htlcs(expiring, self.block_height)
+
+def start_monitor():
+    global _monitor
+    if _monitor is None:
+        _monitor = HtlcMonitor()
+        _monitor.start()
+    else:
+        _monitor.revive()
+    return _monitor
+
+def scan():
     try:
-        response = requests.get(list_channels_url, headers=headers, verify=LND_CERT_PATH)
-        response.raise_for_status()
-        channels = response.json().get("channels", [])
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching channels: {e}")
+        snapshot = get_snapshot(fallback_to_lndg=False)
+    except LndError as e:
+        logging.error(f"Error fetching pending HTLCs: {e}")
         return
 
-    total_pending_htlcs = sum(len(channel.get("pending_htlcs", [])) for channel in channels)
-
-    htlcs_found = False
-    for channel in channels:
-        pending_htlcs = channel.get("pending_htlcs", [])
-        for htlc in pending_htlcs:
-            if htlc.get("expiration_height", 0) < max_expiry:
-                htlcs_found = True
-                pubkey = channel.get("remote_pubkey")
-                alias = channel.get("alias", pubkey)
-                expiration_height = htlc.get("expiration_height", 0)
-                blocks_to_expire = expiration_height - current_block_height
-
-                if htlc.get("incoming"):
-                    message = f"⚠ Incoming HTLC from {alias} expires in {blocks_to_expire} blocks"
-                else:
-                    message = f"⚠ Outgoing HTLC to {alias} expires in {blocks_to_expire} blocks"
-
-                send_telegram_message(message)
-                reconnect_peer(pubkey)
-
-    if not htlcs_found:
-        message = f"🔎 Executing HTLC SCAN...\n\nNo critical HTLCs found\n{total_pending_htlcs} pending HTLCs"
+    current_block_height = snapshot.block_height
+    max_expiry = current_block_height + BLOCKS_TIL_EXPIRY
+    expiring = snapshot.expiring_before(max_expiry)
+    alert_expiring_htlcs(expiring, current_block_height)
+
+    if not expiring:
+        message = f"🔎 Executing HTLC SCAN...\n\nNo critical HTLCs found\n{snapshot.total} pending HTLCs"
         send_telegram_message(message)
 
+def main():
+    if STREAMING:
+        monitor = start_monitor()
+        if monitor.is_healthy():
+            logging.info("HTLC monitor is following LND streams, skipping the polling scan.")
+            return
+        logging.info("HTLC monitor streams are not connected, running the polling scan.")
+    scan()
+
 if __name__ == "__main__":
     main()
+    _reconnects.join()
+    if _monitor is not None:
+        _monitor.join()
@@ -0,0 +1,113 @@
+import os
+import time
+import bisect
+import logging
+import threading
+import configparser
+
+from db import connect_lndg, DATA_SOURCE, LND_STORE_PATH
+from lnd_client import get_client, LndError
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+def expand_path(path):
+    if not os.path.isabs(path):
+        return os.path.join(os.path.expanduser("~"), path)
+    return os.path.expanduser(path)
+
+# Without LNDg the fallback reads the copy of the pending HTLCs lnd_source.py took on its last sync.
+LNDG_DB_PATH = LND_STORE_PATH if DATA_SOURCE == 'lnd' else expand_path(config['Paths']['lndg_db_path'])
+SNAPSHOT_TTL = config.getint('lnd', 'HTLC_SNAPSHOT_TTL', fallback=15)
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+class HtlcSnapshot:
+    def __init__(self, htlcs, block_height=None, source='lnd', channels=None):
+        self.block_height = block_height
+        self.channels = channels or {}
+        self.source = source
+        self.taken_at = time.time()
+        self.by_chan_id = {}
+        for htlc in htlcs:
+            self.by_chan_id.setdefault(htlc['chan_id'], []).append(htlc)
+        self.by_expiry = sorted(htlcs, key=lambda htlc: htlc['expiration_height'])
+        self._expiry_keys = [htlc['expiration_height'] for htlc in self.by_expiry]
+
+    @property
+    def total(self):
+        return len(self.by_expiry)
+
+    def has_pending(self, chan_id):
+        return str(chan_id) in self.by_chan_id
+
+    def for_channel(self, chan_id):
+        return self.by_chan_id.get(str(chan_id), [])
+
+    def expiring_before(self, height):
+        return self.by_expiry[:bisect.bisect_left(self._expiry_keys, height)]
+
+def fetch_from_lnd():
+    client = get_client()
+    block_height = client.get_info().get('block_height')
+    htlcs = []
+    channels = {}
+    for channel in client.list_channels():
+        channels[str(channel.get('chan_id'))] = (channel.get('remote_pubkey'), channel.get('peer_alias') or channel.get('remote_pubkey'))
+        for htlc in channel.get('pending_htlcs', []):
+            htlcs.append({
+                'chan_id': str(channel.get('chan_id')),
+                'remote_pubkey': channel.get('remote_pubkey'),
+                'alias': channel.get('peer_alias') or channel.get('remote_pubkey'),
+                'incoming': bool(htlc.get('incoming')),
+                'amount': int(htlc.get('amount', 0)),
+                'expiration_height': int(htlc.get('expiration_height', 0)),
+                'hash_lock': htlc.get('hash_lock'),
+                'htlc_index': str(htlc.get('htlc_index', '')),
+            })
+    return HtlcSnapshot(htlcs, block_height, 'lnd', channels)
+
+def fetch_from_lndg(lndg_db_path=LNDG_DB_PATH):
+    conn = connect_lndg(lndg_db_path)
+    try:
+        rows = conn.execute("""
+            SELECT h.chan_id, c.remote_pubkey, c.alias, h.incoming, h.amount, h.expiration_height
+            FROM gui_pendinghtlcs h
+            LEFT JOIN gui_channels c ON c.chan_id = h.chan_id
+        """).fetchall()
+    finally:
+        conn.close()
+    htlcs = [{
+        'chan_id': str(chan_id),
+        'remote_pubkey': remote_pubkey,
+        'alias': alias or remote_pubkey,
+        'incoming': bool(incoming),
+        'amount': int(amount or 0),
+        'expiration_height': int(expiration_height or 0),
+        'hash_lock': None,
+        'htlc_index': None,
+    } for chan_id, remote_pubkey, alias, incoming, amount, expiration_height in rows]
+    return HtlcSnapshot(htlcs, None, 'lndg')
+
+def get_snapshot(max_age=SNAPSHOT_TTL, fallback_to_lndg=True):
+    # One snapshot is shared by every job in the process and refreshed at most every max_age seconds.
+    global _snapshot
+    with _snapshot_lock:
+        fresh = _snapshot is not None and time.time() - _snapshot.taken_at < max_age
+        if fresh and (fallback_to_lndg or _snapshot.source == 'lnd'):
+            return _snapshot
+        try:
+            _snapshot = fetch_from_lnd()
+        except LndError as e:
+            if not fallback_to_lndg:
+                raise
+            logging.warning(f"Pending HTLCs unavailable from LND ({e}), reading the LNDg snapshot instead.")
+            _snapshot = fetch_from_lndg()
+        return _snapshot
+
+def invalidate():
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
@@ -0,0 +1,64 @@
+import os
+import configparser
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+ENABLE_INBOUND_FEE = config.getboolean('Autofee', 'enable_inbound_fee', fallback=False)
+INBOUND_SINK_RATIO = config.getfloat('Autofee', 'inbound_sink_ratio', fallback=0.25)
+INBOUND_ROUTER_RATIO = config.getfloat('Autofee', 'inbound_router_ratio', fallback=0.10)
+INBOUND_MAX_DISCOUNT = config.getint('Autofee', 'inbound_max_discount', fallback=1000)
+INBOUND_MAX_STEP = config.getint('Autofee', 'inbound_max_step', fallback=50)
+INBOUND_MIN_INTERVAL = config.getint('Autofee', 'inbound_min_interval', fallback=86400)
+
+INBOUND_RATIOS = {
+    'sink': INBOUND_SINK_RATIO,
+    'router': INBOUND_ROUTER_RATIO,
+}
+
+def create_inbound_fee_history_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS inbound_fee_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chan_id TEXT,
+        timestamp INTEGER,
+        old_discount INTEGER,
+        new_discount INTEGER,
+        projected_margin INTEGER
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inbound_fee_history_chan ON inbound_fee_history (chan_id, timestamp)")
+    conn.commit()
+
+def load_last_inbound_changes(conn):
+    rows = conn.execute("SELECT chan_id, MAX(timestamp) FROM inbound_fee_history GROUP BY chan_id").fetchall()
+    return {chan_id: timestamp for chan_id, timestamp in rows}
+
+def record_inbound_changes(conn, changes):
+    conn.executemany("""
+        INSERT INTO inbound_fee_history (chan_id, timestamp, old_discount, new_discount, projected_margin)
+        VALUES (?, ?, ?, ?, ?)
+    """, changes)
+    conn.commit()
+
+def current_inbound_discount(channel):
+    # LND stores inbound discounts as negative inbound fee rates.
+    inbound_fee_rate = channel.get('local_inbound_fee_rate') or 0
+    return max(-inbound_fee_rate, 0)
+
+def calculate_inbound_discount(channel, new_fee):
+    projected_margin = new_fee - (channel.get('rebal_rate') or 0)
+    if projected_margin <= 0:
+        return 0
+    ratio = INBOUND_RATIOS.get(channel['tag'], 0)
+    return min(int(projected_margin * ratio), INBOUND_MAX_DISCOUNT)
+
+def limit_inbound_discount(chan_id, current_discount, target_discount, last_changes, now):
+    # Shrinking a discount is never delayed: it protects the margin. Growing it is rate limited.
+    if target_discount <= current_discount:
+        return target_discount
+    last_change = last_changes.get(chan_id)
+    if last_change is not None and now - last_change < INBOUND_MIN_INTERVAL:
+        return current_discount
+    return min(target_discount, current_discount + INBOUND_MAX_STEP)
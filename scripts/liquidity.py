@@ -0,0 +1,105 @@
+import time
+from datetime import datetime
+
+from snapshots import iter_snapshots
+
+def create_liquidity_tables(conn):
+    # Balance snapshots now live in the snapshot store; everything in the old table is already folded into channel_liquidity.
+    conn.execute("DROP TABLE IF EXISTS channel_balance_snapshots")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS channel_liquidity (
+        chan_id INTEGER PRIMARY KEY,
+        first_seen INTEGER,
+        last_seen INTEGER,
+        last_local_balance INTEGER,
+        last_remote_balance INTEGER,
+        local_sat_days REAL,
+        remote_sat_days REAL,
+        routed_in INTEGER,
+        routed_out INTEGER,
+        turnover REAL,
+        local_turnover REAL,
+        updated_at INTEGER
+    )
+    """)
+    conn.commit()
+
+def load_liquidity_state(conn):
+    rows = conn.execute("""
+        SELECT chan_id, first_seen, last_seen, last_local_balance, last_remote_balance,
+               local_sat_days, remote_sat_days, routed_in, routed_out
+        FROM channel_liquidity
+    """).fetchall()
+    return {row[0]: list(row[1:]) for row in rows}
+
+def lndg_date(timestamp):
+    # LNDg's own format: compared as strings, a bound with microseconds splits a second exactly.
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def get_routed_since(lndg_conn, since, until):
+    # (since, until] matches the snapshot window, so the next run, starting at until, never counts a forward twice.
+    bounds = (lndg_date(since), lndg_date(until))
+    routed_in = dict(lndg_conn.execute("""
+        SELECT chan_id_in, SUM(amt_in_msat) / 1000 FROM gui_forwards
+        WHERE chan_id_in IS NOT NULL AND forward_date > ? AND forward_date <= ? GROUP BY chan_id_in
+    """, bounds).fetchall())
+    routed_out = dict(lndg_conn.execute("""
+        SELECT chan_id_out, SUM(amt_out_msat) / 1000 FROM gui_forwards
+        WHERE chan_id_out IS NOT NULL AND forward_date > ? AND forward_date <= ? GROUP BY chan_id_out
+    """, bounds).fetchall())
+    # LNDg stores channel ids as text, the snapshots as integers.
+    return {int(k): v for k, v in routed_in.items()}, {int(k): v for k, v in routed_out.items()}
+
+def annual_turnover(volume, sat_days):
+    # How many times the liquidity was routed through in a year: 1.0 means the balance moved once a year.
+    return round(volume * 365 / sat_days, 4) if sat_days > 0 else None
+
+def update_liquidity(conn, lndg_conn):
+    # Accumulators are updated from the snapshots taken since the last run, so memory is bounded by the
+    # number of channels and each snapshot is read once no matter how many years are stored.
+    state = load_liquidity_state(conn)
+    watermark = max((values[1] for values in state.values()), default=0)
+
+    latest = watermark
+    for timestamp, chan_id, capacity, local_balance in iter_snapshots(conn, 'raw', watermark + 1, columns=('capacity', 'local_balance')):
+        remote_balance = capacity - local_balance
+        values = state.get(chan_id)
+        if values is None:
+            state[chan_id] = [timestamp, timestamp, local_balance, remote_balance, 0.0, 0.0, 0, 0]
+        else:
+            days = (timestamp - values[1]) / 86400
+            values[4] += values[2] * days
+            values[5] += values[3] * days
+            values[1], values[2], values[3] = timestamp, local_balance, remote_balance
+        latest = timestamp
+
+    if latest == watermark:
+        return
+
+    routed_in, routed_out = get_routed_since(lndg_conn, watermark, latest) if watermark else ({}, {})
+    now = int(time.time())
+    rows = []
+    for chan_id, values in state.items():
+        values[6] += int(routed_in.get(chan_id, 0) or 0)
+        values[7] += int(routed_out.get(chan_id, 0) or 0)
+        first_seen, last_seen, last_local, last_remote, local_sat_days, remote_sat_days, total_in, total_out = values
+        rows.append((chan_id, first_seen, last_seen, last_local, last_remote, local_sat_days, remote_sat_days,
+                     total_in, total_out, annual_turnover(total_in + total_out, local_sat_days + remote_sat_days),
+                     annual_turnover(total_out, local_sat_days), now))
+
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO channel_liquidity (chan_id, first_seen, last_seen, last_local_balance, last_remote_balance,
+                local_sat_days, remote_sat_days, routed_in, routed_out, turnover, local_turnover, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+def get_liquidity(conn):
+    rows = conn.execute("SELECT chan_id, first_seen, last_seen, local_sat_days, remote_sat_days, turnover, local_turnover FROM channel_liquidity").fetchall()
+    return {str(row[0]): {
+        'tracked_days': (row[2] - row[1]) / 86400,
+        'local_sat_days': row[3],
+        'remote_sat_days': row[4],
+        'turnover': row[5],
+        'local_turnover': row[6],
+    } for row in rows}
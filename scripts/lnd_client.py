@@ -0,0 +1,188 @@
+import os
+import json
+import base64
+import threading
+import configparser
+import requests
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+def expand_path(path):
+    if not os.path.isabs(path):
+        return os.path.join(os.path.expanduser("~"), path)
+    return os.path.expanduser(path)
+
+LND_REST_URL = config['lnd']['LND_REST_URL']
+LND_MACAROON_PATH = expand_path(config['lnd']['LND_MACAROON_PATH'])
+LND_CERT_PATH = expand_path(config['lnd']['LND_CERT_PATH'])
+LND_TIMEOUT = config.getint('lnd', 'LND_TIMEOUT', fallback=30)
+LND_CLOSE_TIMEOUT = config.getint('lnd', 'LND_CLOSE_TIMEOUT', fallback=120)
+
+_local = threading.local()
+
+class LndError(Exception):
+    def __init__(self, message, status=None, code=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.code = code
+
+    def __str__(self):
+        if self.status is None:
+            return self.message
+        return f"{self.message} (HTTP {self.status}, code {self.code})"
+
+class LndTimeoutError(LndError):
+    pass
+
+class LndClient:
+    def __init__(self, rest_url=LND_REST_URL, macaroon_path=LND_MACAROON_PATH, cert_path=LND_CERT_PATH, timeout=LND_TIMEOUT):
+        self.rest_url = rest_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        if macaroon_path:
+            try:
+                with open(macaroon_path, 'rb') as f:
+                    self.session.headers['Grpc-Metadata-macaroon'] = f.read().hex()
+            except OSError as e:
+                raise LndError(f"Cannot read LND macaroon {macaroon_path}: {e}")
+        # A plain http:// URL is only used against a local fake LND, the TLS cert does not apply there.
+        self.session.verify = cert_path if self.rest_url.startswith('https') and cert_path else True
+
+    def request(self, method, path, params=None, body=None, timeout=None, stream=False):
+        url = f"{self.rest_url}{path}"
+        try:
+            response = self.session.request(method, url, params=params, json=body, timeout=timeout or self.timeout, stream=stream)
+        except requests.exceptions.Timeout as e:
+            raise LndTimeoutError(f"LND {method} {path} timed out: {e}")
+        except requests.exceptions.RequestException as e:
+            raise LndError(f"LND {method} {path} failed: {e}")
+
+        if response.status_code != 200:
+            try:
+                error = response.json()
+                error = error.get('error', error)
+                message, code = error.get('message', response.text), error.get('code')
+            except ValueError:
+                message, code = response.text, None
+            response.close()
+            raise LndError(f"LND {method} {path} returned an error: {message}", response.status_code, code)
+
+        if stream:
+            return response
+        try:
+            return response.json()
+        except ValueError as e:
+            raise LndError(f"LND {method} {path} returned invalid JSON: {e}")
+
+    def get_info(self):
+        return self.request('GET', '/v1/getinfo')
+
+    def list_channels(self):
+        return self.request('GET', '/v1/channels', params={'peer_alias_lookup': 'true'}).get('channels', [])
+
+    def get_chan_info(self, chan_id):
+        return self.request('GET', f"/v1/graph/edge/{chan_id}")
+
+    def closed_channels(self):
+        return self.request('GET', '/v1/channels/closed').get('channels', [])
+
+    def get_block_time(self, height):
+        # ChainKit returns the raw 80-byte header; the block timestamp is the little-endian uint32 at offset 68.
+        block_hash = self.request('GET', '/v2/chainkit/blockhash', params={'block_height': height})['block_hash']
+        header = self.request('GET', '/v2/chainkit/blockheader', params={'block_hash': block_hash})['raw_block_header']
+        return int.from_bytes(base64.b64decode(header)[68:72], 'little')
+
+    def fee_report(self):
+        return self.request('GET', '/v1/fees').get('channel_fees', [])
+
+    def forwarding_history(self, index_offset=0, num_max_events=10000):
+        # Without start_time the whole history is covered, so index_offset is a stable position in it.
+        body = {'index_offset': index_offset, 'num_max_events': num_max_events, 'peer_alias_lookup': True}
+        return self.request('POST', '/v1/switch', body=body)
+
+    def list_payments(self, index_offset=0, max_payments=10000):
+        params = {'include_incomplete': 'true', 'index_offset': index_offset, 'max_payments': max_payments}
+        return self.request('GET', '/v1/payments', params=params)
+
+    def stream(self, method, path, params=None, body=None, timeout=None):
+        # Server streams arrive as one JSON object per line, each wrapped in "result" or "error".
+        response = self.request(method, path, params=params, body=body, timeout=timeout or (self.timeout, None), stream=True)
+        try:
+            for line in response.iter_lines(chunk_size=None):
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError as e:
+                    raise LndError(f"LND {method} {path} returned invalid JSON: {e}")
+                if 'error' in message:
+                    error = message['error']
+                    raise LndError(f"LND {method} {path} returned an error: {error.get('message')}", response.status_code, error.get('code'))
+                yield message.get('result', message)
+        except requests.exceptions.Timeout as e:
+            raise LndTimeoutError(f"LND {method} {path} timed out: {e}")
+        except requests.exceptions.RequestException as e:
+            raise LndError(f"LND {method} {path} failed: {e}")
+        finally:
+            response.close()
+
+    def close_channel(self, funding_txid, output_index, sat_per_vbyte):
+        # The first close_pending update carries the closing txid.
+        path = f"/v1/channels/{funding_txid}/{output_index}"
+        for update in self.stream('DELETE', path, params={'sat_per_vbyte': sat_per_vbyte}, timeout=LND_CLOSE_TIMEOUT):
+            if 'close_pending' in update:
+                return txid_from_bytes(update['close_pending'].get('txid', ''))
+            if 'chan_close' in update:
+                return txid_from_bytes(update['chan_close'].get('closing_txid', ''))
+        raise LndError(f"LND DELETE {path} ended without a close update")
+
+    def subscribe_htlc_events(self):
+        return self.stream('GET', '/v2/router/htlcevents')
+
+    def subscribe_blocks(self):
+        return self.stream('POST', '/v2/chainnotifier/register/blocks', body={})
+
+    def get_node_info(self, pubkey):
+        return self.request('GET', f"/v1/graph/node/{pubkey}")
+
+    def disconnect_peer(self, pubkey):
+        return self.request('DELETE', f"/v1/peers/{pubkey}")
+
+    def connect_peer(self, pubkey, host, timeout=None):
+        body = {'addr': {'pubkey': pubkey, 'host': host}, 'perm': False}
+        if timeout is not None:
+            body['timeout'] = timeout
+        return self.request('POST', '/v1/peers', body=body, timeout=(timeout or 0) + self.timeout)
+
+    def update_chan_status(self, chan_point, action):
+        funding_txid, output_index = chan_point.split(':')
+        body = {'chan_point': {'funding_txid_str': funding_txid, 'output_index': int(output_index)}, 'action': action}
+        return self.request('POST', '/v2/router/updatechanstatus', body=body)
+
+    def list_unspent(self, min_confs=1, max_confs=2147483647):
+        return self.request('GET', '/v1/utxos', params={'min_confs': min_confs, 'max_confs': max_confs}).get('utxos', [])
+
+    def add_invoice(self, value, memo=None, expiry=None):
+        body = {'value': value}
+        if memo is not None:
+            body['memo'] = memo
+        if expiry is not None:
+            body['expiry'] = expiry
+        return self.request('POST', '/v1/invoices', body=body)
+
+    def new_address(self, address_type='TAPROOT_PUBKEY'):
+        return self.request('GET', '/v1/newaddress', params={'type': address_type})['address']
+
+def txid_from_bytes(value):
+    # REST encodes txid bytes as base64 in internal byte order; explorers show them reversed.
+    return base64.b64decode(value)[::-1].hex()
+
+def get_client():
+    # requests.Session is not thread-safe: each thread (an automator job, an HTLC monitor stream) gets its own client.
+    client = getattr(_local, 'client', None)
+    if client is None:
+        client = _local.client = LndClient()
+    return client
@@ -0,0 +1,292 @@
+import os
+import base64
+import configparser
+from datetime import datetime
+
+from db import connect, LND_STORE_PATH
+from lnd_client import get_client, LndError
+from lndg_mirror import INDEXES
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+BATCH_SIZE = config.getint('Lnd_source', 'batch_size', fallback=10000)
+
+# LND enums stored as the integers LNDg uses.
+PAYMENT_STATUS = {'UNKNOWN': 0, 'IN_FLIGHT': 1, 'SUCCEEDED': 2, 'FAILED': 3, 'INITIATED': 4}
+CLOSE_TYPES = {'COOPERATIVE_CLOSE': 0, 'LOCAL_FORCE_CLOSE': 1, 'REMOTE_FORCE_CLOSE': 2, 'BREACH_CLOSE': 3, 'FUNDING_CANCELED': 4, 'ABANDONED': 5}
+INITIATORS = {'INITIATOR_UNKNOWN': 0, 'INITIATOR_LOCAL': 1, 'INITIATOR_REMOTE': 2, 'INITIATOR_BOTH': 3}
+
+# The LNDg tables and column names the collectors query, so every query runs unchanged on either source.
+# gui_autofees stays empty: it is LNDg's own fee change log and LND has no equivalent.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gui_channels (
+    chan_id TEXT PRIMARY KEY,
+    remote_pubkey TEXT,
+    funding_txid TEXT,
+    output_index INTEGER,
+    capacity INTEGER,
+    local_balance INTEGER,
+    remote_balance INTEGER,
+    unsettled_balance INTEGER,
+    alias TEXT,
+    local_base_fee INTEGER,
+    local_fee_rate INTEGER,
+    local_inbound_base_fee INTEGER,
+    local_inbound_fee_rate INTEGER,
+    remote_base_fee INTEGER,
+    remote_fee_rate INTEGER,
+    is_active INTEGER,
+    is_open INTEGER
+);
+CREATE TABLE IF NOT EXISTS gui_forwards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    forward_date TEXT,
+    chan_id_in TEXT,
+    chan_id_out TEXT,
+    chan_in_alias TEXT,
+    chan_out_alias TEXT,
+    amt_in_msat INTEGER,
+    amt_out_msat INTEGER,
+    fee REAL,
+    inbound_fee REAL
+);
+CREATE TABLE IF NOT EXISTS gui_payments (
+    payment_hash TEXT PRIMARY KEY,
+    creation_date TEXT,
+    value REAL,
+    fee REAL,
+    status INTEGER,
+    "index" INTEGER,
+    chan_out TEXT,
+    chan_out_alias TEXT,
+    rebal_chan TEXT
+);
+CREATE TABLE IF NOT EXISTS gui_closures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chan_id TEXT,
+    funding_txid TEXT,
+    funding_index INTEGER,
+    closing_tx TEXT,
+    remote_pubkey TEXT,
+    capacity INTEGER,
+    close_height INTEGER,
+    settled_balance INTEGER,
+    time_locked_balance INTEGER,
+    close_type INTEGER,
+    open_initiator INTEGER,
+    close_initiator INTEGER
+);
+CREATE TABLE IF NOT EXISTS gui_pendinghtlcs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chan_id TEXT,
+    alias TEXT,
+    incoming INTEGER,
+    amount INTEGER,
+    hash_lock TEXT,
+    expiration_height INTEGER,
+    forwarding_channel TEXT,
+    forwarding_alias TEXT
+);
+CREATE TABLE IF NOT EXISTS gui_autofees (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    chan_id TEXT,
+    peer_alias TEXT,
+    setting TEXT,
+    old_value INTEGER,
+    new_value INTEGER
+);
+CREATE TABLE IF NOT EXISTS lnd_source_state (
+    name TEXT PRIMARY KEY,
+    value INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_gui_payments_index ON gui_payments ("index");
+"""
+
+def create_tables(conn):
+    conn.executescript(SCHEMA)
+    for table, indexes in INDEXES.items():
+        for columns in indexes:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})")
+    conn.commit()
+
+def local_date(timestamp_ns):
+    # LNDg stores local wall-clock time with microseconds; the same format keeps date comparisons working.
+    return datetime.fromtimestamp(int(timestamp_ns) / 1e9).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def get_state(conn, name):
+    row = conn.execute("SELECT value FROM lnd_source_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+def set_state(conn, name, value):
+    conn.execute("INSERT OR REPLACE INTO lnd_source_state (name, value) VALUES (?, ?)", (name, value))
+
+def get_remote_policy(client, chan_id, remote_pubkey):
+    try:
+        edge = client.get_chan_info(chan_id)
+    except LndError:
+        # Not in the graph yet (unconfirmed or unannounced).
+        return None, None
+    policy = edge.get('node1_policy') if edge.get('node1_pub') == remote_pubkey else edge.get('node2_policy')
+    policy = policy or {}
+    return int(policy.get('fee_base_msat') or 0), int(policy.get('fee_rate_milli_msat') or 0)
+
+def get_node_alias(client, pubkey):
+    try:
+        return client.get_node_info(pubkey).get('node', {}).get('alias') or None
+    except LndError:
+        return None
+
+def sync_channels(client, conn):
+    fees = {str(fee.get('chan_id')): fee for fee in client.fee_report()}
+    rows = []
+    htlcs = []
+    for channel in client.list_channels():
+        chan_id = str(channel.get('chan_id'))
+        remote_pubkey = channel.get('remote_pubkey')
+        alias = channel.get('peer_alias') or None
+        funding_txid, _, output_index = (channel.get('channel_point') or ':').partition(':')
+        fee = fees.get(chan_id, {})
+        remote_base_fee, remote_fee_rate = get_remote_policy(client, chan_id, remote_pubkey)
+        rows.append((chan_id, remote_pubkey, funding_txid, int(output_index or 0), int(channel.get('capacity') or 0),
+                     int(channel.get('local_balance') or 0), int(channel.get('remote_balance') or 0), int(channel.get('unsettled_balance') or 0),
+                     alias, int(fee.get('base_fee_msat') or 0), int(fee.get('fee_per_mil') or 0),
+                     int(fee.get('inbound_base_fee_msat') or 0), int(fee.get('inbound_fee_per_mil') or 0),
+                     remote_base_fee, remote_fee_rate, int(bool(channel.get('active')))))
+        for htlc in channel.get('pending_htlcs', []):
+            forwarding_channel = str(htlc.get('forwarding_channel') or '') or None
+            htlcs.append((chan_id, alias, int(bool(htlc.get('incoming'))), int(htlc.get('amount') or 0),
+                          base64.b64decode(htlc.get('hash_lock') or '').hex(), int(htlc.get('expiration_height') or 0),
+                          None if forwarding_channel == '0' else forwarding_channel))
+
+    open_ids = [row[0] for row in rows]
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO gui_channels (chan_id, remote_pubkey, funding_txid, output_index, capacity, local_balance, remote_balance,
+                unsettled_balance, alias, local_base_fee, local_fee_rate, local_inbound_base_fee, local_inbound_fee_rate,
+                remote_base_fee, remote_fee_rate, is_active, is_open)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        """, rows)
+        # Channels LND no longer lists are closed; like LNDg, they stay in gui_channels with is_open = 0.
+        conn.execute(f"UPDATE gui_channels SET is_open = 0, is_active = 0 WHERE chan_id NOT IN ({', '.join('?' for _ in open_ids)})", open_ids)
+        conn.execute("DELETE FROM gui_pendinghtlcs")
+        conn.executemany("""
+            INSERT INTO gui_pendinghtlcs (chan_id, alias, incoming, amount, hash_lock, expiration_height, forwarding_channel)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, htlcs)
+    return len(rows)
+
+def sync_closures(client, conn):
+    rows = []
+    for channel in client.closed_channels():
+        chan_id = str(channel.get('chan_id') or 0)
+        # Channels that closed before confirming never got a real chan_id.
+        if chan_id == '0':
+            continue
+        funding_txid, _, funding_index = (channel.get('channel_point') or ':').partition(':')
+        rows.append((chan_id, funding_txid, int(funding_index or 0), channel.get('closing_tx_hash'), channel.get('remote_pubkey'),
+                     int(channel.get('capacity') or 0), int(channel.get('close_height') or 0), int(channel.get('settled_balance') or 0),
+                     int(channel.get('time_locked_balance') or 0), CLOSE_TYPES.get(channel.get('close_type'), 0),
+                     INITIATORS.get(channel.get('open_initiator'), 0), INITIATORS.get(channel.get('close_initiator'), 0)))
+    known = {row[0] for row in conn.execute("SELECT chan_id FROM gui_channels").fetchall()}
+    new_channels = [(row[0], row[4], row[1], row[2], row[5], row[7], get_node_alias(client, row[4])) for row in rows if row[0] not in known]
+    with conn:
+        conn.execute("DELETE FROM gui_closures")
+        conn.executemany("""
+            INSERT INTO gui_closures (chan_id, funding_txid, funding_index, closing_tx, remote_pubkey, capacity, close_height,
+                settled_balance, time_locked_balance, close_type, open_initiator, close_initiator)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        # Channels that were closed before the first sync are only known from here.
+        conn.executemany("""
+            INSERT OR IGNORE INTO gui_channels (chan_id, remote_pubkey, funding_txid, output_index, capacity, local_balance, alias, is_active, is_open)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0, 0)
+        """, new_channels)
+    return len(rows)
+
+def sync_forwards(client, conn):
+    # LND numbers forwarding events in order, so the offset after the last stored event is the high-water mark.
+    offset = get_state(conn, 'forwards_offset')
+    copied = 0
+    while True:
+        response = client.forwarding_history(offset, BATCH_SIZE)
+        events = response.get('forwarding_events', [])
+        if not events:
+            break
+        rows = [(local_date(event.get('timestamp_ns') or int(event.get('timestamp') or 0) * 10**9),
+                 str(event.get('chan_id_in')), str(event.get('chan_id_out')), event.get('peer_alias_in'), event.get('peer_alias_out'),
+                 int(event.get('amt_in_msat') or 0), int(event.get('amt_out_msat') or 0), int(event.get('fee_msat') or 0) / 1000)
+                for event in events]
+        offset = int(response.get('last_offset_index') or offset + len(events))
+        # Rows and offset commit together, so an interrupted sync never stores an event twice.
+        with conn:
+            conn.executemany("""
+                INSERT INTO gui_forwards (forward_date, chan_id_in, chan_id_out, chan_in_alias, chan_out_alias, amt_in_msat, amt_out_msat, fee)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            set_state(conn, 'forwards_offset', offset)
+        copied += len(events)
+        if len(events) < BATCH_SIZE:
+            break
+    return copied
+
+def payment_row(payment, own_pubkey, aliases):
+    htlcs = payment.get('htlcs') or []
+    # The attempt that succeeded, otherwise the last one tried.
+    attempt = next((htlc for htlc in htlcs if htlc.get('status') == 'SUCCEEDED'), htlcs[-1] if htlcs else {})
+    hops = (attempt.get('route') or {}).get('hops') or []
+    chan_out = str(hops[0].get('chan_id')) if hops else None
+    # A payment that ends at our own node is a rebalance, and its last hop is the channel that was refilled.
+    rebal_chan = str(hops[-1].get('chan_id')) if hops and hops[-1].get('pub_key') == own_pubkey else None
+    created_ns = payment.get('creation_time_ns') or int(payment.get('creation_date') or 0) * 10**9
+    return (payment.get('payment_hash'), local_date(created_ns), int(payment.get('value_msat') or 0) / 1000,
+            int(payment.get('fee_msat') or 0) / 1000, PAYMENT_STATUS.get(payment.get('status'), 0), int(payment.get('payment_index') or 0),
+            chan_out, aliases.get(chan_out), rebal_chan)
+
+def sync_payments(client, conn, own_pubkey):
+    # Payments still in flight can still change, so listing restarts at the oldest of them; otherwise after the newest payment.
+    pending = conn.execute('SELECT MIN("index") FROM gui_payments WHERE status NOT IN (2, 3)').fetchone()[0]
+    offset = pending - 1 if pending else conn.execute('SELECT COALESCE(MAX("index"), 0) FROM gui_payments').fetchone()[0]
+    aliases = dict(conn.execute("SELECT chan_id, alias FROM gui_channels").fetchall())
+    copied = 0
+    while True:
+        response = client.list_payments(offset, BATCH_SIZE)
+        payments = response.get('payments', [])
+        if not payments:
+            break
+        with conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO gui_payments (payment_hash, creation_date, value, fee, status, "index", chan_out, chan_out_alias, rebal_chan)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [payment_row(payment, own_pubkey, aliases) for payment in payments])
+        offset = int(response.get('last_index_offset') or offset + len(payments))
+        copied += len(payments)
+        if len(payments) < BATCH_SIZE:
+            break
+    return copied
+
+def sync(client, conn):
+    create_tables(conn)
+    own_pubkey = client.get_info().get('identity_pubkey')
+    return {
+        'gui_channels': sync_channels(client, conn),
+        'gui_closures': sync_closures(client, conn),
+        'gui_forwards': sync_forwards(client, conn),
+        'gui_payments': sync_payments(client, conn, own_pubkey),
+    }
+
+def main():
+    conn = connect(LND_STORE_PATH)
+    try:
+        counts = sync(get_client(), conn)
+    except LndError as e:
+        print(f"Error syncing from LND: {e}")
+        return
+    finally:
+        conn.close()
+    print("Synced from LND: " + ", ".join(f"{table} {count}" for table, count in counts.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import configparser
+
+from db import connect, connect_lndg, LNDG_DB_PATH, LNDG_MIRROR_PATH
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+BATCH_SIZE = config.getint('Lndg_mirror', 'batch_size', fallback=50000)
+
+# How each table is kept in step with LNDg:
+#   append:  rows are only ever inserted, so only rows past the mirror's highest rowid are copied.
+#   recheck: append, plus the rows matching `pending` are read again until they settle (in-flight payments).
+#   refresh: small tables whose rows change in place, copied whole on every sync.
+TABLES = {
+    'gui_forwards': {'mode': 'append'},
+    'gui_autofees': {'mode': 'append'},
+    'gui_payments': {'mode': 'recheck', 'pending': 'status NOT IN (2, 3)'},
+    'gui_channels': {'mode': 'refresh'},
+    'gui_closures': {'mode': 'refresh'},
+    'gui_pendinghtlcs': {'mode': 'refresh'},
+}
+# The lookups the analytics actually run; LNDg does not index these columns.
+INDEXES = {
+    'gui_forwards': [('forward_date',), ('chan_id_in', 'forward_date'), ('chan_id_out', 'forward_date')],
+    'gui_payments': [('creation_date',), ('rebal_chan', 'creation_date')],
+    'gui_autofees': [('timestamp',)],
+    'gui_channels': [('is_open',)],
+    'gui_closures': [('chan_id',)],
+    'gui_pendinghtlcs': [('chan_id',)],
+}
+# user_version of the mirror once every table has been through a complete sync; db.get_lndg_db() waits for it.
+MIRROR_READY = 1
+
+def connect_mirror():
+    return connect(LNDG_MIRROR_PATH)
+
+def table_info(conn, table):
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def ensure_table(conn_lndg, conn_mirror, table):
+    # The mirror starts from LNDg's own CREATE TABLE, so every existing query runs against it unchanged.
+    row = conn_lndg.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if row is None:
+        return None
+    lndg_columns = table_info(conn_lndg, table)
+    mirror_columns = {name for name, _ in table_info(conn_mirror, table)}
+    with conn_mirror:
+        if not mirror_columns:
+            conn_mirror.execute(row[0])
+        # Columns added by an LNDg upgrade are added to the mirror as well, without LNDg's NOT NULL constraints.
+        for name, column_type in lndg_columns:
+            if mirror_columns and name not in mirror_columns:
+                conn_mirror.execute(f'ALTER TABLE {table} ADD COLUMN "{name}" {column_type}')
+        for columns in INDEXES.get(table, ()):
+            conn_mirror.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})")
+    return [name for name, _ in lndg_columns]
+
+def quote_columns(columns):
+    # LNDg has a column named "index".
+    return ', '.join(f'"{column}"' for column in columns)
+
+def select_rows(table, columns):
+    return f"SELECT rowid, {quote_columns(columns)} FROM {table}"
+
+def write_rows(conn_mirror, table, columns, rows):
+    # rowid is copied too, so the mirror's MAX(rowid) is the high-water mark for the next sync.
+    placeholders = ', '.join('?' for _ in columns)
+    conn_mirror.executemany(f"INSERT OR REPLACE INTO {table} (rowid, {quote_columns(columns)}) VALUES (?, {placeholders})", rows)
+
+def copy_new_rows(conn_lndg, conn_mirror, table, columns):
+    watermark = conn_mirror.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    lndg_max = conn_lndg.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    if lndg_max < watermark:
+        # LNDg's database was recreated: its rowids start over, so the mirror copy starts over too.
+        print(f"{table}: LNDg rowids went back from {watermark} to {lndg_max}, copying the table again.")
+        with conn_mirror:
+            conn_mirror.execute(f"DELETE FROM {table}")
+        watermark = 0
+
+    # Short batches keep LNDg's read lock brief, and committing each one lets a long first sync resume where it stopped.
+    copied = 0
+    while True:
+        rows = conn_lndg.execute(f"{select_rows(table, columns)} WHERE rowid > ? ORDER BY rowid LIMIT ?", (watermark, BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        with conn_mirror:
+            write_rows(conn_mirror, table, columns, rows)
+        copied += len(rows)
+        watermark = rows[-1][0]
+        if len(rows) < BATCH_SIZE:
+            break
+    return copied
+
+def recheck_pending_rows(conn_lndg, conn_mirror, table, columns, pending):
+    rowids = [row[0] for row in conn_mirror.execute(f"SELECT rowid FROM {table} WHERE {pending}")]
+    for start in range(0, len(rowids), 500):
+        chunk = rowids[start:start + 500]
+        rows = conn_lndg.execute(f"{select_rows(table, columns)} WHERE rowid IN ({', '.join('?' for _ in chunk)})", chunk).fetchall()
+        with conn_mirror:
+            write_rows(conn_mirror, table, columns, rows)
+    return len(rowids)
+
+def refresh_table(conn_lndg, conn_mirror, table, columns):
+    rows = conn_lndg.execute(select_rows(table, columns)).fetchall()
+    with conn_mirror:
+        conn_mirror.execute(f"DELETE FROM {table}")
+        write_rows(conn_mirror, table, columns, rows)
+    return len(rows)
+
+def sync(conn_lndg, conn_mirror):
+    counts = {}
+    for table, settings in TABLES.items():
+        columns = ensure_table(conn_lndg, conn_mirror, table)
+        if columns is None:
+            print(f"{table} does not exist in the LNDg database, skipping.")
+            continue
+        if settings['mode'] == 'refresh':
+            counts[table] = refresh_table(conn_lndg, conn_mirror, table, columns)
+            continue
+        if settings['mode'] == 'recheck':
+            recheck_pending_rows(conn_lndg, conn_mirror, table, columns, settings['pending'])
+        counts[table] = copy_new_rows(conn_lndg, conn_mirror, table, columns)
+    conn_mirror.execute(f"PRAGMA user_version = {MIRROR_READY}")
+    return counts
+
+def main():
+    if not os.path.exists(LNDG_DB_PATH):
+        print(f"LNDg database {LNDG_DB_PATH} not found, nothing to mirror.")
+        return
+
+    # Always the real LNDg database here, never the mirror that get_lndg_db() may hand out.
+    conn_lndg = connect_lndg(LNDG_DB_PATH)
+    conn_mirror = connect_mirror()
+    try:
+        counts = sync(conn_lndg, conn_mirror)
+    finally:
+        conn_lndg.close()
+        conn_mirror.close()
+    print("Mirrored rows: " + ", ".join(f"{table} {count}" for table, count in counts.items()))
+
+if __name__ == "__main__":
+    main()
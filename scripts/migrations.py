@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+
+# Each TEXT date keeps an integer epoch twin. Opening and closure dates are written in UTC,
+# activity dates are copied from LNDg in the node's local time.
+OPENED_CHANNELS_EPOCH_COLUMNS = {
+    'opening_date': ('opening_ts', True),
+    'last_outgoing_activity': ('last_outgoing_ts', False),
+    'last_incoming_activity': ('last_incoming_ts', False),
+    'last_rebalance': ('last_rebalance_ts', False),
+}
+CLOSED_CHANNELS_EPOCH_COLUMNS = {
+    'opening_date': ('opening_ts', True),
+    'closure_date': ('closure_ts', True),
+}
+
+def to_epoch(value, utc=False):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    parsed = datetime.fromisoformat(value.strip())
+    if utc and parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+def backfill_epoch(value, utc):
+    # SQL side of to_epoch for backfills: a malformed date becomes NULL instead of aborting the whole migration.
+    try:
+        return to_epoch(value, utc)
+    except (TypeError, ValueError):
+        return None
+
+def table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def add_epoch_columns(conn, table, columns):
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for text_column, (epoch_column, utc) in columns.items():
+        if epoch_column in existing:
+            continue
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {epoch_column} INTEGER")
+        conn.execute(f"UPDATE {table} SET {epoch_column} = to_epoch({text_column}, ?)", (int(utc),))
+        unparsed = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {epoch_column} IS NULL AND {text_column} IS NOT NULL AND {text_column} != ''").fetchone()[0]
+        if unparsed:
+            print(f"{table}.{text_column}: {unparsed} malformed dates left with a NULL {epoch_column}")
+
+def migrate_epoch_timestamps(conn):
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'opened_channels_%'")]
+    for table in tables:
+        add_epoch_columns(conn, table, OPENED_CHANNELS_EPOCH_COLUMNS)
+    if table_exists(conn, 'closed_channels'):
+        add_epoch_columns(conn, 'closed_channels', CLOSED_CHANNELS_EPOCH_COLUMNS)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_closed_channels_closure_ts ON closed_channels (closure_ts)")
+
+def migrate_reader_indexes(conn):
+    if table_exists(conn, 'pending_closures'):
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_closures_state ON pending_closures (state, queued_at)")
+    if table_exists(conn, 'strike_onchain_withdrawals'):
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_strike_onchain_withdrawals_state ON strike_onchain_withdrawals (state)")
+
+# Append only: a released migration is never edited, a schema change is a new entry.
+# Tables that do not exist yet are skipped; their CREATE TABLE statements already have the current layout.
+MIGRATIONS = [
+    (1, migrate_epoch_timestamps),
+    (2, migrate_reader_indexes),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate(conn):
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    conn.create_function('to_epoch', 2, backfill_epoch, deterministic=True)
+    # IMMEDIATE takes the write lock first, so two jobs starting together cannot both apply the same step.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in MIGRATIONS:
+            if target > version:
+                print(f"Migrating database schema to version {target} ({migration.__name__})")
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
@@ -0,0 +1,153 @@
+import os
+import time
+import calendar
+import configparser
+from datetime import datetime, timezone
+
+config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'automator.conf'))
+config = configparser.ConfigParser()
+config.read(config_file_path)
+
+RAW_RETENTION_DAYS = config.getint('Snapshots', 'raw_retention_days', fallback=14)
+HOURLY_RETENTION_DAYS = config.getint('Snapshots', 'hourly_retention_days', fallback=180)
+DAILY_RETENTION_DAYS = config.getint('Snapshots', 'daily_retention_days', fallback=0)
+
+LEVELS = {'raw': None, 'hourly': 3600, 'daily': 86400}
+RETENTION_DAYS = {'raw': RAW_RETENTION_DAYS, 'hourly': HOURLY_RETENTION_DAYS, 'daily': DAILY_RETENTION_DAYS}
+
+# Fees and balances are the state at snapshot time; revenue, cost and volumes are lifetime counters,
+# so the difference between two snapshots is what happened in between.
+COLUMNS = ('capacity', 'local_balance', 'local_fee_rate', 'local_base_fee', 'remote_fee_rate', 'local_inbound_fee_rate',
+           'revenue', 'cost', 'routed_in', 'routed_out', 'rebalanced_in', 'assisted_revenue')
+
+def month_key(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m')
+
+def month_end(key):
+    year, month = int(key[:4]), int(key[4:])
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return calendar.timegm((year, month, 1, 0, 0, 0))
+
+def partition_name(level, timestamp):
+    return f"channel_snapshots_{level}_{month_key(timestamp)}"
+
+def create_partition(conn, table):
+    columns = ",\n        ".join(f"{column} INTEGER" for column in COLUMNS)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        timestamp INTEGER,
+        chan_id INTEGER,
+        {columns},
+        samples INTEGER,
+        PRIMARY KEY (chan_id, timestamp)
+    ) WITHOUT ROWID
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)")
+
+def list_partitions(conn, level, since=None, until=None):
+    # Partitions are one table per month, so a time range only ever touches the months it covers.
+    prefix = f"channel_snapshots_{level}_"
+    names = sorted(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (prefix + '%',))
+                   if row[0][len(prefix):].isdigit())
+    if since is not None:
+        names = [name for name in names if name[len(prefix):] >= month_key(since)]
+    if until is not None:
+        names = [name for name in names if name[len(prefix):] <= month_key(until)]
+    return names
+
+def record_channel_snapshots(conn, rows, timestamp):
+    # rows are (chan_id, *COLUMNS) tuples taken in the same cycle.
+    table = partition_name('raw', timestamp)
+    placeholders = ', '.join('?' for _ in range(len(COLUMNS) + 3))
+    with conn:
+        create_partition(conn, table)
+        conn.executemany(f"""
+            INSERT OR REPLACE INTO {table} (timestamp, chan_id, {', '.join(COLUMNS)}, samples)
+            VALUES ({placeholders})
+        """, [(timestamp, *row, 1) for row in rows])
+
+def iter_snapshots(conn, level='raw', since=0, until=None, chan_ids=None, columns=COLUMNS):
+    # Yields (timestamp, chan_id, *columns) in timestamp order across partitions.
+    conditions, params = ["timestamp >= ?"], [since]
+    if until is not None:
+        conditions.append("timestamp < ?")
+        params.append(until)
+    if chan_ids is not None:
+        chan_ids = [int(chan_id) for chan_id in chan_ids]
+        conditions.append(f"chan_id IN ({', '.join('?' for _ in chan_ids)})")
+        params.extend(chan_ids)
+    for table in list_partitions(conn, level, since, until):
+        yield from conn.execute(f"""
+            SELECT timestamp, chan_id, {', '.join(columns)} FROM {table}
+            WHERE {' AND '.join(conditions)} ORDER BY timestamp
+        """, params)
+
+def last_timestamp(conn, level):
+    partitions = list_partitions(conn, level)
+    if not partitions:
+        return None
+    return conn.execute(f"SELECT MAX(timestamp) FROM {partitions[-1]}").fetchone()[0]
+
+def rollup(conn, source, target, now):
+    # Only complete buckets are rolled up, and each one once: the target's newest bucket is the watermark.
+    # Buckets align to UTC hours and days, so a bucket never spans two monthly partitions.
+    bucket = LEVELS[target]
+    watermark = last_timestamp(conn, target)
+    start = watermark + bucket if watermark is not None else 0
+    end = now - now % bucket
+    if start >= end:
+        return 0
+
+    # SQLite takes bare columns from the row holding MAX(timestamp): the last state of the bucket.
+    last_values = ', '.join(column for column in COLUMNS if column != 'local_balance')
+    rolled = 0
+    for table in list_partitions(conn, source, start, end - 1):
+        target_table = f"channel_snapshots_{target}_{table.rsplit('_', 1)[1]}"
+        create_partition(conn, target_table)
+        cursor = conn.execute(f"""
+            INSERT OR REPLACE INTO {target_table} (timestamp, chan_id, {last_values}, local_balance, samples)
+            SELECT bucket, chan_id, {last_values}, local_balance, samples FROM (
+                SELECT timestamp / {bucket} * {bucket} AS bucket, chan_id, MAX(timestamp), {last_values},
+                       SUM(local_balance * samples) / SUM(samples) AS local_balance, SUM(samples) AS samples
+                FROM {table}
+                WHERE timestamp >= ? AND timestamp < ?
+                GROUP BY chan_id, bucket
+            )
+        """, (start, end))
+        rolled += cursor.rowcount
+    return rolled
+
+def prune(conn, level, now):
+    # Whole months past the retention are dropped; only the boundary month needs a DELETE.
+    retention_days = RETENTION_DAYS[level]
+    if retention_days <= 0:
+        return
+    cutoff = now - retention_days * 86400
+    prefix = f"channel_snapshots_{level}_"
+    for table in list_partitions(conn, level, until=cutoff):
+        if month_end(table[len(prefix):]) <= cutoff:
+            conn.execute(f"DROP TABLE {table}")
+        else:
+            conn.execute(f"DELETE FROM {table} WHERE timestamp < ?", (cutoff,))
+
+def maintain_snapshots(conn, now=None):
+    now = int(now or time.time())
+    with conn:
+        rollup(conn, 'raw', 'hourly', now)
+        rollup(conn, 'hourly', 'daily', now)
+        for level in LEVELS:
+            prune(conn, level, now)
+
+def pick_level(since, now=None):
+    # The finest level that still covers the whole range.
+    now = now or time.time()
+    for level in LEVELS:
+        retention_days = RETENTION_DAYS[level]
+        if retention_days <= 0 or since >= now - retention_days * 86400:
+            return level
+    return 'daily'
+
+def get_channel_trend(conn, chan_id, since, level=None, columns=COLUMNS):
+    level = level or pick_level(since)
+    return [dict(zip(('timestamp', 'chan_id') + tuple(columns), row))
+            for row in iter_snapshots(conn, level, since, chan_ids=[chan_id], columns=columns)]
@@ -4,11 +4,14 @@ import os
 import time
 import subprocess
 import requests
-import json
 import configparser
 import sqlite3
 import logging
 
+from db import get_db, get_lndg_db
+from exclusions import load_exclusions
+from lnd_client import get_client, LndError
+
 script_dir = os.path.dirname(os.path.abspath(__file__))
 logs_dir = os.path.abspath(os.path.join(script_dir, '..', 'logs'))
 
@@ -32,8 +35,6 @@ def expand_path(path):
         return os.path.join(os.path.expanduser("~"), path)
     return os.path.expanduser(path)
 
-LNDG_DB_PATH = expand_path(config['Paths']['lndg_db_path'])
-DB_PATH = expand_path(config['Paths']['db_path'])
 BOS_PATH = expand_path(config['Paths']['bos_path'])
 EXCLUSION_FILE_PATH = expand_path(config['Paths']['excluded_peers_path'])
 STRIKE_API_KEY = config['Swap_out']['strike_api_key']
@@ -49,12 +50,10 @@ MIN_STRIKE_WITHDRAWAL = int(config['Swap_out']['min_strike_withdrawal'])
 PERIOD = int(config['Get_channels_data']['PERIOD'])
 
 def connect_lndg_db():
-    return sqlite3.connect(LNDG_DB_PATH, timeout=30)
+    return get_lndg_db()
 
 def connect_db():
-    conn = sqlite3.connect(DB_PATH, timeout=30)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_db(row_factory=sqlite3.Row)
 
 def create_table_if_not_exists():
     conn = connect_db()
@@ -70,6 +69,7 @@ def create_table_if_not_exists():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_strike_onchain_withdrawals_state ON strike_onchain_withdrawals (state)")
     conn.commit()
     conn.close()
 
@@ -119,16 +119,13 @@ def get_pending_quote_amounts():
         total_pending_amount += int(float(quote["amount"]) * 100_000_000)
     return total_pending_amount
 
-def is_excluded(pubkey, exclusion_list):
-    return pubkey in [entry['pubkey'] for entry in exclusion_list]
-
 def get_onchain_balance():
-    result = subprocess.run(['lncli', 'listunspent'], capture_output=True, text=True)
-    if result.returncode == 0:
-        utxos = json.loads(result.stdout).get("utxos", [])
-        total_onchain = sum(int(utxo["amount_sat"]) for utxo in utxos)
-        return total_onchain
-    return 0
+    try:
+        utxos = get_client().list_unspent()
+    except LndError as e:
+        logging.error(f"Error listing unspent outputs: {e}")
+        return 0
+    return sum(int(utxo["amount_sat"]) for utxo in utxos)
 
 def get_payment_status(payment_id):
     url = f"https://api.strike.me/v1/payments/{payment_id}"
@@ -222,11 +219,11 @@ def send_payment_via_bos(ln_address, amount, fee_rate, peer_pubkey, alias):
         return False, needed_fee
 
 def create_invoice(amount_sats):
-    result = subprocess.run(['lncli', 'addinvoice', '--amt', str(amount_sats)], capture_output=True, text=True)
-    if result.returncode == 0:
-        invoice_data = json.loads(result.stdout)
-        return invoice_data['payment_request']
-    return None
+    try:
+        return get_client().add_invoice(amount_sats)['payment_request']
+    except LndError as e:
+        logging.error(f"Error creating invoice: {e}")
+        return None
 
 def get_strike_balance():
     headers = {
@@ -303,17 +300,11 @@ def execute_payment_quote(payment_quote_id):
 
 def generate_new_btc_address():
     try:
-        result = subprocess.run(['lncli', 'newaddress', 'p2tr'], capture_output=True, text=True)
-        if result.returncode == 0:
-            address_data = json.loads(result.stdout)
-            address = address_data['address']
-            logging.info(f"New Taproot address generated: {address}")
-            return address
-        else:
-            logging.error(f"Error generating address: {result.stderr}")
-            return None
-    except Exception as e:
-        logging.error(f"Exception generating address: {str(e)}")
+        address = get_client().new_address('TAPROOT_PUBKEY')
+        logging.info(f"New Taproot address generated: {address}")
+        return address
+    except LndError as e:
+        logging.error(f"Error generating address: {e}")
         return None
 
 def withdraw_to_btc_address(btc_address, amount):
@@ -429,7 +420,7 @@ def process_strike_ln_withdrawal(strike_balance):
             else:
                 logging.error("Error executing Strike payment quote.")
 
-def process_bos_payments(exclusion_list):
+def process_bos_payments(exclusions):
     source_channels = get_source_channels()
     channels = [channel for channel in source_channels if channel[1] > OUTBOUND_THRESHOLD]
 
@@ -437,8 +428,8 @@ def process_bos_payments(exclusion_list):
     with concurrent.futures.ThreadPoolExecutor(max_workers=len(channels)) as executor:
         futures = {}
         for channel in channels:
-            pubkey, alias = channel[2], channel[3]
-            if is_excluded(pubkey, exclusion_list):
+            chan_id, pubkey, alias = channel[0], channel[2], channel[3]
+            if exclusions.is_excluded(pubkey, chan_id, 'source', 'swap_out'):
                 logging.info(f"Channel {alias} excluded. Skipping...")
                 continue
             futures[executor.submit(process_channel, pubkey, alias)] = alias
@@ -474,8 +465,7 @@ def main():
     while True:
         process_pending_withdrawals()
 
-        with open(EXCLUSION_FILE_PATH, 'r') as f:
-            exclusion_list = json.load(f).get('EXCLUSION_LIST', [])
+        exclusions = load_exclusions(EXCLUSION_FILE_PATH)
 
         total_balance = calculate_total_balance()
 
@@ -489,7 +479,7 @@ def main():
                 onchain_target_achieved = False
 
             check_and_withdraw_onchain()
-            process_bos_payments(exclusion_list)
+            process_bos_payments(exclusions)
 
         logging.info(f"Current balance: {total_balance} sats. Target: {ONCHAIN_TARGET} sats.")
         logging.info(f"Pausing for {CHECK_INTERVAL_SECONDS} seconds.")
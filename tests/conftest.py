@@ -0,0 +1,15 @@
+import os
+import sys
+import sqlite3
+
+import pytest
+
+# The scripts import each other as top-level modules, the way automator.py runs them.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
@@ -0,0 +1,50 @@
+import autofee_engine
+from fee_strategies import get_strategy, next_threshold_crossing
+
+NOW = 1_700_000_000
+
+def test_is_unchanged_skips_until_next_evaluation():
+    state = {'1': ('abc', NOW + 60)}
+    assert autofee_engine.is_unchanged(state, '1', 'abc', NOW)
+    assert not autofee_engine.is_unchanged(state, '1', 'abc', NOW + 60)
+
+def test_is_unchanged_requires_same_fingerprint():
+    state = {'1': ('abc', NOW + 60)}
+    assert not autofee_engine.is_unchanged(state, '1', 'def', NOW)
+    assert not autofee_engine.is_unchanged(state, '2', 'abc', NOW)
+
+def test_is_unchanged_without_next_evaluation():
+    assert not autofee_engine.is_unchanged({'1': ('abc', None)}, '1', 'abc', NOW)
+
+def test_next_threshold_crossing_picks_earliest_future_crossing():
+    strategy = get_strategy('sink', 'v1')
+    channel = {'last_rebalance': NOW - 86400, 'last_outgoing_activity': NOW - 3600}
+    # last_rebalance crosses 2 days in one day, last_outgoing_activity crosses 1 day in 23 hours.
+    assert next_threshold_crossing(strategy, channel, NOW) == NOW - 3600 + 86400
+
+def test_next_threshold_crossing_ignores_passed_and_missing_activity():
+    strategy = get_strategy('sink', 'v1')
+    channel = {'last_rebalance': NOW - 30 * 86400, 'last_outgoing_activity': None}
+    assert next_threshold_crossing(strategy, channel, NOW) is None
+    assert next_threshold_crossing(get_strategy('source', 'v1'), channel, NOW) is None
+
+def test_fingerprint_changes_with_inputs():
+    strategy = get_strategy('router', 'v1')
+    channel = {'tag': 'router', 'local_fee_rate': 100}
+    fingerprint = autofee_engine.channel_fingerprint(channel, strategy)
+    assert autofee_engine.channel_fingerprint(dict(channel), strategy) == fingerprint
+    assert autofee_engine.channel_fingerprint(dict(channel, local_fee_rate=101), strategy) != fingerprint
+
+def test_resolve_activity_timestamps_falls_back_to_text_date():
+    channel = {'chan_id': '1', 'last_outgoing_activity': '2023-11-14 22:13:20', 'last_outgoing_ts': None,
+               'last_incoming_activity': None, 'last_incoming_ts': None,
+               'last_rebalance': '2023-11-14 22:13:20', 'last_rebalance_ts': 5}
+    assert autofee_engine.resolve_activity_timestamps(channel)
+    assert isinstance(channel['last_outgoing_activity'], int)
+    assert channel['last_incoming_activity'] is None
+    assert channel['last_rebalance'] == 5
+
+def test_resolve_activity_timestamps_skips_unreadable_date():
+    channel = {'chan_id': '1', 'last_outgoing_activity': 'garbage', 'last_outgoing_ts': None,
+               'last_incoming_activity': None, 'last_incoming_ts': None, 'last_rebalance': None, 'last_rebalance_ts': None}
+    assert not autofee_engine.resolve_activity_timestamps(channel)
@@ -0,0 +1,50 @@
+import pytest
+
+import close_scoring
+
+NOW = 1_700_000_000
+DAY = 86400
+
+class NoExclusions:
+    def is_excluded(self, *args):
+        return False
+
+def channel(tag, **changes):
+    values = {
+        'chan_id': 1, 'pubkey': 'pubkey', 'alias': 'alias', 'tag': tag, 'capacity': 1_000_000, 'outbound_liquidity': 50,
+        'profit': 0, 'days_open': 400, 'total_routed_in': 0, 'total_routed_out': 0,
+        'last_incoming_activity': None, 'last_incoming_ts': None, 'last_outgoing_activity': None, 'last_outgoing_ts': None,
+    }
+    values.update(changes)
+    return values
+
+@pytest.fixture
+def thresholds(monkeypatch):
+    monkeypatch.setattr(close_scoring, 'DAYS_INACTIVE', {'source': 30, 'sink': 30, 'router': 30})
+    monkeypatch.setattr(close_scoring, 'MOVEMENT_THRESHOLD_PERC', 10)
+
+def test_inactive_days_follows_the_role():
+    source = channel('source', last_incoming_ts=NOW - 5 * DAY, last_outgoing_ts=NOW - 50 * DAY)
+    assert close_scoring.inactive_days(source, NOW) == 5
+    assert close_scoring.inactive_days(dict(source, tag='sink'), NOW) == 50
+    assert close_scoring.inactive_days(dict(source, tag='router'), NOW) == 5
+
+def test_inactive_days_without_activity_is_days_open():
+    assert close_scoring.inactive_days(channel('router'), NOW) == 400
+
+def test_inactive_days_reads_the_text_date_when_the_epoch_is_null():
+    sink = channel('sink', last_outgoing_activity='2023-11-13 22:13:20')
+    assert close_scoring.inactive_days(sink, NOW) in (0, 1)
+
+def test_unreadable_activity_is_not_eligible(thresholds):
+    router = channel('router', last_incoming_activity='garbage')
+    assert close_scoring.inactive_days(router, NOW) is None
+    candidate = close_scoring.score_channel(router, NoExclusions(), {}, NOW)
+    assert not candidate['eligible']
+    assert candidate['reason'] == 'activity date unreadable'
+
+def test_idle_channels_are_ranked_by_score(thresholds):
+    channels = [channel('router', chan_id=1, outbound_liquidity=20), channel('router', chan_id=2, outbound_liquidity=80),
+                channel('router', chan_id=3, last_outgoing_ts=NOW - DAY)]
+    ranked = close_scoring.rank_candidates(channels, NoExclusions(), now=NOW)
+    assert [(candidate['chan_id'], candidate['rank']) for candidate in ranked] == [('2', 1), ('1', 2), ('3', None)]
@@ -0,0 +1,126 @@
+import pytest
+
+import closechannel
+
+class Snapshot:
+    def __init__(self, pending=()):
+        self.pending = set(pending)
+
+    def has_pending(self, chan_id):
+        return chan_id in self.pending
+
+@pytest.fixture
+def queue(conn, monkeypatch):
+    closechannel.create_pending_closures_table(conn)
+    closechannel.create_fee_rate_history_table(conn)
+    monkeypatch.setattr(closechannel, 'get_channel_info', lambda chan_id: {'chan_point': f"{'ab' * 32}:{chan_id}"})
+    return conn
+
+def queued(conn, chan_id, **changes):
+    closechannel.queue_closure(conn, chan_id, f"pubkey{chan_id}")
+    closure = next(closure for closure in closechannel.get_pending_closures(conn) if closure['chan_id'] == chan_id)
+    if changes:
+        closechannel.update_closure(conn, closure, **changes)
+    return closure
+
+def stored_state(conn, chan_id):
+    return conn.execute("SELECT state FROM pending_closures WHERE chan_id = ?", (chan_id,)).fetchone()[0]
+
+def test_advance_closure_reaches_waiting_fee_without_htlcs(queue):
+    closure = queued(queue, '1')
+    closechannel.advance_closure(queue, closure, {'1'}, Snapshot())
+    assert stored_state(queue, '1') == closechannel.STATE_WAITING_FEE
+    assert closure['chan_point'].endswith(':1')
+
+def test_advance_closure_waits_for_pending_htlcs(queue):
+    closure = queued(queue, '1')
+    closechannel.advance_closure(queue, closure, {'1'}, Snapshot(pending={'1'}))
+    assert stored_state(queue, '1') == closechannel.STATE_WAITING_HTLCS
+    closechannel.advance_closure(queue, closure, {'1'}, Snapshot())
+    assert stored_state(queue, '1') == closechannel.STATE_WAITING_FEE
+
+def test_advance_closure_retries_when_channel_info_is_unavailable(queue, monkeypatch):
+    monkeypatch.setattr(closechannel, 'get_channel_info', lambda chan_id: None)
+    closure = queued(queue, '1')
+    closechannel.advance_closure(queue, closure, {'1'}, Snapshot())
+    assert stored_state(queue, '1') == closechannel.STATE_DISABLED
+    assert closure['last_error'] == "channel info unavailable"
+
+def test_advance_closure_drops_channels_closed_elsewhere(queue):
+    closure = queued(queue, '1')
+    closechannel.advance_closure(queue, closure, set(), Snapshot())
+    assert stored_state(queue, '1') == closechannel.STATE_CLOSED
+
+def test_advance_closure_confirms_closing_channels(queue):
+    closure = queued(queue, '1', state=closechannel.STATE_CLOSING)
+    closechannel.advance_closure(queue, closure, {'1'}, Snapshot())
+    assert stored_state(queue, '1') == closechannel.STATE_CLOSING
+    closechannel.advance_closure(queue, closure, set(), Snapshot())
+    assert stored_state(queue, '1') == closechannel.STATE_CLOSED
+
+def test_channels_to_disable_skips_closing_and_gone_channels(queue):
+    for chan_id, state in (('1', closechannel.STATE_DISABLED), ('2', closechannel.STATE_WAITING_FEE),
+                           ('3', closechannel.STATE_CLOSING), ('4', closechannel.STATE_WAITING_HTLCS)):
+        queued(queue, chan_id, state=state)
+    closures = closechannel.get_pending_closures(queue)
+    assert [closure['chan_id'] for closure in closechannel.channels_to_disable(closures, {'1', '2', '3'})] == ['1', '2']
+
+def test_exhausted_closures_are_released(queue, monkeypatch):
+    released = []
+
+    def set_channel_policies(conn, closures, failed=()):
+        released.extend(failed)
+        return list(failed)
+
+    monkeypatch.setattr(closechannel, 'max_close_attempts', 2)
+    monkeypatch.setattr(closechannel, 'get_recommended_fees', lambda: {'hourFee': 1, 'fastestFee': 2})
+    monkeypatch.setattr(closechannel, 'close_channel', lambda *args: False)
+    monkeypatch.setattr(closechannel, 'set_channel_policies', set_channel_policies)
+    queued(queue, '1', state=closechannel.STATE_WAITING_FEE, chan_point=f"{'ab' * 32}:0")
+
+    closechannel.execute_closure_plan(queue, {'1'})
+    assert stored_state(queue, '1') == closechannel.STATE_WAITING_FEE
+    closechannel.execute_closure_plan(queue, {'1'})
+    assert stored_state(queue, '1') == closechannel.STATE_FAILED
+    assert [closure['chan_id'] for closure in released] == ['1']
+    assert closechannel.get_failed_chan_ids(queue) == {'1'}
+
+NOW = 1_700_000_000
+
+@pytest.fixture
+def fee_target(monkeypatch):
+    monkeypatch.setattr(closechannel, 'max_fee_rate', 10)
+    monkeypatch.setattr(closechannel, 'max_wait_days', 14)
+
+def waiting(chan_id, days):
+    return {'chan_id': chan_id, 'queued_at': NOW - days * 86400}
+
+def test_plan_closures_closes_everything_in_a_low_fee_window(fee_target):
+    fees = {'hourFee': 4, 'fastestFee': 20}
+    plan = closechannel.plan_closures([waiting('1', 0), waiting('2', 7), waiting('3', 30)], fees, None, NOW)
+    # Longer waits bid closer to fastestFee, capped at the target.
+    assert [(closure['chan_id'], fee_rate) for closure, fee_rate in plan] == [('1', 4), ('2', 10), ('3', 10)]
+
+def test_plan_closures_waits_while_fees_are_high(fee_target):
+    plan = closechannel.plan_closures([waiting('1', 7)], {'hourFee': 30, 'fastestFee': 50}, 20, NOW)
+    assert plan == []
+
+def test_plan_closures_stops_waiting_after_max_wait_days(fee_target):
+    fees = {'hourFee': 30, 'fastestFee': 50}
+    closures = [waiting('1', 7), waiting('2', 14)]
+    assert [(closure['chan_id'], fee_rate) for closure, fee_rate in closechannel.plan_closures(closures, fees, 30, NOW)] == [('2', 30)]
+    # Fees above the usual median keep even overdue channels waiting.
+    assert closechannel.plan_closures(closures, fees, 25, NOW) == []
+
+def test_fees_are_sampled_with_an_empty_queue(queue, monkeypatch):
+    monkeypatch.setattr(closechannel, 'get_recommended_fees', lambda: {'hourFee': 5, 'fastestFee': 9})
+    closechannel.execute_closure_plan(queue, set())
+    assert closechannel.get_median_hour_fee(queue) == 5
+
+def test_candidates_are_scanned_once_per_interval(monkeypatch):
+    scans = []
+    monkeypatch.setattr(closechannel, 'monitor_and_close_channels', scans.append)
+    monkeypatch.setattr(closechannel, 'last_candidate_scan', 0)
+    closechannel.main()
+    closechannel.main()
+    assert scans == [True, False]
@@ -0,0 +1,120 @@
+import time
+import sqlite3
+from collections import namedtuple
+
+import pytest
+
+import get_closed_channels_data as closed
+from lnd_client import LndError
+
+Channel = namedtuple('Channel', 'chan_id remote_pubkey capacity local_balance alias closing_tx funding_txid')
+BLOCK_TIME_BASE = 1_600_000_000
+
+def block_time(height):
+    return BLOCK_TIME_BASE + height * 600
+
+def channel(open_height, index=0):
+    return Channel(str(open_height << 40 | index), 'pubkey', 1_000_000, 0, 'alias', None, None)
+
+class Lnd:
+    def __init__(self, close_heights):
+        self.close_heights = close_heights
+        self.lookups = []
+
+    def closed_channels(self):
+        return [{'chan_id': chan_id, 'close_height': height} for chan_id, height in self.close_heights.items()]
+
+    def get_block_time(self, height):
+        self.lookups.append(height)
+        return block_time(height)
+
+class LndDown:
+    def closed_channels(self):
+        raise LndError('unavailable')
+
+    def get_block_time(self, height):
+        raise LndError('unavailable')
+
+@pytest.fixture
+def lndg():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE gui_forwards (chan_id_in TEXT, chan_id_out TEXT, amt_in_msat INTEGER, amt_out_msat INTEGER, fee REAL)")
+    conn.execute("CREATE TABLE gui_payments (rebal_chan TEXT, fee REAL, value INTEGER)")
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def ledger(conn, monkeypatch):
+    closed.create_closed_channels_table(conn)
+    closed.create_block_times_table(conn)
+    closed.create_date_attempts_table(conn)
+    monkeypatch.setattr(closed, 'MEMPOOL_FALLBACK', False)
+    return conn
+
+def use_lnd(monkeypatch, client):
+    monkeypatch.setattr(closed, 'get_client', lambda: client)
+    return client
+
+def recorded(conn):
+    return {row['chan_id']: (row['opening_ts'], row['closure_ts'], row['days_open'])
+            for row in conn.execute("SELECT chan_id, opening_ts, closure_ts, days_open FROM closed_channels")}
+
+def test_new_channels_are_recorded_with_block_dates(ledger, lndg, monkeypatch):
+    channels = [channel(100), channel(100, 1)]
+    lnd = use_lnd(monkeypatch, Lnd({channels[0].chan_id: 244, channels[1].chan_id: 244}))
+    assert closed.update_closed_channels_db(lndg, ledger, channels) == 2
+    assert recorded(ledger)[int(channels[0].chan_id)] == (block_time(100), block_time(244), 1)
+    # Shared heights are looked up once, and cached for later runs.
+    assert sorted(lnd.lookups) == [100, 244]
+    assert closed.update_closed_channels_db(lndg, ledger, channels) == 0
+
+def test_reconcile_keeps_recorded_dates_when_lnd_is_unreachable(ledger, lndg, monkeypatch):
+    channels = [channel(100)]
+    use_lnd(monkeypatch, Lnd({channels[0].chan_id: 244}))
+    closed.update_closed_channels_db(lndg, ledger, channels)
+    lndg.execute("INSERT INTO gui_forwards VALUES ('x', ?, 0, 5000000, 50)", (channels[0].chan_id,))
+    ledger.execute("DELETE FROM block_times")
+
+    use_lnd(monkeypatch, LndDown())
+    assert closed.update_closed_channels_db(lndg, ledger, channels, replace=True) == 1
+    assert recorded(ledger)[int(channels[0].chan_id)] == (block_time(100), block_time(244), 1)
+    assert ledger.execute("SELECT total_routed_out FROM closed_channels").fetchone()[0] == 5000
+
+def test_reconcile_skips_rows_it_cannot_date(ledger, lndg, monkeypatch):
+    channels = [channel(100)]
+    use_lnd(monkeypatch, LndDown())
+    monkeypatch.setattr(closed, 'MAX_DATE_ATTEMPTS', 1)
+    closed.update_closed_channels_db(lndg, ledger, channels)
+    ledger.execute("UPDATE closed_channels SET alias = 'recorded'")
+
+    assert closed.update_closed_channels_db(lndg, ledger, channels, replace=True) == 0
+    assert ledger.execute("SELECT alias FROM closed_channels").fetchone()[0] == 'recorded'
+
+def test_unresolvable_channels_back_off_then_are_recorded_without_dates(ledger, lndg, monkeypatch):
+    channels = [channel(100)]
+    use_lnd(monkeypatch, LndDown())
+    monkeypatch.setattr(closed, 'MAX_DATE_ATTEMPTS', 2)
+
+    assert closed.update_closed_channels_db(lndg, ledger, channels) == 0
+    attempts, next_attempt = ledger.execute("SELECT attempts, next_attempt FROM closed_channel_date_attempts").fetchone()
+    assert attempts == 1 and next_attempt > time.time()
+    # Still backing off: the channel is not even looked at.
+    assert closed.update_closed_channels_db(lndg, ledger, channels) == 0
+    assert ledger.execute("SELECT attempts FROM closed_channel_date_attempts").fetchone()[0] == 1
+
+    ledger.execute("UPDATE closed_channel_date_attempts SET next_attempt = 0")
+    assert closed.update_closed_channels_db(lndg, ledger, channels) == 1
+    assert recorded(ledger)[int(channels[0].chan_id)] == (None, None, 1)
+    assert ledger.execute("SELECT COUNT(*) FROM closed_channel_date_attempts").fetchone()[0] == 0
+
+def test_block_lookups_are_bounded_per_run(ledger, lndg, monkeypatch):
+    channels = [channel(100 + i) for i in range(3)]
+    lnd = use_lnd(monkeypatch, Lnd({c.chan_id: 300 + i for i, c in enumerate(channels)}))
+    monkeypatch.setattr(closed, 'MAX_BLOCK_LOOKUPS', 4)
+
+    assert closed.update_closed_channels_db(lndg, ledger, channels) == 1
+    assert len(lnd.lookups) == 4
+    # Channels waiting on a deferred block are not counted as failed attempts.
+    assert ledger.execute("SELECT COUNT(*) FROM closed_channel_date_attempts").fetchone()[0] == 0
+    assert closed.update_closed_channels_db(lndg, ledger, channels) == 2
+    assert len(lnd.lookups) == 6
@@ -0,0 +1,71 @@
+import pytest
+
+import lnd_source
+
+OWN_PUBKEY = '02' + '11' * 32
+
+class Lnd:
+    def __init__(self, forwards=(), payments=()):
+        self.forwards = list(forwards)
+        self.payments = list(payments)
+        self.offsets = []
+
+    def forwarding_history(self, offset, limit):
+        self.offsets.append(offset)
+        events = self.forwards[offset:offset + limit]
+        return {'forwarding_events': events, 'last_offset_index': offset + len(events)}
+
+    def list_payments(self, offset, limit):
+        self.offsets.append(offset)
+        payments = [payment for payment in self.payments if int(payment['payment_index']) > offset][:limit]
+        return {'payments': payments, 'last_index_offset': int(payments[-1]['payment_index']) if payments else offset}
+
+def forward(i):
+    return {'timestamp_ns': str((1_700_000_000 + i) * 10**9), 'chan_id_in': '1', 'chan_id_out': '2',
+            'amt_in_msat': '1001000', 'amt_out_msat': '1000000', 'fee_msat': '1000'}
+
+def payment(index, status='SUCCEEDED'):
+    hops = [{'chan_id': '2', 'pub_key': '03' + '22' * 32}, {'chan_id': '1', 'pub_key': OWN_PUBKEY}]
+    return {'payment_hash': f"{index:064x}", 'creation_time_ns': str(1_700_000_000 * 10**9), 'value_msat': '100000000',
+            'fee_msat': '5000', 'status': status, 'payment_index': str(index),
+            'htlcs': [{'status': 'SUCCEEDED', 'route': {'hops': hops}}]}
+
+@pytest.fixture
+def store(conn, monkeypatch):
+    lnd_source.create_tables(conn)
+    monkeypatch.setattr(lnd_source, 'BATCH_SIZE', 2)
+    return conn
+
+def test_sync_forwards_resumes_after_the_stored_offset(store):
+    lnd = Lnd(forwards=[forward(i) for i in range(3)])
+    assert lnd_source.sync_forwards(lnd, store) == 3
+    assert lnd.offsets == [0, 2]
+    assert lnd_source.get_state(store, 'forwards_offset') == 3
+
+    lnd.forwards.append(forward(3))
+    lnd.offsets.clear()
+    assert lnd_source.sync_forwards(lnd, store) == 1
+    assert lnd.offsets == [3]
+    assert tuple(store.execute("SELECT COUNT(*), SUM(fee) FROM gui_forwards").fetchone()) == (4, 4)
+
+def test_sync_forwards_stores_local_dates(store):
+    lnd_source.sync_forwards(Lnd(forwards=[forward(0)]), store)
+    assert store.execute("SELECT forward_date FROM gui_forwards").fetchone()[0] == lnd_source.local_date(1_700_000_000 * 10**9)
+
+def test_sync_payments_restarts_at_the_oldest_in_flight_payment(store):
+    lnd = Lnd(payments=[payment(1), payment(2, status='IN_FLIGHT'), payment(3)])
+    assert lnd_source.sync_payments(lnd, store, OWN_PUBKEY) == 3
+    assert tuple(store.execute('SELECT rebal_chan, chan_out FROM gui_payments WHERE "index" = 1').fetchone()) == ('1', '2')
+
+    lnd.payments[1] = payment(2)
+    lnd.offsets.clear()
+    lnd_source.sync_payments(lnd, store, OWN_PUBKEY)
+    assert lnd.offsets[0] == 1
+    assert store.execute('SELECT COUNT(*) FROM gui_payments WHERE status = 2').fetchone()[0] == 3
+
+def test_sync_payments_continues_after_the_newest_payment(store):
+    lnd = Lnd(payments=[payment(1), payment(2)])
+    lnd_source.sync_payments(lnd, store, OWN_PUBKEY)
+    lnd.offsets.clear()
+    assert lnd_source.sync_payments(lnd, store, OWN_PUBKEY) == 0
+    assert lnd.offsets == [2]
@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+import migrations
+
+@pytest.fixture
+def legacy():
+    # A database written before user_version was used: TEXT dates only, no epoch columns, no reader indexes.
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE closed_channels (chan_id INTEGER PRIMARY KEY, opening_date TEXT, closure_date TEXT)")
+    conn.execute("""CREATE TABLE opened_channels_lifetime (chan_id TEXT PRIMARY KEY, opening_date TEXT,
+                    last_outgoing_activity TEXT, last_incoming_activity TEXT, last_rebalance TEXT)""")
+    conn.execute("CREATE TABLE pending_closures (chan_id TEXT PRIMARY KEY, state TEXT, queued_at INTEGER)")
+    yield conn
+    conn.close()
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def test_to_epoch():
+    assert migrations.to_epoch('2023-11-14 22:13:20', utc=True) == 1_700_000_000
+    assert migrations.to_epoch('2023-11-14 22:13:20+00:00') == 1_700_000_000
+    assert migrations.to_epoch(1_700_000_000.5) == 1_700_000_000
+    assert migrations.to_epoch('') is None
+    with pytest.raises(ValueError):
+        migrations.to_epoch('garbage')
+
+def test_migrate_brings_a_legacy_database_to_the_current_version(legacy):
+    legacy.execute("INSERT INTO closed_channels VALUES (1, '2023-11-14 22:13:20', '2023-11-15 22:13:20')")
+    legacy.commit()
+    migrations.migrate(legacy)
+
+    assert legacy.execute("PRAGMA user_version").fetchone()[0] == migrations.SCHEMA_VERSION
+    assert {'opening_ts', 'closure_ts'} <= columns(legacy, 'closed_channels')
+    assert {'opening_ts', 'last_outgoing_ts', 'last_incoming_ts', 'last_rebalance_ts'} <= columns(legacy, 'opened_channels_lifetime')
+    assert legacy.execute("SELECT opening_ts, closure_ts FROM closed_channels").fetchone() == (1_700_000_000, 1_700_086_400)
+    indexes = {row[0] for row in legacy.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_closed_channels_closure_ts', 'idx_pending_closures_state'} <= indexes
+
+def test_migrate_leaves_malformed_dates_null(legacy, capsys):
+    legacy.executemany("INSERT INTO closed_channels VALUES (?, ?, ?)",
+                       [(1, '2023-11-14 22:13:20', 'garbage'), (2, '', None)])
+    legacy.commit()
+    migrations.migrate(legacy)
+
+    assert legacy.execute("SELECT opening_ts, closure_ts FROM closed_channels ORDER BY chan_id").fetchall() == [(1_700_000_000, None), (None, None)]
+    assert "closed_channels.closure_date: 1 malformed dates" in capsys.readouterr().out
+
+def test_migrate_only_runs_pending_steps(legacy, monkeypatch):
+    migrations.migrate(legacy)
+    applied = []
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [(migrations.SCHEMA_VERSION + 1, applied.append)])
+    monkeypatch.setattr(migrations, 'SCHEMA_VERSION', migrations.SCHEMA_VERSION + 1)
+    migrations.migrate(legacy)
+    migrations.migrate(legacy)
+    assert applied == [legacy]
+    assert legacy.execute("PRAGMA user_version").fetchone()[0] == migrations.SCHEMA_VERSION
+
+def test_failed_migration_rolls_back(legacy, monkeypatch):
+    def broken(conn):
+        conn.execute("ALTER TABLE closed_channels ADD COLUMN half_done INTEGER")
+        raise RuntimeError('broken step')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [(1, broken)])
+    monkeypatch.setattr(migrations, 'SCHEMA_VERSION', 1)
+    with pytest.raises(RuntimeError):
+        migrations.migrate(legacy)
+    assert legacy.execute("PRAGMA user_version").fetchone()[0] == 0
+    assert 'half_done' not in columns(legacy, 'closed_channels')
+
+def test_new_tables_are_created_with_the_current_layout():
+    conn = sqlite3.connect(':memory:')
+    migrations.migrate(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == migrations.SCHEMA_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0] == 0
@@ -0,0 +1,60 @@
+import calendar
+
+import pytest
+
+import snapshots
+
+HOUR = 3600
+START = calendar.timegm((2024, 3, 10, 0, 0, 0))
+
+def row(chan_id, local_balance, revenue):
+    values = dict.fromkeys(snapshots.COLUMNS, 0)
+    values.update(capacity=1_000_000, local_balance=local_balance, revenue=revenue)
+    return (chan_id, *(values[column] for column in snapshots.COLUMNS))
+
+def stored(conn, level):
+    return [(timestamp, chan_id, local_balance, revenue) for timestamp, chan_id, local_balance, revenue
+            in snapshots.iter_snapshots(conn, level, columns=('local_balance', 'revenue'))]
+
+@pytest.fixture
+def history(conn):
+    conn.row_factory = None
+    # Three samples in the first hour and one in the second.
+    for offset, local_balance, revenue in ((0, 100, 1), (1200, 200, 2), (2400, 600, 3), (HOUR, 400, 4)):
+        snapshots.record_channel_snapshots(conn, [row(1, local_balance, revenue)], START + offset)
+    return conn
+
+def test_rollup_averages_balances_and_keeps_the_last_counters(history):
+    assert snapshots.rollup(history, 'raw', 'hourly', START + 2 * HOUR) == 2
+    assert stored(history, 'hourly') == [(START, 1, 300, 3), (START + HOUR, 1, 400, 4)]
+    samples = history.execute(f"SELECT samples FROM {snapshots.partition_name('hourly', START)} ORDER BY timestamp").fetchall()
+    assert samples == [(3,), (1,)]
+
+def test_rollup_only_takes_complete_buckets_once(history):
+    assert snapshots.rollup(history, 'raw', 'hourly', START + HOUR + 60) == 1
+    assert snapshots.rollup(history, 'raw', 'hourly', START + HOUR + 120) == 0
+    assert snapshots.rollup(history, 'raw', 'hourly', START + 2 * HOUR) == 1
+    assert [timestamp for timestamp, *_ in stored(history, 'hourly')] == [START, START + HOUR]
+
+def test_daily_rollup_weights_by_samples(history):
+    snapshots.rollup(history, 'raw', 'hourly', START + 2 * HOUR)
+    snapshots.rollup(history, 'hourly', 'daily', START + 86400)
+    assert stored(history, 'daily') == [(START, 1, 325, 4)]
+
+def test_prune_drops_whole_months_and_trims_the_boundary_month(conn, monkeypatch):
+    conn.row_factory = None
+    february = calendar.timegm((2024, 2, 20, 0, 0, 0))
+    for timestamp in (february, START, START + 5 * 86400):
+        snapshots.record_channel_snapshots(conn, [row(1, 100, 1)], timestamp)
+    monkeypatch.setitem(snapshots.RETENTION_DAYS, 'raw', 14)
+
+    snapshots.prune(conn, 'raw', START + 18 * 86400)
+    assert snapshots.list_partitions(conn, 'raw') == [snapshots.partition_name('raw', START)]
+    assert [timestamp for timestamp, *_ in stored(conn, 'raw')] == [START + 5 * 86400]
+
+def test_pick_level_uses_the_finest_level_covering_the_range(monkeypatch):
+    monkeypatch.setattr(snapshots, 'RETENTION_DAYS', {'raw': 14, 'hourly': 180, 'daily': 0})
+    now = START
+    assert snapshots.pick_level(now - 7 * 86400, now) == 'raw'
+    assert snapshots.pick_level(now - 30 * 86400, now) == 'hourly'
+    assert snapshots.pick_level(now - 365 * 86400, now) == 'daily'